@@ -0,0 +1,95 @@
+# actor.py
+"""
+Per-game command mailboxes: every game is a single-writer actor.
+
+Everything that reads or changes a game (joins, moves, resumes, heartbeat
+timeouts, retiring, snapshot captures) runs as a command submitted to the
+game's mailbox.  Commands run one at a time, in submission order, so game
+state needs no lock.
+
+There is no thread per game.  The thread (or event-loop callback) that
+submits to an idle mailbox runs the command at once and keeps draining,
+up to ``MAX_DRAIN`` commands; a submit to a busy mailbox only appends and
+returns, and the thread already draining runs it next.  A connection thread
+therefore never waits for another connection's work in the same game, and
+the asyncio engine, where nothing else runs concurrently, pays only an
+append and a pop per command.  Whatever is still queued after
+``MAX_DRAIN`` commands is handed off (to a worker thread, or a later
+event-loop callback), so a busy game cannot hold one submitter forever.
+
+A command that submits to another game's idle mailbox doesn't run it
+inline: the submit is deferred until the current command returns and its
+held sends (``Server._batched``) are flushed, and the mailbox stays marked
+busy meanwhile.  Otherwise the nested command's frames would wait in the
+outer command's batch while the other game's next command, run by some
+other thread, flushed newer frames ahead of them.
+"""
+
+import threading, time, traceback
+from collections import deque
+
+MAX_DRAIN = 64  # commands one submitter runs before handing the rest off
+
+# per thread: mailboxes submitted to from inside a running command, to drain after it
+_local = threading.local()
+
+
+def _in_thread(drain):
+    threading.Thread(target=drain, daemon=True).start()
+
+
+class Mailbox:
+    __slots__ = ("_queue", "_lock", "_running", "_wait", "_deferred", "_handoff")
+
+    def __init__(self, wait_histogram=None, deferred_counter=None, handoff=None):
+        self._queue = deque()  # (submitted_at, fn, args)
+        self._lock = threading.Lock()  # guards _queue and _running only; never held while a command runs
+        self._running = False
+        self._wait = wait_histogram  # time from submit to run
+        self._deferred = deferred_counter  # submits that found another thread draining
+        self._handoff = handoff or _in_thread  # called with a drain to run the rest of a long queue elsewhere
+
+    def submit(self, fn, *args):
+        """Queues ``fn(*args)``; runs it, and whatever arrives meanwhile, now unless another thread is draining."""
+        with self._lock:
+            self._queue.append((time.perf_counter(), fn, args))
+            if self._running:
+                if self._deferred is not None:
+                    self._deferred.value += 1
+                return
+            self._running = True
+        nested = getattr(_local, "nested", None)
+        if nested is not None:
+            nested.append(self)  # inside another command: drained once it returns
+            return
+        self._run()
+
+    def _run(self):
+        _local.nested = nested = []
+        try:
+            self._drain()
+            while nested:
+                nested.pop(0)._drain()
+        finally:
+            _local.nested = None
+
+    def _drain(self):
+        queue, lock, wait = self._queue, self._lock, self._wait
+        for _ in range(MAX_DRAIN):
+            with lock:
+                if not queue:
+                    self._running = False
+                    return
+                submitted, fn, args = queue.popleft()
+            if wait is not None:
+                wait.observe(time.perf_counter() - submitted)
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+        with lock:
+            if not queue:
+                self._running = False
+                return
+        # still marked running, so later submits keep queueing behind the rest
+        self._handoff(self._run)
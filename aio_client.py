@@ -0,0 +1,338 @@
+# aio_client.py
+"""
+asyncio client library for bots, tests and integrations.
+
+A ``Session`` is one player's connection.  ``join``, ``queue``, ``resume``
+and ``move`` are awaitable and return the server's answer (or raise
+``ServerError``); state updates reach ``on_state`` callbacks and any
+``async for state in session.updates()`` loop as soon as they arrive, with
+GAME_DELTAs already applied.  ``move`` retries with the same ``msg_id``
+after a dropped connection or a missing reply, reconnecting and RESUMEing
+first; the server's dedupe answers a move it already applied with the
+original MOVE_OK instead of applying it twice.  Joining another game on an
+open session reconnects when a sharded server answers WRONG_SHARD.
+
+Sessions on one event loop share a single heartbeat task, so a process
+running thousands of bots spends one timer on PINGs, not a thread each.
+Frames are JSON unless a session is created with ``binary=True``.
+
+    async def bot():
+        session = Session("p1")
+        await session.join("G-1")
+        while await session.wait_turn():
+            x, y = pick(session.state)
+            await session.move(x, y)
+        await session.close()
+"""
+
+import asyncio, uuid, weakref
+from collections import deque
+
+from wire import envelope, apply_delta, async_recv_obj, frame_parts, Codec, BINARY_VERSION
+
+HOST, PORT = "127.0.0.1", 12345
+HEARTBEAT_INTERVAL = 10
+REPLY_TIMEOUT = 5.0  # seconds to wait for an answer before a move is retried
+MOVE_ATTEMPTS = 3
+
+
+class ServerError(Exception):
+    """An ERROR answered to a request; ``code`` is the server's error code."""
+
+    def __init__(self, code, message=""):
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+
+
+class Heartbeat:
+    """One timer PINGing every registered session each ``interval`` seconds."""
+
+    def __init__(self, interval=HEARTBEAT_INTERVAL):
+        self.interval = interval
+        self.sessions = set()
+        self._task = None
+
+    def add(self, session):
+        self.sessions.add(session)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def discard(self, session):
+        self.sessions.discard(session)
+        if not self.sessions and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            for session in list(self.sessions):
+                session.ping()
+
+
+_heartbeats = weakref.WeakKeyDictionary()  # event loop -> its shared Heartbeat
+
+
+def shared_heartbeat():
+    loop = asyncio.get_running_loop()
+    heartbeat = _heartbeats.get(loop)
+    if heartbeat is None:
+        heartbeat = _heartbeats[loop] = Heartbeat()
+    return heartbeat
+
+
+class Session:
+    """One player's connection; at most one request (join/queue/resume/move) in flight at a time."""
+
+    def __init__(self, player_id, host=HOST, port=PORT, game_id=None, on_state=None, on_error=None,
+                 heartbeat=None, reply_timeout=REPLY_TIMEOUT, binary=False):
+        self.player_id = player_id
+        self.binary = binary  # ask for the compact binary codec (see wire.py)
+        self.host = host
+        self.port = port
+        self.game_id = game_id
+        self.reply_timeout = reply_timeout
+        self.state = None  # latest full state
+        self.result = None  # GAME_OVER payload once the game ends
+        self.on_state = [on_state] if on_state else []  # fn(session, state)
+        self.on_error = on_error  # fn(session, code, message) for ERRORs nobody awaited
+        self._heartbeat = heartbeat
+        self._writer = None
+        self._reader_task = None
+        self._codec = None
+        self._pending = deque()  # (kind, future) awaiting a reply, oldest first
+        self._subscribers = []  # queues behind updates() iterators
+        self._changed = asyncio.Event()
+
+    @property
+    def connected(self):
+        return self._writer is not None
+
+    @property
+    def my_turn(self):
+        st = self.state
+        return bool(st) and st["status"] == "IN_PROGRESS" and st.get("next_player_id") == self.player_id
+
+    # --- requests ---
+
+    async def connect(self):
+        reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self._codec = Codec()  # switches to binary once the server answers in it
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+        if self._heartbeat is None:
+            self._heartbeat = shared_heartbeat()
+        self._heartbeat.add(self)
+
+    async def join(self, game_id=None, nickname="", vs_bot=False, board_size=None, win_length=None):
+        """Joins (or creates) ``game_id``; returns the first state the server sends."""
+        if game_id is not None:
+            self.game_id = game_id
+        payload = {"player_id": self.player_id, "nickname": nickname}
+        if vs_bot:
+            payload["vs_bot"] = True
+        if board_size:
+            payload["board_size"] = board_size
+        if win_length:
+            payload["win_length"] = win_length
+        return await self._request("state", envelope("PLAYER_JOINED", self.game_id, payload))
+
+    async def queue(self, board_size=None, win_length=None, rating=None):
+        """Waits in the matchmaking lobby; returns the MATCHED payload (``game_id`` is adopted)."""
+        payload = {"player_id": self.player_id}
+        for key, value in (("board_size", board_size), ("win_length", win_length), ("rating", rating)):
+            if value is not None:
+                payload[key] = value
+        # no timeout: waiting for an opponent can take arbitrarily long
+        return await self._request("match", envelope("QUEUE", self.game_id, payload), timeout=None)
+
+    async def resume(self):
+        """Reattaches to the current game, reconnecting first if needed; returns the caught-up state."""
+        if not self.connected:
+            await self.connect()
+        payload = {"player_id": self.player_id}
+        if self.state:
+            payload["known_version"] = self.state["version"]
+        return await self._request("state", envelope("RESUME", self.game_id, payload))
+
+    async def move(self, x, y, msg_id=None):
+        """Plays (x, y); returns the MOVE_OK payload or raises ``ServerError``."""
+        move = {"player_id": self.player_id, "x": x, "y": y, "msg_id": msg_id or str(uuid.uuid4())}
+        if self.state:
+            move["turn"] = self.state["turn"]
+        env = envelope("MOVE", self.game_id, move)
+        for attempt in range(MOVE_ATTEMPTS):
+            try:
+                if attempt:
+                    # a fresh connection guarantees no late reply to the lost attempt is still on its way
+                    await self._drop()
+                    await self.resume()
+                return await self._request("ack", env)
+            except (ConnectionError, asyncio.TimeoutError):
+                if attempt == MOVE_ATTEMPTS - 1:
+                    raise
+
+    async def wait_turn(self):
+        """Waits until it is this player's turn; returns False once the game is over."""
+        while True:
+            if self.my_turn:
+                return True
+            if self.state and self.state["status"] == "GAME_OVER":
+                return False
+            if not self.connected:
+                raise ConnectionError("session is not connected")
+            await self._changed.wait()
+
+    def updates(self):
+        """Async iterator over every new state, ending after the final one or on close."""
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)  # subscribed now, so nothing between this call and the loop is missed
+        return self._iterate(queue)
+
+    def ping(self):
+        if self._writer is not None:
+            self._send(envelope("PING", self.game_id, {}))
+
+    async def close(self):
+        await self._drop()
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    # --- internals ---
+
+    async def _request(self, kind, env, timeout=...):
+        try:
+            return await self._request_once(kind, env, timeout)
+        except ServerError as exc:
+            if exc.code != "WRONG_SHARD":
+                raise
+            # a sharded server routes a connection by its first game; a fresh one reaches this game's worker
+            await self._drop()
+            return await self._request_once(kind, env, timeout)
+
+    async def _request_once(self, kind, env, timeout):
+        if not self.connected:
+            await self.connect()
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((kind, fut))
+        self._send(env)
+        try:
+            return await asyncio.wait_for(fut, self.reply_timeout if timeout is ... else timeout)
+        finally:
+            if (kind, fut) in self._pending:
+                self._pending.remove((kind, fut))
+
+    def _send(self, env):
+        if self.binary:
+            env["version"] = BINARY_VERSION
+        self._writer.writelines(frame_parts(env, self._codec))
+
+    async def _drop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.discard(self)
+        writer, self._writer = self._writer, None
+        if self._reader_task:
+            self._reader_task.cancel()
+            self._reader_task = None
+        self._fail_pending(ConnectionError("connection closed"))
+        if writer:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    def _fail_pending(self, exc):
+        while self._pending:
+            _, fut = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(exc)
+        self._notify()
+
+    def _reply(self, kind, value):
+        # replies arrive in request order, so only the oldest pending request can be answered
+        if self._pending and (kind is None or self._pending[0][0] == kind):
+            _, fut = self._pending.popleft()
+            if not fut.done():
+                if isinstance(value, Exception):
+                    fut.set_exception(value)
+                else:
+                    fut.set_result(value)
+            return True
+        return False
+
+    def _set_state(self, state):
+        self.state = state
+        for fn in self.on_state:
+            fn(self, state)
+        finished = state["status"] == "GAME_OVER"
+        for queue in self._subscribers:
+            queue.put_nowait(state)
+            if finished:
+                queue.put_nowait(None)
+        self._notify()
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _iterate(self, queue):
+        try:
+            while True:
+                state = await queue.get()
+                if state is None:
+                    return
+                yield state
+        finally:
+            self._subscribers.remove(queue)
+
+    async def _read_loop(self, reader):
+        try:
+            while True:
+                msg = await async_recv_obj(reader, self._codec)
+                if msg is None:
+                    break
+                self._on_message(msg["type"], msg.get("payload", {}))
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        if self._reader_task is asyncio.current_task():
+            # the server went away; requests in flight fail so move() can reconnect and retry
+            self._heartbeat.discard(self)
+            self._writer, self._reader_task = None, None
+            self._fail_pending(ConnectionError("connection lost"))
+
+    def _on_message(self, t, p):
+        if t == "GAME_STATE":
+            # ignore a stale state that raced a newer one
+            if self.state is None or p.get("version", 0) >= self.state.get("version", 0):
+                self._set_state(p)
+            # answers a join or a resume; deltas and GAME_OVER never do
+            self._reply("state", self.state)
+        elif t == "GAME_DELTA":
+            new = apply_delta(self.state, p)
+            if new is None:
+                # missed an update: ask for the full authoritative state
+                payload = {"player_id": self.player_id}
+                if self.state:
+                    payload["known_version"] = self.state["version"]
+                self._send(envelope("RESUME", self.game_id, payload))
+            elif new is not self.state:
+                self._set_state(new)
+        elif t == "GAME_OVER":
+            self.result = p
+            self._set_state(p["final_state"])
+        elif t == "RESUMED":
+            # the missed moves (if any) came just before as GAME_DELTAs
+            self._reply("state", self.state)
+        elif t == "MOVE_OK":
+            self._reply("ack", p)
+        elif t == "MATCHED":
+            self.game_id = p["game_id"]
+            self._reply("match", p)
+        elif t == "ERROR":
+            if p["code"] == "VERSION_AHEAD":
+                # the server lost moves we saw; its full state follows and answers the resume
+                self.state = None
+                return
+            if not self._reply(None, ServerError(p["code"], p.get("message", ""))) and self.on_error:
+                self.on_error(self, p["code"], p.get("message", ""))
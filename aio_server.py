@@ -0,0 +1,100 @@
+# aio_server.py
+"""
+asyncio engine for the tic-tac-toe server.
+
+Runs the same protocol as ``server.Server`` (PLAYER_JOINED, RESUME, MOVE,
+PING) but holds every connection on one event loop instead of one OS thread
+per socket, so a large number of mostly idle clients costs a small stream
+object each rather than a thread stack.  Message handling is shared with the
+threaded engine through ``Server.dispatch``; only the transport hooks differ.
+
+    python server.py async
+"""
+
+import asyncio
+
+from server import Server
+from wire import async_recv_obj, Codec
+from outbox import AsyncOutbox
+from metrics import serve_text
+
+
+class AsyncServer(Server):
+    """Server whose connections are asyncio StreamWriters."""
+
+    def start(self):
+        asyncio.run(self.serve())
+
+    async def serve(self, listen=True):
+        self.loop = asyncio.get_running_loop()
+        self.mailbox_handoff = self.loop.call_soon_threadsafe
+        if self.journal:
+            self.recover()
+        if self.metrics_port:
+            serve_text(self.metrics, self.host, self.metrics_port)
+        self._start_sweeps()
+        monitor = asyncio.create_task(self._run_timers())
+        self.feed.wake = lambda: self.loop.call_soon_threadsafe(self.feed.drain)
+        self.ready.set()
+        try:
+            if not listen:
+                # connections arrive through adopt() only (shard workers)
+                await asyncio.Event().wait()
+            server = await asyncio.start_server(self._handle_stream, self.host, self.port)
+            print(f"Server listening on {self.host}:{self.port} (asyncio)")
+            async with server:
+                await server.serve_forever()
+        finally:
+            monitor.cancel()
+
+    def adopt(self, conn, addr, initial=b""):
+        # may be called from any thread once self.ready is set
+        asyncio.run_coroutine_threadsafe(self._adopt(conn, initial), self.loop)
+
+    async def _adopt(self, conn, initial):
+        # feed the already-read bytes before the transport starts reading the socket
+        reader = asyncio.StreamReader()
+        reader.feed_data(initial)
+        protocol = asyncio.StreamReaderProtocol(reader)
+        transport, _ = await self.loop.connect_accepted_socket(lambda: protocol, sock=conn)
+        writer = asyncio.StreamWriter(transport, protocol, reader, self.loop)
+        await self._handle_stream(reader, writer)
+
+    async def _handle_stream(self, reader, writer):
+        self.m_connections.value += 1
+        codec = self.codecs[writer] = Codec()
+        outbox = self.outboxes[writer] = AsyncOutbox(writer, codec.encode_parts)
+        outbox.clock = self.timers.clock
+        outbox.on_backlog = lambda: self._watch_outbox(writer, outbox)
+        try:
+            while True:
+                msg = await async_recv_obj(reader, codec)
+                if msg is None:
+                    break
+                self.dispatch(writer, msg)
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._on_disconnect(writer)
+            writer.close()
+
+    def _peer_host(self, writer):
+        peer = writer.get_extra_info("peername")
+        return peer[0] if peer else None
+
+    async def _run_timers(self):
+        # Liveness timers run on the loop so callbacks may touch StreamWriters directly
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        self.timers.on_wake = lambda: loop.call_soon_threadsafe(wake.set)
+        while True:
+            wake.clear()
+            delay = self.timers.run_due()
+            try:
+                await asyncio.wait_for(wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- transport hooks ---
+    def _close(self, conn):
+        conn.close()
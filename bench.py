@@ -0,0 +1,270 @@
+# bench.py
+"""
+Micro-benchmarks for the code on every message path: envelope building,
+framing and the codecs, socket send/recv, GameState move handling and
+serialization, the dedupe store and the solver.
+
+Each case is timed with ``timeit`` (autoranged loop, best of ``--repeat``)
+and reported as nanoseconds per call.  Results can be written as JSON and
+compared against a stored baseline; a case slower than the baseline by more
+than ``--threshold`` fails the run.  Baselines are machine specific, so
+save one on the machine that compares against it.
+
+    python bench.py                                   # print results
+    python bench.py --save-baseline bench-base.json   # record a baseline
+    python bench.py --baseline bench-base.json        # exit 1 on regressions
+    python bench.py -k wire --json out.json           # subset, machine-readable
+"""
+
+import argparse, itertools, json, platform, socket, sys, timeit
+
+from wire import (envelope, decode_payload, send_obj, send_frames, recv_obj, apply_delta, Codec, Interner,
+                  FrameReader, SharedFrame)
+from server import GameState
+from dedupe import DedupeStore
+from solver import get_solver
+
+REGRESSION_THRESHOLD = 0.20  # fractional slowdown that fails a comparison
+CASES = {}
+
+
+def case(name):
+    """Registers ``setup`` under ``name``; setup returns the zero-arg callable to time."""
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def _game(size=3, win_length=3):
+    gs = GameState(size, win_length)
+    gs.try_join("p1")
+    gs.try_join("p2")
+    return gs
+
+
+def _state_env(size=3):
+    gs = _game(size, 3)
+    for x, y in ((0, 0), (1, 1), (2, 0)):
+        gs.apply_move(gs.next_player_id, x, y)
+        gs.version += 1
+    return envelope("GAME_STATE", "G-1", gs.serialize())
+
+
+@case("wire.envelope")
+def _():
+    payload = {"player_id": "p1", "x": 1, "y": 2, "msg_id": "m"}
+    return lambda: envelope("MOVE", "G-1", payload)
+
+
+def _move_env():
+    return envelope("MOVE", "G-1", {"player_id": "p1", "x": 1, "y": 2, "turn": 3, "msg_id": envelope("", "", {})["id"]})
+
+
+def _delta_env():
+    return envelope("GAME_DELTA", "G-1", {"last_move": {"player_id": "p2", "x": 2, "y": 2, "symbol": "O"},
+                                          "version": 5, "turn": 5, "next_player_id": "p1", "status": "IN_PROGRESS"})
+
+
+def _encode(binary, make_env=_state_env):
+    env = make_env()
+    codec = Codec(binary=binary, interner=Interner())
+    return lambda: codec.encode(env)
+
+
+case("wire.encode.json.state")(lambda: _encode(False))
+case("wire.encode.binary.state")(lambda: _encode(True))
+case("wire.encode.binary.state15")(lambda: _encode(True, lambda: _state_env(15)))
+# the per-move messages have fixed binary layouts (see wire._pack_fast)
+case("wire.encode.json.move")(lambda: _encode(False, _move_env))
+case("wire.encode.binary.move")(lambda: _encode(True, _move_env))
+case("wire.encode.json.delta")(lambda: _encode(False, _delta_env))
+case("wire.encode.binary.delta")(lambda: _encode(True, _delta_env))
+
+
+def _decode(binary, make_env=_state_env):
+    env = make_env()
+    out, into = Codec(binary=binary, interner=Interner()), Codec()
+    # steady state: a connection's refs were defined by its earlier frames
+    decode_payload(out.encode(env)[4:], into)
+    payload = out.encode(env)[4:]
+    return lambda: decode_payload(payload, into)
+
+
+case("wire.decode.json.state")(lambda: _decode(False))
+case("wire.decode.binary.state")(lambda: _decode(True))
+case("wire.decode.json.move")(lambda: _decode(False, _move_env))
+case("wire.decode.binary.move")(lambda: _decode(True, _move_env))
+case("wire.decode.json.delta")(lambda: _decode(False, _delta_env))
+case("wire.decode.binary.delta")(lambda: _decode(True, _delta_env))
+
+
+@case("wire.shared_frame.binary")
+def _():
+    # encoding one SharedFrame for many recipients: only the first encode per frame packs the body
+    env = _state_env()
+    codecs = [Codec(binary=True) for _ in range(8)]
+
+    def run():
+        frame = SharedFrame(env)
+        for codec in codecs:
+            codec.encode(frame)
+    return run
+
+
+def _roundtrip(binary):
+    a, b = socket.socketpair()
+    send_codec, recv_codec = Codec(binary=binary, interner=Interner()), Codec()
+    env = envelope("MOVE", "G-1", {"player_id": "p1", "x": 1, "y": 2, "turn": 3, "msg_id": "m-1"})
+
+    def run():
+        send_obj(a, env, send_codec)
+        recv_obj(b, recv_codec)
+    return run
+
+
+case("wire.send_recv.json")(lambda: _roundtrip(False))
+case("wire.send_recv.binary")(lambda: _roundtrip(True))
+
+
+@case("wire.send_frames.binary")
+def _():
+    # a move's MOVE_OK plus its GAME_DELTA: one sendmsg per batch
+    a, b = socket.socketpair()
+    send_codec, frames = Codec(binary=True, interner=Interner()), iter(FrameReader(b, Codec()))
+    batch = [envelope("MOVE_OK", "G-1", {"version": 4, "msg_id": "m-1"}), SharedFrame(_state_env())]
+
+    def run():
+        send_frames(a, batch, send_codec)
+        next(frames)
+        next(frames)
+    return run
+
+
+@case("wire.apply_delta")
+def _():
+    state = _state_env()["payload"]
+    delta = {"last_move": {"player_id": "p2", "x": 2, "y": 2, "symbol": "O"}, "version": state["version"] + 1,
+             "turn": state["turn"] + 1, "next_player_id": "p1", "status": "IN_PROGRESS"}
+    return lambda: apply_delta(state, delta)
+
+
+@case("game.validate_move")
+def _():
+    gs = _game()
+    return lambda: gs.validate_move("p1", 1, 1, 0)
+
+
+def _apply(size, win_length):
+    gs = _game(size, win_length)
+    c = size // 2
+
+    def run():
+        gs.x_bits = gs.o_bits = gs.turn = 0
+        gs.status = "IN_PROGRESS"
+        gs.next_player_id = "p1"
+        gs.apply_move("p1", c, c)
+    return run
+
+
+case("game.apply_move")(lambda: _apply(3, 3))
+case("game.apply_move.15x15k5")(lambda: _apply(15, 5))
+
+
+def _serialize(size):
+    gs = _game(size, 3)
+    return gs.serialize
+
+
+case("game.serialize")(lambda: _serialize(3))
+case("game.serialize.15x15")(lambda: _serialize(15))
+
+
+@case("dedupe.put")
+def _():
+    store = DedupeStore()
+    ack = envelope("MOVE_OK", "G-1", {"version": 1})
+    keys = [("G-1", "p1", f"m-{i}") for i in range(1024)]
+    n = itertools.count()
+    return lambda: store.put(keys[next(n) & 1023], ack)
+
+
+@case("dedupe.get")
+def _():
+    store = DedupeStore()
+    ack = envelope("MOVE_OK", "G-1", {"version": 1})
+    for i in range(1024):
+        store.put(("G-1", "p1", f"m-{i}"), ack)
+    key = ("G-1", "p1", "m-512")
+    return lambda: store.get(key)
+
+
+@case("solver.best_move")
+def _():
+    solver = get_solver()
+    return lambda: solver.best_move(0b000010001, 0b000000100)
+
+
+def measure(setup, repeat):
+    fn = setup()
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number * 1e9
+
+
+def run(selected, repeat):
+    results = {}
+    for name in selected:
+        results[name] = round(measure(CASES[name], repeat), 1)
+        print(f"{name:32s} {results[name]:12.1f} ns")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Returns the names of cases slower than the baseline by more than ``threshold``."""
+    regressions = []
+    for name, ns in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        change = ns / base - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:32s} {base:12.1f} -> {ns:12.1f} ns  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("-k", dest="pattern", help="only cases whose name contains this")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--json", metavar="PATH", help="write results here")
+    ap.add_argument("--baseline", metavar="PATH", help="compare against this results file")
+    ap.add_argument("--save-baseline", metavar="PATH", help="write results as a new baseline")
+    ap.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    opts = ap.parse_args(argv)
+    selected = [n for n in CASES if not opts.pattern or opts.pattern in n]
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results_ns": run(selected, opts.repeat),
+    }
+    for path in (opts.json, opts.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    if opts.baseline:
+        with open(opts.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results_ns"]
+        print()
+        regressions = compare(report["results_ns"], baseline, opts.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {opts.threshold:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
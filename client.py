@@ -1,105 +1,80 @@
 # client.py
-import socket, threading, json, time, uuid
-from wire import send_obj, recv_obj, envelope
+"""
+Terminal client: a thin shell over ``aio_client.Session`` that renders each
+state as it arrives and prompts for a move only when it is this player's turn.
+"""
+
+import asyncio
+
+from aio_client import Session, ServerError
 
 HOST, PORT = "127.0.0.1", 12345
 GAME_ID = "G-1"
-HEARTBEAT_INTERVAL = 10
 
 
 class Client:
-    def __init__(self, player_id, nickname="", host: str = HOST, port: int = PORT, resume: bool = False):
+    def __init__(self, player_id, nickname="", host: str = HOST, port: int = PORT, resume: bool = False,
+                 game_id: str = GAME_ID, vs_bot: bool = False, board_size: int = None, win_length: int = None,
+                 matchmaking: bool = False):
         self.player_id = player_id
         self.nickname = nickname
-        self.host = host
-        self.port = port
         self.resume = resume
-        self.state = None  # last GAME_STATE
-        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._running = True
+        self.vs_bot = vs_bot  # ask the server to seat its solver as the opponent
+        # board options, only honoured if this join creates the game
+        self.board_size, self.win_length = board_size, win_length
+        self.matchmaking = matchmaking  # QUEUE for an opponent; game_id is assigned by MATCHED
+        self.session = Session(player_id, host, port, game_id=game_id, on_state=self._on_state,
+                               on_error=self._on_error)
+
+    @property
+    def state(self):
+        return self.session.state
 
     def start(self):
         """Connects to the server and enters the main input loop."""
-        # Connect to specified host/port
-        self.sock.connect((self.host, self.port))
-        # If we are resuming an existing session, send RESUME with known_version
-        if self.resume:
-            known_version = None
-            if self.state and isinstance(self.state, dict):
-                known_version = self.state.get("version")
-            resume_payload = {"player_id": self.player_id}
-            if known_version is not None:
-                resume_payload["known_version"] = known_version
-            msg = envelope("RESUME", GAME_ID, resume_payload)
-            send_obj(self.sock, msg)
-        else:
-            # Join fresh game
-            join = envelope("PLAYER_JOINED", GAME_ID, {
-                "player_id": self.player_id,
-                "nickname": self.nickname,
-            })
-            send_obj(self.sock, join)
-        # Listen thread
-        threading.Thread(target=self._listen, daemon=True).start()
-        # Heartbeat thread
-        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
-        # Input loop
-        while self._running:
-            if self.state and self.state.get("status") == "IN_PROGRESS" and \
-                    self.state.get("next_player_id") == self.player_id:
-                try:
-                    raw = input("Your turn (x y): ").strip()
-                    x, y = map(int, raw.split())
-                    msg_id = str(uuid.uuid4())
-                    move = envelope("MOVE", GAME_ID, {
-                        "player_id": self.player_id,
-                        "x": x,
-                        "y": y,
-                        "turn": self.state.get("turn"),
-                        "msg_id": msg_id,
-                    })
-                    send_obj(self.sock, move)
-                except Exception:
-                    print("Invalid input. Use: 0 2")
-            else:
-                time.sleep(0.1)
+        try:
+            asyncio.run(self.run())
+        except (ConnectionError, KeyboardInterrupt):
+            pass
+        print("Disconnected.")
 
-    def _heartbeat_loop(self):
-        while self._running:
+    async def run(self):
+        session = self.session
+        try:
+            if self.resume:
+                await session.resume()
+            elif self.matchmaking:
+                print("Waiting for an opponent...")
+                m = await session.queue(self.board_size, self.win_length)
+                print(f"Matched with {m['opponent']} in {m['game_id']}, playing {m['symbol']}")
+            else:
+                await session.join(nickname=self.nickname, vs_bot=self.vs_bot, board_size=self.board_size,
+                                   win_length=self.win_length)
+        except ServerError as e:
+            print(f"ERROR {e.code}: {e.message}")
+        loop = asyncio.get_running_loop()
+        while await session.wait_turn():
+            raw = await loop.run_in_executor(None, input, "Your turn (x y): ")
+            try:
+                x, y = map(int, raw.split())
+            except ValueError:
+                print("Invalid input. Use: 0 2")
+                continue
             try:
-                send_obj(self.sock, envelope("PING", GAME_ID, {}))
-            except Exception:
-                pass
-            time.sleep(HEARTBEAT_INTERVAL)
+                ack = await session.move(x, y)
+                print(f"Move acknowledged (version={ack.get('version')})")
+            except ServerError as e:
+                print(f"ERROR {e.code}: {e.message}")
+        result = session.result
+        if result:
+            print(f"GAME OVER: {result['result']}, line={result['winning_line']}")
+        await session.close()
 
-    def _listen(self):
-        while True:
-            msg = recv_obj(self.sock)
-            if msg is None:
-                print("Disconnected.")
-                break
-            t, p = msg["type"], msg["payload"]
-            if t == "GAME_STATE":
-                # Use version to ensure we don't regress state
-                if self.state is None or p.get("version", 0) >= self.state.get("version", 0):
-                    self.state = p
-                    self._render(p)
-                else:
-                    # Ignored stale state
-                    pass
-            elif t == "GAME_OVER":
-                self.state = p["final_state"]
-                self._render(self.state)
-                print(f"GAME OVER: {p['result']}, line={p['winning_line']}")
-            elif t == "ERROR":
-                print(f"ERROR {p['code']}: {p['message']}")
-            elif t == "PONG":
-                # heartbeat reply
-                pass
-            elif t == "MOVE_OK":
-                print(f"Move acknowledged (version={p.get('version')})")
-            else:
-                print("Unknown message:", t)
+    def _on_state(self, session, st):
+        self._render(st)
+
+    def _on_error(self, session, code, message):
+        print(f"ERROR {code}: {message}")
 
     def _render(self, st):
         b = st["board"]
@@ -117,9 +92,17 @@ if __name__ == "__main__":
     #   python client.py p1                # connect as player p1 to default localhost:12345
     #   python client.py p2 192.168.0.10   # connect as p2 to host 192.168.0.10 on default port 12345
     #   python client.py p1 192.168.0.10 5555 resume  # resume previous session to host:port
+    #   python client.py p1 bot            # single-player game against the server's solver
+    #   python client.py p1 queue          # matchmaking: paired with the next waiting player
     import sys
     # Extract command-line args
     args = sys.argv[1:]
+    vs_bot = "bot" in args
+    if vs_bot:
+        args.remove("bot")
+    matchmaking = "queue" in args
+    if matchmaking:
+        args.remove("queue")
     pid = args[0] if len(args) >= 1 else "p1"
     host = args[1] if len(args) >= 2 else HOST
     # If the second argument looks like a port (numeric), treat accordingly
@@ -143,5 +126,6 @@ if __name__ == "__main__":
             host = HOST
             resume = True
     # Create and start client
-    client = Client(pid, host=host, port=port, resume=resume)
+    client = Client(pid, host=host, port=port, resume=resume, game_id=f"bot-{pid}" if vs_bot else GAME_ID,
+                    vs_bot=vs_bot, matchmaking=matchmaking)
     client.start()
@@ -0,0 +1,114 @@
+# dedupe.py
+"""
+Expiring msg_id -> outcome store backing policy 4 (duplicate handling).
+
+Entries are kept in one OrderedDict in insertion order.  The window is the
+same for every entry, so insertion order is also expiry order and purging
+only ever pops from the head: O(expired) per call, O(1) amortized per
+insert.  A global entry and byte cap bounds memory regardless of how many
+players come and go; the oldest entries are evicted first.  Entries are
+also indexed by game so a retired game's can be dropped at once.
+"""
+
+import threading, time
+from collections import OrderedDict
+
+DEDUPE_WINDOW_MINUTES = 5
+DEDUPE_MAX_ENTRIES = 200_000
+DEDUPE_MAX_BYTES = 64 * 1024 * 1024
+# rough per-entry cost of the key tuple, value tuple, OrderedDict node and per-game index slot
+ENTRY_OVERHEAD = 350
+
+
+class DedupeStore:
+    """Thread-safe, time-ordered replay cache keyed by (game_id, player_id, msg_id)."""
+
+    def __init__(self, window=DEDUPE_WINDOW_MINUTES * 60, max_entries=DEDUPE_MAX_ENTRIES,
+                 max_bytes=DEDUPE_MAX_BYTES, clock=time.time):
+        self.window = window
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, env, size)
+        self._by_game = {}  # game_id -> set of its keys in _entries
+        self._lock = threading.Lock()
+        self.bytes = 0
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the stored outcome envelope for a repeated msg_id, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, env):
+        now = self.clock()
+        size = ENTRY_OVERHEAD + sum(len(k) for k in key if isinstance(k, str)) + len(str(env.get("payload")))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (now + self.window, env, size)
+            self._by_game.setdefault(key[0], set()).add(key)
+            self.bytes += size
+            self._purge(now)
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                dropped_key, (_, _, dropped) = self._entries.popitem(last=False)
+                self._unindex(dropped_key)
+                self.bytes -= dropped
+                self.evictions += 1
+
+    def discard_game(self, game_id):
+        """Drops every entry of ``game_id``; returns how many there were."""
+        with self._lock:
+            keys = self._by_game.pop(game_id, ())
+            for key in keys:
+                self.bytes -= self._entries.pop(key)[2]
+            return len(keys)
+
+    def purge(self):
+        """Drops expired entries; cheap enough to call from a background sweep."""
+        with self._lock:
+            return self._purge(self.clock())
+
+    def _purge(self, now):
+        entries = self._entries
+        n = 0
+        while entries:
+            key, entry = next(iter(entries.items()))
+            if entry[0] > now:
+                break
+            del entries[key]
+            self._unindex(key)
+            self.bytes -= entry[2]
+            n += 1
+        self.expired += n
+        return n
+
+    def _unindex(self, key):
+        keys = self._by_game.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_game[key[0]]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
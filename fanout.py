@@ -0,0 +1,51 @@
+# fanout.py
+"""
+Spectator fan-out, kept off the players' path.
+
+Game commands publish a game's newest frame, which is just a dict store.
+A single drainer delivers it to that game's spectators later, after the
+players' frames are already queued and outside any game command.
+Publishing again before the drainer runs replaces the pending frame, so a
+burst of moves costs one delivery of the latest state.  Each spectator's
+own outbox then coalesces any GAME_STATEs it hasn't sent yet, so a slow
+viewer is always behind by at most one state and never pushes back on the
+game.
+"""
+
+import threading
+
+
+class SpectatorFeed:
+    def __init__(self, deliver):
+        self._deliver = deliver  # deliver(game, frame)
+        self._pending = {}  # game -> latest frame not yet delivered
+        self._cond = threading.Condition()
+        # set by the asyncio engine to schedule drain() on its loop; otherwise run_forever's thread is notified
+        self.wake = None
+        # counters
+        self.published = 0
+        self.delivered = 0
+
+    def publish(self, game, frame):
+        with self._cond:
+            first = not self._pending
+            self._pending[game] = frame
+            self.published += 1
+            if first and self.wake is None:
+                self._cond.notify()
+        if first and self.wake:
+            self.wake()
+
+    def drain(self):
+        with self._cond:
+            batch, self._pending = self._pending, {}
+        for game, frame in batch.items():
+            self._deliver(game, frame)
+        self.delivered += len(batch)
+
+    def run_forever(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            self.drain()
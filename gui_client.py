@@ -3,10 +3,17 @@ A simple Tkinter-based GUI client for the Tic-Tac-Toe network game.  This
 module builds upon the existing networking logic defined in ``wire.py`` and
 the client/server architecture.  It establishes a connection to the server,
 listens for game-state updates on a background thread and allows the local
-player to make moves by clicking cells in a 3×3 grid.  A heartbeat thread
+player to make moves by clicking cells in a grid sized to the game's board.  A heartbeat thread
 keeps the connection alive.  Basic status feedback (whose turn it is, game
 over messages) is displayed within the window.
 
+Incoming states only record the newest state and request a redraw; at most
+one redraw is pending on the Tk thread at a time, so a burst of updates
+(e.g. after a RESUME) renders once.  A redraw diffs against what the
+widgets last showed and reconfigures only the cells that changed, which
+keeps large boards responsive.  ``render_stats()`` reports redraw counts
+and timings.
+
 Usage examples:
 
     # connect as player p1 to the default localhost:12345
@@ -31,7 +38,8 @@ import sys
 import tkinter as tk
 from tkinter import messagebox
 
-from wire import send_obj, recv_obj, envelope
+from wire import send_obj, envelope, apply_delta, Codec, FrameReader
+from metrics import Histogram
 
 
 HOST, PORT = "127.0.0.1", 12345
@@ -42,14 +50,26 @@ HEARTBEAT_INTERVAL = 10
 class GUIClient:
     """GUI wrapper around the network client logic."""
 
-    def __init__(self, player_id: str, nickname: str = "", host: str = HOST, port: int = PORT, resume: bool = False):
+    def __init__(self, player_id: str, nickname: str = "", host: str = HOST, port: int = PORT, resume: bool = False,
+                 game_id: str = GAME_ID):
         self.player_id = player_id
+        self.game_id = game_id
         self.nickname = nickname
         self.host = host
         self.port = port
         self.resume = resume
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.codec = Codec()  # switches to binary once the server answers in it
+        self._send_lock = threading.Lock()  # keep codec definitions and socket writes in order
         self.state = None  # latest GAME_STATE dict
+        # render bookkeeping: Tk thread only, except _redraw_pending which is guarded by self._lock
+        self._redraw_pending = False
+        self._shown = []  # [row][col] -> (text, state) each button currently displays
+        self._shown_status = None
+        self.redraws = 0  # redraws actually run
+        self.coalesced = 0  # redraw requests absorbed by one already pending
+        self.cells_updated = 0  # buttons reconfigured across all redraws
+        self.redraw_seconds = Histogram()
         self.root = tk.Tk()
         self.root.title(f"Tic‑Tac‑Toe: {self.player_id}")
         # Build the GUI elements
@@ -59,20 +79,30 @@ class GUIClient:
         self._lock = threading.Lock()
 
     def _build_widgets(self):
-        """Constructs the Tkinter widgets: a status label and 3×3 grid."""
+        """Constructs the Tkinter widgets: a status label and the (initially 3×3) grid."""
         self.status_var = tk.StringVar(value="Connecting…")
         status_label = tk.Label(self.root, textvariable=self.status_var, font=("Arial", 14))
         status_label.pack(pady=10)
-        # Frame for the 3×3 grid
-        grid_frame = tk.Frame(self.root)
-        grid_frame.pack(padx=10, pady=10)
+        self.grid_frame = tk.Frame(self.root)
+        self.grid_frame.pack(padx=10, pady=10)
         self.buttons = []  # matrix of buttons [row][col]
-        for y in range(3):
+        self._build_grid(3)
+
+    def _build_grid(self, size: int):
+        """(Re)creates a size×size grid of cell buttons; the server picks the size per game."""
+        for row_buttons in self.buttons:
+            for btn in row_buttons:
+                btn.destroy()
+        self.buttons = []
+        self._shown = [[None] * size for _ in range(size)]
+        # shrink cells on big boards so a 15×15 room still fits on screen
+        font_size, pad = (20, 5) if size <= 5 else (10, 1)
+        for y in range(size):
             row_buttons = []
-            for x in range(3):
-                btn = tk.Button(grid_frame, text="", width=4, height=2,
-                                 font=("Arial", 20), command=lambda r=y, c=x: self._on_cell_click(r, c))
-                btn.grid(row=y, column=x, padx=5, pady=5)
+            for x in range(size):
+                btn = tk.Button(self.grid_frame, text="", width=2 if size > 5 else 4, height=1 if size > 5 else 2,
+                                font=("Arial", font_size), command=lambda r=y, c=x: self._on_cell_click(r, c))
+                btn.grid(row=y, column=x, padx=pad, pady=pad)
                 row_buttons.append(btn)
             self.buttons.append(row_buttons)
 
@@ -91,11 +121,11 @@ class GUIClient:
             payload = {"player_id": self.player_id}
             if known_version is not None:
                 payload["known_version"] = known_version
-            msg = envelope("RESUME", GAME_ID, payload)
-            send_obj(self.sock, msg)
+            msg = envelope("RESUME", self.game_id, payload)
+            self._send(msg)
         else:
-            join = envelope("PLAYER_JOINED", GAME_ID, {"player_id": self.player_id, "nickname": self.nickname})
-            send_obj(self.sock, join)
+            join = envelope("PLAYER_JOINED", self.game_id, {"player_id": self.player_id, "nickname": self.nickname})
+            self._send(join)
         # Launch background network listener and heartbeat threads
         threading.Thread(target=self._listen_loop, daemon=True).start()
         threading.Thread(target=self._heartbeat_loop, daemon=True).start()
@@ -118,7 +148,7 @@ class GUIClient:
                 return
             # Construct and send a MOVE
             msg_id = str(uuid.uuid4())
-            move = envelope("MOVE", GAME_ID, {
+            move = envelope("MOVE", self.game_id, {
                 "player_id": self.player_id,
                 "x": col,
                 "y": row,
@@ -126,31 +156,30 @@ class GUIClient:
                 "msg_id": msg_id,
             })
             try:
-                send_obj(self.sock, move)
+                self._send(move)
             except Exception as exc:
                 # Connection might be down
                 self.status_var.set(f"Send failed: {exc}")
 
     def _listen_loop(self):
         """Continuously receive messages from the server and update the GUI state."""
-        while self._running:
-            msg = recv_obj(self.sock)
-            if msg is None:
-                # Server closed connection
-                self._running = False
-                self._schedule(lambda: messagebox.showwarning("Disconnected", "Server closed the connection."))
-                break
+        for msg in FrameReader(self.sock, self.codec):
+            if not self._running:
+                return
             mtype = msg.get("type")
             payload = msg.get("payload", {})
-            if mtype == "GAME_STATE":
-                self._handle_game_state(payload)
+            if mtype in ("GAME_STATE", "GAME_DELTA"):
+                self._handle_game_state(payload, delta=mtype == "GAME_DELTA")
             elif mtype == "GAME_OVER":
                 self._handle_game_over(payload)
+            elif mtype == "ERROR" and payload.get("code") == "VERSION_AHEAD":
+                with self._lock:
+                    self.state = None  # the server lost moves after a crash; its full state follows
             elif mtype == "ERROR":
                 code, message = payload.get("code"), payload.get("message")
                 self._schedule(lambda c=code, m=message: messagebox.showerror(f"Error {c}", m))
-            elif mtype == "PONG":
-                # ignore
+            elif mtype in ("PONG", "RESUMED"):
+                # ignore; a RESUME's missed moves arrive as GAME_DELTAs
                 pass
             elif mtype == "MOVE_OK":
                 # We could update board optimistically; server will also send GAME_STATE
@@ -158,14 +187,33 @@ class GUIClient:
             else:
                 # Unknown type – ignore or log
                 self._schedule(lambda t=mtype: messagebox.showinfo("Unknown", f"Unknown message type: {t}"))
+        if self._running:
+            # Server closed connection
+            self._running = False
+            self._schedule(lambda: messagebox.showwarning("Disconnected", "Server closed the connection."))
 
-    def _handle_game_state(self, st: dict):
-        """Handles incoming GAME_STATE, updating local state and UI."""
+    def _handle_game_state(self, st: dict, delta: bool = False):
+        """Handles incoming GAME_STATE or GAME_DELTA, updating local state and UI."""
         with self._lock:
+            if delta:
+                new = apply_delta(self.state, st)
+                if new is None:
+                    # Version gap: fall back to a full RESUME
+                    self._resync()
+                    return
+                if new is self.state:
+                    return
+                st = new
             if self.state is None or st.get("version", 0) >= self.state.get("version", 0):
                 self.state = st
-                # Schedule UI update in the Tk thread
-                self._schedule(self._update_board_and_status)
+                self._request_redraw()
+
+    def _resync(self):
+        """Requests the full authoritative state after detecting a version gap."""
+        payload = {"player_id": self.player_id}
+        if self.state:
+            payload["known_version"] = self.state.get("version")
+        self._send(envelope("RESUME", self.game_id, payload))
 
     def _handle_game_over(self, payload: dict):
         """Handles GAME_OVER message, updating state and notifying the user."""
@@ -174,45 +222,78 @@ class GUIClient:
         winning_line = payload.get("winning_line")
         with self._lock:
             self.state = final_state
-            self._schedule(self._update_board_and_status)
+            self._request_redraw()
         msg = f"Result: {result}"
         if winning_line:
             msg += f"\nWinning line: {winning_line}"
         self._schedule(lambda m=msg: messagebox.showinfo("Game Over", m))
 
-    def _update_board_and_status(self):
-        """Updates the GUI's board buttons and status label from self.state."""
-        st = self.state
+    def _request_redraw(self):
+        """Queues a redraw of the latest state unless one is already pending; caller holds self._lock."""
+        if self._redraw_pending:
+            self.coalesced += 1
+            return
+        self._redraw_pending = True
+        self._schedule(self._redraw)
+
+    def _redraw(self):
+        with self._lock:
+            self._redraw_pending = False
+            st = self.state  # states are replaced, never mutated, so this one stays consistent
+        t0 = time.perf_counter()
+        self._update_board_and_status(st)
+        self.redraw_seconds.observe(time.perf_counter() - t0)
+        self.redraws += 1
+
+    def _update_board_and_status(self, st):
+        """Brings the board buttons and status label in line with ``st``, touching only what changed."""
         if not st:
             return
         board = st.get("board")
-        # Update each button's label and disable filled cells
+        if len(board) != len(self.buttons):
+            self._build_grid(len(board))
+        my_turn = st.get("status") == "IN_PROGRESS" and st.get("next_player_id") == self.player_id
         for y, row in enumerate(board):
+            shown = self._shown[y]
             for x, cell in enumerate(row):
-                btn = self.buttons[y][x]
-                btn.config(text=cell if cell is not None else "")
-                if cell is not None or st.get("status") != "IN_PROGRESS" or st.get("next_player_id") != self.player_id:
-                    btn.config(state=tk.DISABLED)
-                else:
-                    btn.config(state=tk.NORMAL)
-        # Update status text
+                # only empty cells are clickable, and only on our turn
+                view = ("", tk.NORMAL if my_turn else tk.DISABLED) if cell is None else (cell, tk.DISABLED)
+                if shown[x] != view:
+                    self.buttons[y][x].config(text=view[0], state=view[1])
+                    shown[x] = view
+                    self.cells_updated += 1
         status = st.get("status")
         if status == "IN_PROGRESS":
-            next_pid = st.get("next_player_id")
-            if next_pid == self.player_id:
-                self.status_var.set("Your turn")
-            else:
-                self.status_var.set(f"Waiting for {next_pid}")
+            text = "Your turn" if my_turn else f"Waiting for {st.get('next_player_id')}"
         elif status == "WAITING":
-            self.status_var.set("Waiting for opponent…")
+            text = "Waiting for opponent…"
         elif status == "GAME_OVER":
-            self.status_var.set("Game over")
+            text = "Game over"
+        else:
+            text = self._shown_status
+        if text != self._shown_status:
+            self.status_var.set(text)
+            self._shown_status = text
+
+    def render_stats(self):
+        """Redraw counters and timing, e.g. to check a big board or spectator view keeps up."""
+        return {
+            "redraws": self.redraws,
+            "coalesced": self.coalesced,
+            "cells_updated": self.cells_updated,
+            "redraw_seconds": self.redraw_seconds.snapshot(),
+        }
+
+    def _send(self, env):
+        """Encodes and writes one envelope; safe to call from any thread."""
+        with self._send_lock:
+            send_obj(self.sock, env, self.codec)
 
     def _heartbeat_loop(self):
         """Periodically send PING messages to keep the connection alive."""
         while self._running:
             try:
-                send_obj(self.sock, envelope("PING", GAME_ID, {}))
+                self._send(envelope("PING", self.game_id, {}))
             except Exception:
                 # ignore errors – the listener will handle disconnection
                 pass
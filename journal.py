@@ -0,0 +1,152 @@
+# journal.py
+"""
+Durable journal of joins and accepted moves, with periodic snapshots.
+
+Game commands call ``append`` (a deque push), in order per game; a
+writer thread drains everything queued since its last pass, writes it as
+JSON lines and fsyncs once per batch (group commit), so the hot path never
+waits on the disk.  A move is durable within one commit cycle of its
+MOVE_OK, not before it.
+
+The log is split into numbered segments.  ``begin_snapshot`` rotates to a
+new segment; the caller then captures every game and ``write_snapshot``
+persists the capture atomically and deletes the segments it covers.  Each
+game's snapshot carries the seq of the last record applied to it, so
+records that landed in the new segment before that game was captured are
+skipped on replay.  Recovery is: load snapshot, replay remaining segments.
+"""
+
+import glob, json, os, threading
+from collections import deque
+
+SNAPSHOT_INTERVAL = 60  # seconds between snapshots
+SNAPSHOT_FILE = "snapshot.json"
+SEGMENT_GLOB = "journal-*.log"
+
+_ROTATE = object()
+
+
+class Journal:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._segment = max(self._segments(), default=0) + 1
+        self._file = None
+        self._active = self._segment  # segment the writer is appending to
+        self._rotated = threading.Condition()
+        # counters
+        self.records = 0
+        self.commits = 0
+        self.snapshots = 0
+
+    # --- recovery ---
+    def load(self):
+        """Returns (snapshot games dict, list of journal records after it) and resumes seq numbering."""
+        games = {}
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                snap = json.load(f)
+            games = snap["games"]
+            self._seq = snap["seq"]
+        records = []
+        for n in sorted(self._segments()):
+            with open(self._segment_path(n), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # torn write at the tail of a crashed segment
+                    records.append(rec)
+                    self._seq = max(self._seq, rec["seq"])
+        return games, records
+
+    # --- writing ---
+    def start(self):
+        self._file = open(self._segment_path(self._segment), "a", encoding="utf-8")
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def append(self, record):
+        """Queues a record and returns its seq; called from the game's command, so records stay in order."""
+        with self._cond:
+            self._seq += 1
+            record["seq"] = self._seq
+            self._queue.append(record)
+            self._cond.notify()
+        return self._seq
+
+    def begin_snapshot(self):
+        """Rotates to a new segment; returns the first segment number not covered by the coming snapshot."""
+        with self._cond:
+            self._segment += 1
+            self._queue.append(_ROTATE)
+            self._cond.notify()
+            return self._segment
+
+    def write_snapshot(self, games, keep_from):
+        """Persists a capture atomically, then drops segments older than ``keep_from``."""
+        with self._rotated:
+            # never delete the segment the writer still has open
+            while self._active < keep_from:
+                self._rotated.wait()
+        path = os.path.join(self.directory, SNAPSHOT_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": max((g["seq"] for g in games.values()), default=self._seq), "games": games}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._fsync_dir()
+        for n in self._segments():
+            if n < keep_from:
+                os.remove(self._segment_path(n))
+        self.snapshots += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                batch = list(self._queue)
+                self._queue.clear()
+            lines = []
+            for item in batch:
+                if item is _ROTATE:
+                    self._flush(lines)
+                    lines = []
+                    self._file.close()
+                    self._file = open(self._segment_path(self._active + 1), "a", encoding="utf-8")
+                    with self._rotated:
+                        self._active += 1
+                        self._rotated.notify_all()
+                else:
+                    lines.append(json.dumps(item, separators=(",", ":")))
+                    self.records += 1
+            self._flush(lines)
+            self.commits += 1
+
+    def _flush(self, lines):
+        if lines:
+            self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _segments(self):
+        return [int(os.path.basename(p)[len("journal-"):-len(".log")])
+                for p in glob.glob(os.path.join(self.directory, SEGMENT_GLOB))]
+
+    def _segment_path(self, n):
+        return os.path.join(self.directory, f"journal-{n:08d}.log")
+
+    def _fsync_dir(self):
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
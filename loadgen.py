@@ -0,0 +1,274 @@
+# loadgen.py
+"""
+Headless load generator: many simulated players on one asyncio loop.
+
+Each game slot connects two players to a running server, joins a fresh
+game, and plays random legal moves until the game ends, then starts over
+with a new game_id until the run's duration is up.  Along the way it
+retries some moves with the same ``msg_id`` (the reply must be the original
+MOVE_OK) and drops and RESUMEs some connections mid-game.
+
+Reported per run: moves/s, games/s, and p50/p95/p99 latency of
+MOVE -> MOVE_OK (mover's ack) and MOVE -> GAME_STATE (the first state
+update carrying the new version reaching the mover and the opponent).
+
+    python server.py async &
+    python loadgen.py --games 500 --duration 30
+    python loadgen.py --games 50 --json results.json --codec binary
+"""
+
+import argparse, asyncio, json, random, sys, time, uuid
+
+from wire import envelope, apply_delta, async_recv_obj, encode_frame, Codec, BINARY_VERSION
+
+HOST, PORT = "127.0.0.1", 12345
+CONNECT_CONCURRENCY = 100  # connects in flight at once; keeps the listen backlog from overflowing
+REPLY_TIMEOUT = 10
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    i = min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[i]
+
+
+class Stats:
+    def __init__(self):
+        self.move_ok = []  # seconds, MOVE -> MOVE_OK
+        self.move_state = []  # seconds, MOVE -> GAME_STATE/GAME_DELTA/GAME_OVER at the new version
+        self.moves = 0
+        self.games = 0
+        self.resumes = 0
+        self.resumes_full = 0  # answered with a full GAME_STATE rather than just the missed deltas
+        self.dup_retries = 0
+        self.dup_mismatches = 0
+        self.resyncs = 0
+        self.errors = {}
+        self.elapsed = 0.0
+
+    def error(self, code):
+        self.errors[code] = self.errors.get(code, 0) + 1
+
+    def report(self):
+        def summary(samples):
+            s = sorted(samples)
+            return {f"p{p}": None if not s else round(percentile(s, p) * 1000, 3) for p in (50, 95, 99)}
+        elapsed = self.elapsed or 1e-9
+        return {
+            "elapsed_s": round(self.elapsed, 3),
+            "moves": self.moves,
+            "games": self.games,
+            "moves_per_s": round(self.moves / elapsed, 1),
+            "games_per_s": round(self.games / elapsed, 2),
+            "move_ok_ms": summary(self.move_ok),
+            "move_state_ms": summary(self.move_state),
+            "resumes": self.resumes,
+            "resumes_full": self.resumes_full,
+            "dup_retries": self.dup_retries,
+            "dup_mismatches": self.dup_mismatches,
+            "resyncs": self.resyncs,
+            "errors": self.errors,
+        }
+
+
+class Player:
+    """One simulated connection: tracks the game state and hands replies to the driver."""
+
+    def __init__(self, player_id, game_id, opts, stats):
+        self.player_id = player_id
+        self.game_id = game_id
+        self.opts = opts
+        self.stats = stats
+        self.state = None
+        self.replies = None  # MOVE_OK / ERROR in arrival order
+        self._waiters = []  # (version, future)
+        self._reader_task = None
+        self.writer = None
+        self.resumed = None  # future set when the server answers a RESUME
+
+    async def connect(self, limiter):
+        async with limiter:
+            reader, self.writer = await asyncio.open_connection(self.opts.host, self.opts.port)
+        self.codec = Codec()
+        self.replies = asyncio.Queue()
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+
+    def send(self, env):
+        if self.opts.codec == "binary":
+            env["version"] = BINARY_VERSION  # opt into the binary codec instead of the JSON default
+        self.writer.write(encode_frame(env, self.codec))
+
+    async def join(self, limiter, **options):
+        await self.connect(limiter)
+        self.send(envelope("PLAYER_JOINED", self.game_id, dict(options, player_id=self.player_id)))
+
+    async def resume(self, limiter):
+        """Drops the connection and reattaches with RESUME, as a client would after a network blip."""
+        await self.close()
+        await self.connect(limiter)
+        payload = {"player_id": self.player_id}
+        if self.state:
+            payload["known_version"] = self.state["version"]
+        self.resumed = asyncio.get_running_loop().create_future()
+        self.send(envelope("RESUME", self.game_id, payload))
+        self.stats.resumes += 1
+
+    async def close(self):
+        if self._reader_task:
+            self._reader_task.cancel()
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @property
+    def version(self):
+        return self.state["version"] if self.state else -1
+
+    def wait_version(self, version):
+        fut = asyncio.get_running_loop().create_future()
+        if self.version >= version:
+            fut.set_result(None)
+        else:
+            self._waiters.append((version, fut))
+        return fut
+
+    def _set_state(self, state):
+        self.state = state
+        ready = [w for w in self._waiters if w[0] <= state["version"]]
+        self._waiters = [w for w in self._waiters if w[0] > state["version"]]
+        for _, fut in ready:
+            if not fut.done():
+                fut.set_result(None)
+
+    def _answer_resume(self, full):
+        if self.resumed and not self.resumed.done():
+            self.resumed.set_result(None)
+            self.stats.resumes_full += full
+
+    async def _read_loop(self, reader):
+        while True:
+            msg = await async_recv_obj(reader, self.codec)
+            if msg is None:
+                return
+            mtype, payload = msg.get("type"), msg.get("payload", {})
+            if mtype == "GAME_STATE":
+                self._set_state(payload)
+                self._answer_resume(full=True)
+            elif mtype == "RESUMED":
+                self._answer_resume(full=False)
+            elif mtype == "GAME_DELTA":
+                new = apply_delta(self.state, payload)
+                if new is None:
+                    self.stats.resyncs += 1
+                    self.send(envelope("RESUME", self.game_id,
+                                       {"player_id": self.player_id, "known_version": self.version}))
+                elif new is not self.state:
+                    self._set_state(new)
+            elif mtype == "GAME_OVER":
+                self._set_state(payload["final_state"])
+            elif mtype == "ERROR" and payload.get("code") == "VERSION_AHEAD":
+                pass  # the server lost moves after a crash; the GAME_STATE that follows replaces ours
+            elif mtype in ("MOVE_OK", "ERROR"):
+                self.replies.put_nowait(msg)
+
+
+async def play_game(slot, n, opts, stats, limiter):
+    game_id = f"L{slot}-{n}-{uuid.uuid4().hex[:6]}"
+    board = {"board_size": opts.board_size, "win_length": opts.win_length}
+    players = [Player(f"{game_id}-a", game_id, opts, stats), Player(f"{game_id}-b", game_id, opts, stats)]
+    try:
+        await players[0].join(limiter, **board)
+        await players[0].wait_version(0)
+        await players[1].join(limiter, **board)
+        await asyncio.wait_for(_started(players), REPLY_TIMEOUT)
+        while players[0].state["status"] == "IN_PROGRESS":
+            state = players[0].state
+            mover = players[0] if state["next_player_id"] == players[0].player_id else players[1]
+            empty = [(x, y) for y, row in enumerate(state["board"]) for x, cell in enumerate(row) if cell is None]
+            x, y = random.choice(empty)
+            move = {"player_id": mover.player_id, "x": x, "y": y, "turn": state["turn"], "msg_id": str(uuid.uuid4())}
+            t0 = time.perf_counter()
+            mover.send(envelope("MOVE", game_id, move))
+            reply = await asyncio.wait_for(mover.replies.get(), REPLY_TIMEOUT)
+            if reply["type"] == "ERROR":
+                stats.error(reply["payload"]["code"])
+                return
+            stats.move_ok.append(time.perf_counter() - t0)
+            version = reply["payload"]["version"]
+            await asyncio.wait_for(asyncio.gather(*(p.wait_version(version) for p in players)), REPLY_TIMEOUT)
+            stats.move_state.append(time.perf_counter() - t0)
+            stats.moves += 1
+            if random.random() < opts.dup_rate:
+                # a retry of an applied move must replay the original outcome, not apply twice
+                mover.send(envelope("MOVE", game_id, move))
+                again = await asyncio.wait_for(mover.replies.get(), REPLY_TIMEOUT)
+                stats.dup_retries += 1
+                if again["type"] != "MOVE_OK" or again["payload"]["version"] != version:
+                    stats.dup_mismatches += 1
+            if players[0].state["status"] == "IN_PROGRESS" and random.random() < opts.resume_rate:
+                p = random.choice(players)
+                await p.resume(limiter)
+                await asyncio.wait_for(p.resumed, REPLY_TIMEOUT)
+                await asyncio.wait_for(p.wait_version(version), REPLY_TIMEOUT)
+        stats.games += 1
+    except asyncio.TimeoutError:
+        stats.error("TIMEOUT")
+    except (ConnectionError, OSError):
+        stats.error("CONNECTION")
+    finally:
+        for p in players:
+            await p.close()
+
+
+async def _started(players):
+    while not all(p.state and p.state["status"] != "WAITING" for p in players):
+        await asyncio.sleep(0.005)
+
+
+async def run(opts):
+    stats = Stats()
+    limiter = asyncio.Semaphore(CONNECT_CONCURRENCY)
+    deadline = time.perf_counter() + opts.duration
+
+    async def slot(i):
+        n = 0
+        while time.perf_counter() < deadline:
+            await play_game(i, n, opts, stats, limiter)
+            n += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(slot(i) for i in range(opts.games)))
+    stats.elapsed = time.perf_counter() - start
+    return stats.report()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--games", type=int, default=100, help="concurrent games (two connections each)")
+    ap.add_argument("--duration", type=float, default=10.0, help="seconds to keep starting new games")
+    ap.add_argument("--codec", choices=("binary", "json"), default="json")
+    ap.add_argument("--dup-rate", type=float, default=0.05, help="fraction of moves retried with the same msg_id")
+    ap.add_argument("--resume-rate", type=float, default=0.02, help="fraction of moves followed by a reconnect")
+    ap.add_argument("--board-size", type=int, default=3)
+    ap.add_argument("--win-length", type=int, default=3)
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--json", metavar="PATH", help="also write the report here")
+    opts = ap.parse_args(argv)
+    if opts.seed is not None:
+        random.seed(opts.seed)
+    report = asyncio.run(run(opts))
+    print(json.dumps(report, indent=2))
+    if opts.json:
+        with open(opts.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    return 1 if report["dup_mismatches"] or report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# matchmaking.py
+"""
+Matchmaking lobby behind the QUEUE message.
+
+Waiting players sit in FIFO buckets keyed by board variant and rating band;
+a new ticket is paired with the oldest compatible waiter at once, so the
+lobby never scans.  Each bucket is an OrderedDict (append, pop-oldest and
+cancel-by-player are all O(1)) and the lobby holds its lock only for those
+few dictionary operations; creating the game happens outside it.
+"""
+
+import threading, time
+from collections import OrderedDict
+
+RATING_BAND = 200  # players whose ratings differ by less than this may share a bucket
+
+
+class Ticket:
+    __slots__ = ("player_id", "conn", "key", "enqueued_at")
+
+    def __init__(self, player_id, conn, key, enqueued_at):
+        self.player_id = player_id
+        self.conn = conn
+        self.key = key
+        self.enqueued_at = enqueued_at
+
+
+def bucket_key(size, win_length, rating=None):
+    return size, win_length, None if rating is None else int(rating) // RATING_BAND
+
+
+class Lobby:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._buckets = {}  # key -> OrderedDict(player_id -> Ticket), oldest first
+        self._tickets = {}  # player_id -> Ticket
+        self._by_conn = {}  # conn -> player_id
+        self._lock = threading.Lock()
+        # tickets dropped because their connection closed; pairs formed are Server.m_matches
+        self.cancelled = 0
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def enqueue(self, player_id, conn, key):
+        """Queues a player; returns (waiter, newcomer) tickets when a pair forms, else None."""
+        now = self.clock()
+        with self._lock:
+            self._remove(player_id)  # re-queueing replaces the old ticket (e.g. after a reconnect)
+            bucket = self._buckets.get(key)
+            if bucket:
+                _, waiter = bucket.popitem(last=False)
+                if not bucket:
+                    del self._buckets[key]
+                del self._tickets[waiter.player_id]
+                self._by_conn.pop(waiter.conn, None)
+                return waiter, Ticket(player_id, conn, key, now)
+            ticket = Ticket(player_id, conn, key, now)
+            self._buckets.setdefault(key, OrderedDict())[player_id] = ticket
+            self._tickets[player_id] = ticket
+            self._by_conn[conn] = player_id
+            return None
+
+    def cancel_conn(self, conn):
+        """Drops the ticket queued from ``conn``, if any; called on disconnect."""
+        with self._lock:
+            player_id = self._by_conn.get(conn)
+            if player_id is not None and self._remove(player_id):
+                self.cancelled += 1
+                return True
+            return False
+
+    def _remove(self, player_id):
+        # caller holds self._lock
+        ticket = self._tickets.pop(player_id, None)
+        if ticket is None:
+            return False
+        bucket = self._buckets[ticket.key]
+        del bucket[player_id]
+        if not bucket:
+            del self._buckets[ticket.key]
+        if self._by_conn.get(ticket.conn) == player_id:
+            del self._by_conn[ticket.conn]
+        return True
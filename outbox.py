@@ -0,0 +1,231 @@
+# outbox.py
+"""
+Bounded per-connection send queues (policy 8).
+
+Handlers never write to a socket directly; they ``put`` envelopes into the
+connection's outbox and return.  A dedicated writer (a thread for the
+threaded server, a task for the asyncio one) drains the queue, so one slow
+reader can no longer stall a game or the threads waiting on its lock.
+
+Backpressure rules:
+- a queued ``GAME_STATE`` or ``GAME_DELTA`` for the same game is superseded
+  by a newer full ``GAME_STATE`` (only the latest state is ever sent);
+- when the queue is full, droppable frames (``PONG``) are discarded first,
+  then every queued ``GAME_DELTA`` is collapsed: its game is noted in
+  ``take_collapsed`` for the server to queue one current ``GAME_STATE``, and
+  that game's deltas are discarded until the state arrives; only a queue
+  with nothing to drop or collapse makes ``put`` return False, and the
+  caller treats the peer as a slow consumer;
+- the writer takes everything queued at once and writes it as one batch
+  (one ``sendmsg`` for the threaded writer), so a handler that queues a
+  MOVE_OK and a state update under ``Server._batched`` reaches the peer in
+  one write;
+- ``pending_since`` marks how long the writer has gone without draining;
+  ``on_backlog`` lets the server arm a timer and disconnect peers slower
+  than ``SLOW_CONSUMER_GRACE``.
+"""
+
+import asyncio, threading, time
+from collections import deque
+
+SEND_QUEUE_LIMIT = 64
+SLOW_CONSUMER_GRACE = 30
+# new frame type -> queued types of the same game it makes redundant
+SUPERSEDES = {"GAME_STATE": ("GAME_STATE", "GAME_DELTA")}
+DROPPABLE_TYPES = ("PONG",)
+
+
+class Outbox:
+    """Queue bookkeeping shared by the threaded and asyncio writers."""
+
+    def __init__(self, limit=SEND_QUEUE_LIMIT):
+        self.limit = limit
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self.closed = False
+        # time the oldest undelivered frame has been waiting on the writer, by ``clock``
+        self.pending_since = None
+        self.clock = time.time
+        # called (under the queue lock) when a new backlog starts; see Server._watch_outbox
+        self.on_backlog = None
+        self.watched = False
+        # game_ids whose deltas were collapsed, until their GAME_STATE is queued
+        self.resyncing = set()
+        self._collapsed = []  # of those, the ones not yet handed to the server
+        # counters
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.high_water = 0
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    @property
+    def room(self):
+        """Frames that can still be queued before ``put`` starts failing."""
+        return self.limit - len(self._queue)
+
+    def put(self, env):
+        """Queues an envelope; returns False if the peer can't keep up."""
+        return self.put_many((env,))
+
+    def put_many(self, envs):
+        """Queues envelopes in order with one wakeup of the writer; False on overflow."""
+        with self._cond:
+            if self.closed:
+                self.dropped += len(envs)
+                return True
+            ok = True
+            for env in envs:
+                kind, game_id = env.get("type"), env.get("game_id")
+                if game_id in self.resyncing:
+                    if kind == "GAME_DELTA":
+                        self.coalesced += 1  # the owed GAME_STATE will carry it
+                        continue
+                    if kind == "GAME_STATE":
+                        self.resyncing.discard(game_id)
+                stale = SUPERSEDES.get(kind)
+                if stale:
+                    self._remove_all(lambda q: q.get("type") in stale and q.get("game_id") == game_id,
+                                     counter="coalesced")
+                if len(self._queue) >= self.limit:
+                    if kind in DROPPABLE_TYPES:
+                        self.dropped += 1
+                        continue
+                    if not (self._remove_first(lambda q: q.get("type") in DROPPABLE_TYPES, counter="dropped")
+                            or self._collapse()):
+                        self.dropped += 1
+                        ok = False
+                        continue
+                self._queue.append(env)
+            self.high_water = max(self.high_water, len(self._queue))
+            if self._queue and self.pending_since is None:
+                self.pending_since = self.clock()
+                if self.on_backlog and not self.watched:
+                    self.on_backlog()
+            self._notify()
+        return ok
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self.dropped += len(self._queue)
+            self._queue.clear()
+            self._notify()
+
+    def take_collapsed(self):
+        """Game_ids whose deltas were collapsed since the last call; each is owed a GAME_STATE."""
+        with self._cond:
+            collapsed, self._collapsed = self._collapsed, []
+        return collapsed
+
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "high_water": self.high_water,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+        }
+
+    def _remove_all(self, match, counter):
+        kept = [q for q in self._queue if not match(q)]
+        removed = len(self._queue) - len(kept)
+        if removed:
+            self._queue = deque(kept)
+            setattr(self, counter, getattr(self, counter) + removed)
+
+    def _collapse(self):
+        # caller holds self._cond
+        games = {q.get("game_id") for q in self._queue if q.get("type") == "GAME_DELTA"}
+        if not games:
+            return False
+        self._remove_all(lambda q: q.get("type") == "GAME_DELTA", counter="coalesced")
+        self._collapsed += games - self.resyncing
+        self.resyncing |= games
+        return True
+
+    def _remove_first(self, match, counter):
+        for i, queued in enumerate(self._queue):
+            if match(queued):
+                del self._queue[i]
+                setattr(self, counter, getattr(self, counter) + 1)
+                return True
+        return False
+
+    def _take_all(self):
+        # caller holds self._cond
+        batch = list(self._queue)
+        self._queue.clear()
+        return batch
+
+    def _delivered(self, n):
+        with self._cond:
+            self.sent += n
+            self.pending_since = self.clock() if self._queue else None
+
+    def _notify(self):
+        self._cond.notify()
+
+
+class ThreadOutbox(Outbox):
+    """Outbox drained by its own writer thread using a blocking ``write(envs)``."""
+
+    def __init__(self, write, on_error=None, limit=SEND_QUEUE_LIMIT):
+        super().__init__(limit)
+        self._write = write
+        self._on_error = on_error
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self.closed:
+                    self._cond.wait()
+                if self.closed:
+                    return
+                batch = self._take_all()
+            try:
+                self._write(batch)
+            except Exception:
+                self.close()
+                if self._on_error:
+                    self._on_error()
+                return
+            self._delivered(len(batch))
+
+
+class AsyncOutbox(Outbox):
+    """Outbox drained by a task on the running event loop into a StreamWriter."""
+
+    def __init__(self, writer, encode_parts, limit=SEND_QUEUE_LIMIT):
+        super().__init__(limit)
+        self._writer = writer
+        self._encode_parts = encode_parts
+        self._ready = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _notify(self):
+        self._ready.set()
+
+    async def _run(self):
+        try:
+            while not self.closed:
+                await self._ready.wait()
+                self._ready.clear()
+                while True:
+                    with self._cond:
+                        batch = [] if self.closed else self._take_all()
+                    if not batch:
+                        break
+                    parts = []
+                    for env in batch:
+                        parts += self._encode_parts(env)
+                    self._writer.writelines(parts)
+                    await self._writer.drain()
+                    self._delivered(len(batch))
+        except ConnectionError:
+            self.close()
+            self._writer.close()
@@ -1,298 +1,1154 @@
 # server.py
-import socket, threading, time, uuid
-from collections import defaultdict, OrderedDict
-from wire import send_obj, recv_obj, envelope
+import contextlib, functools, socket, sys, threading, time, uuid
+from collections import OrderedDict, deque
+from wire import send_frames, envelope, Codec, FrameReader, SharedFrame, DEFAULT_INTERNER
+from outbox import ThreadOutbox, SLOW_CONSUMER_GRACE, SEND_QUEUE_LIMIT
+from dedupe import DedupeStore
+from timers import DeadlineScheduler
+from journal import Journal, SNAPSHOT_INTERVAL
+from solver import get_solver
+from metrics import Registry, serve_text, deep_sizeof, SIZE_BUCKETS
+from actor import Mailbox
+from matchmaking import Lobby, bucket_key
+from fanout import SpectatorFeed
 
 # Policies (locked)
 HOST, PORT = "127.0.0.1", 12345
-GAME_ID = "G-1"
+GAME_ID = "G-1"  # default room for clients that don't name one
 HEARTBEAT_INTERVAL = 10
-GRACE_PERIOD = 60
-DEDUPE_WINDOW_MINUTES = 5
+HEARTBEAT_TIMEOUT = 3 * HEARTBEAT_INTERVAL  # silent this long -> marked disconnected
+GRACE_PERIOD = 60  # since last seen, to reconnect before forfeiting
+BOT_PREFIX = "BOT-"  # player_id of the solver seat in single-player games
+STATS_ALLOWED_HOSTS = ("127.0.0.1", "::1")  # peers that may send the STATS admin message
+GAME_TYPES = ("PLAYER_JOINED", "SPECTATE", "RESUME", "MOVE")  # messages addressed to one game_id
+MAX_SPECTATORS = 10_000  # per game
+# recent GAME_DELTAs kept per game so a RESUME can be answered with just the missed moves;
+# well under SEND_QUEUE_LIMIT so the whole window plus RESUMED fits in a peer's outbox
+HISTORY_MOVES = SEND_QUEUE_LIMIT // 2
+FINISHED_LINGER = 30  # seconds a finished game stays live before moving to the archive
+MEMORY_REPORT_TTL = 10  # seconds one sampled memory_report serves the memory_* gauges
+ARCHIVE_GAMES = 10_000  # finished games kept (as compact records) for late RESUMEs, least recently used dropped
+
+
+# Board cells are bits y*size+x of two ints, one per symbol
+BOARD_SIZE, WIN_LENGTH = 3, 3  # defaults; a game can pick its own when created
+MAX_BOARD_SIZE = 19
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (-1, 1))  # row, col, diag, anti-diag
+
+
+@functools.lru_cache(maxsize=None)
+def win_masks(size, win_length):
+    """Per cell, the (mask, line) of every winning run through it.
+
+    Only the runs through the cell just played can have been completed by it,
+    so a move checks at most 4 * win_length masks whatever the board size.
+    """
+    by_cell = [[] for _ in range(size * size)]
+    for y in range(size):
+        for x in range(size):
+            for dx, dy in DIRECTIONS:
+                ex, ey = x + dx * (win_length - 1), y + dy * (win_length - 1)
+                if not (0 <= ex < size and 0 <= ey < size):
+                    continue
+                line = tuple((x + i * dx, y + i * dy) for i in range(win_length))
+                mask = sum(1 << (cy * size + cx) for cx, cy in line)
+                for cx, cy in line:
+                    by_cell[cy * size + cx].append((mask, line))
+    return tuple(map(tuple, by_cell))
+
+
+def check_board(size, win_length):
+    if not (isinstance(size, int) and 3 <= size <= MAX_BOARD_SIZE):
+        return False, ("BAD_BOARD", f"board_size must be in [3,{MAX_BOARD_SIZE}].")
+    if not (isinstance(win_length, int) and 3 <= win_length <= size):
+        return False, ("BAD_BOARD", "win_length must be in [3,board_size].")
+    return True, None
+
+
+class Player:
+    """A seat's fixed attributes; the two instances in SEATS are shared by every game."""
+
+    __slots__ = ("symbol", "seat")
+
+    def __init__(self, symbol, seat):
+        self.symbol = symbol
+        self.seat = seat
+
+
+SEATS = (Player("X", 0), Player("O", 1))
 
 
 class GameState:
-    def __init__(self):
-        self.board = [[None] * 3 for _ in range(3)]
-        self.players = {}  # player_id -> {"symbol": "X"/"O", "seat": 0/1, "conn": socket}
+    __slots__ = ("x_bits", "o_bits", "players", "order", "turn", "next_player_id", "status", "version", "bot",
+                 "size", "win_length", "masks")
+
+    def __init__(self, size=BOARD_SIZE, win_length=WIN_LENGTH):
+        self.size, self.win_length = size, win_length
+        self.masks = win_masks(size, win_length)  # shared by every game with these dimensions
+        self.x_bits = 0
+        self.o_bits = 0
+        self.players = {}  # player_id -> shared Player from SEATS; connections live in Game.peers
         self.order = []  # [player_id_X, player_id_O]
-        self.turn = 0
+        self.turn = 0  # also the occupied-cell count: every move fills one cell
         self.next_player_id = None
         self.status = "WAITING"  # WAITING | IN_PROGRESS | GAME_OVER
+        self.version = 0
+        self.bot = None  # player_id played by the solver, if any
+
+    @property
+    def board(self):
+        """size x size list-of-lists view (None/"X"/"O") for the wire."""
+        xb, ob, n = self.x_bits, self.o_bits, self.size
+        return [["X" if xb >> i & 1 else "O" if ob >> i & 1 else None for i in range(r * n, r * n + n)]
+                for r in range(n)]
 
     def serialize(self):
         players_list = []
         for pid in self.order:
             p = self.players[pid]
-            players_list.append({"player_id": pid, "symbol": p["symbol"], "seat": p["seat"]})
+            entry = {"player_id": pid, "symbol": p.symbol, "seat": p.seat}
+            if pid == self.bot:
+                entry["bot"] = True
+            players_list.append(entry)
         return {
             "board": self.board,
             "players": players_list,
             "next_player_id": self.next_player_id if self.status == "IN_PROGRESS" else None,
             "turn": self.turn,
             "status": self.status,
-            "version": getattr(self, "version", 0),
+            "version": self.version,
+            "win_length": self.win_length,
         }
 
     def try_join(self, player_id, nickname=None, symbol=None, seat=None):
+        if player_id == self.bot:
+            return False, ("BOT_SEAT", "That seat is played by the server.")
         if player_id in self.players:
             # Reconnect: keep existing symbol/seat; connection set by caller
             return True, None
         if len(self.players) >= 2:
             return False, ("ROOM_FULL", "Two players already joined.")
-        # Assign seats/symbols deterministically
-        if not self.players:
-            assigned = {"seat": 0, "symbol": "X"}
-        else:
-            assigned = {"seat": 1, "symbol": "O"}
-        self.players[player_id] = {"symbol": assigned["symbol"], "seat": assigned["seat"], "conn": None}
+        # Assign seats/symbols deterministically; ids are interned so every map keyed by one shares a string
+        player_id = sys.intern(player_id)
+        self.players[player_id] = SEATS[len(self.players)]
         self.order.append(player_id)
         if len(self.players) == 2:
             self.status = "IN_PROGRESS"
             self.next_player_id = self.order[0]  # X starts
         return True, None
 
+    def add_bot(self, player_id):
+        """Seats the solver in the free seat; the caller plays its turns via ``bot_move``."""
+        if (self.size, self.win_length) != (3, 3):
+            return False, ("BOT_UNAVAILABLE", "The bot only plays 3x3 games.")
+        ok, err = self.try_join(player_id)
+        if ok:
+            self.bot = player_id
+        return ok, err
+
+    def bot_move(self):
+        """Solver's (x, y) if it is the bot's turn, else None."""
+        if self.bot is None or self.status != "IN_PROGRESS" or self.next_player_id != self.bot:
+            return None
+        return get_solver().best_move(self.x_bits, self.o_bits)
+
     def validate_move(self, player_id, x, y, client_turn=None):
         if self.status != "IN_PROGRESS":
             return False, ("NOT_IN_PROGRESS", "Game not in progress.")
         if player_id != self.next_player_id:
             return False, ("NOT_YOUR_TURN", f"Expected {self.next_player_id}.")
-        if not (0 <= x <= 2 and 0 <= y <= 2):
-            return False, ("OUT_OF_BOUNDS", "x,y must be in [0,2].")
-        if self.board[y][x] is not None:
+        n = self.size
+        if not (0 <= x < n and 0 <= y < n):
+            return False, ("OUT_OF_BOUNDS", f"x,y must be in [0,{n - 1}].")
+        if (self.x_bits | self.o_bits) >> (y * n + x) & 1:
             return False, ("CELL_TAKEN", "Cell already filled.")
         if client_turn is not None and client_turn != self.turn:
             return False, ("TURN_MISMATCH", f"Server turn {self.turn}, got {client_turn}.")
         return True, None
 
     def apply_move(self, player_id, x, y):
-        symbol = self.players[player_id]["symbol"]
-        self.board[y][x] = symbol
+        symbol = self.players[player_id].symbol
+        cell = y * self.size + x
+        if symbol == "X":
+            self.x_bits |= 1 << cell
+            bits = self.x_bits
+        else:
+            self.o_bits |= 1 << cell
+            bits = self.o_bits
         self.turn += 1
         # Check win/draw
-        win_line = self._winner_line(symbol)
-        if win_line:
-            self.status = "GAME_OVER"
-            return {"result": f"{symbol}_WIN", "winning_line": win_line}
-        if all(self.board[r][c] is not None for r in range(3) for c in range(3)):
+        for mask, line in self.masks[cell]:
+            if bits & mask == mask:
+                self.status = "GAME_OVER"
+                return {"result": f"{symbol}_WIN", "winning_line": list(line)}
+        if self.turn == self.size * self.size:
             self.status = "GAME_OVER"
             return {"result": "DRAW", "winning_line": None}
         # Next player
         self.next_player_id = self.order[1] if player_id == self.order[0] else self.order[0]
         return None
 
-    def _winner_line(self, sym):
-        b = self.board
-        lines = [
-            [(0, 0), (1, 0), (2, 0)],
-            [(0, 1), (1, 1), (2, 1)],
-            [(0, 2), (1, 2), (2, 2)],  # rows
-            [(0, 0), (0, 1), (0, 2)],
-            [(1, 0), (1, 1), (1, 2)],
-            [(2, 0), (2, 1), (2, 2)],  # cols
-            [(0, 0), (1, 1), (2, 2)],
-            [(2, 0), (1, 1), (0, 2)],  # diags
-        ]
-        for line in lines:
-            if all(b[y][x] == sym for (x, y) in line):
-                return line
-        return None
+    def to_record(self):
+        """Compact, connection-free dict for journal snapshots."""
+        return {
+            "x_bits": self.x_bits,
+            "o_bits": self.o_bits,
+            "players": [[pid, self.players[pid].symbol, self.players[pid].seat] for pid in self.order],
+            "turn": self.turn,
+            "next_player_id": self.next_player_id,
+            "status": self.status,
+            "version": self.version,
+            "bot": self.bot,
+            "size": self.size,
+            "win_length": self.win_length,
+        }
 
+    @classmethod
+    def from_record(cls, rec):
+        gs = cls(rec.get("size", BOARD_SIZE), rec.get("win_length", WIN_LENGTH))
+        gs.x_bits, gs.o_bits = rec["x_bits"], rec["o_bits"]
+        for pid, symbol, seat in rec["players"]:
+            pid = sys.intern(pid)
+            gs.players[pid] = SEATS[seat]
+            gs.order.append(pid)
+        gs.turn = rec["turn"]
+        gs.next_player_id = rec["next_player_id"]
+        gs.status = rec["status"]
+        gs.version = rec["version"]
+        gs.bot = rec.get("bot")
+        return gs
 
-class Server:
-    def __init__(self):
-        self.gs = GameState()
-        self.gs.version = 0
-        self.lock = threading.Lock()  # protect gs
+    def forfeit(self, player_id):
+        """Ends an in-progress game in favour of player_id's opponent."""
+        self.status = "GAME_OVER"
+        winner = "O" if self.players[player_id].symbol == "X" else "X"
+        return {"result": f"{winner}_WIN", "winning_line": None, "reason": "FORFEIT"}
+
+
+class Game:
+    """One match: its authoritative state plus the connections attached to it."""
+
+    __slots__ = ("game_id", "gs", "mailbox", "peers", "last_seen", "watched", "spectators", "journal_seq", "last_ack",
+                 "frames", "frames_version", "history", "retired")
+
+    def __init__(self, game_id, size=BOARD_SIZE, win_length=WIN_LENGTH, mailbox=None):
+        self.game_id = game_id
+        self.gs = GameState(size, win_length)
+        # gs and the maps below are only touched by commands run through this (see actor.py)
+        self.mailbox = mailbox or Mailbox()
         # player_id -> connection socket
         self.peers = {}
-        # connection socket -> player_id for quick lookup
-        self.conn_to_pid = {}
         # player_id -> last heartbeat timestamp
         self.last_seen = {}
-        # dedupe: player_id -> OrderedDict(msg_id -> (timestamp, result_env))
-        self.dedupe = defaultdict(OrderedDict)
-        # start monitor thread
-        threading.Thread(target=self._monitor_heartbeats, daemon=True).start()
+        # player_ids with a pending liveness timer
+        self.watched = set()
+        # SPECTATE connections; fed by Server.feed, never by _broadcast
+        self.spectators = set()
+        # seq of the last journal record applied to this game
+        self.journal_seq = 0
+        # player_id -> [msg_id, version] of their last accepted move, kept in snapshots
+        self.last_ack = {}
+        # kind -> SharedFrame for the current gs.version; encoded once for all recipients
+        self.frames = {}
+        self.frames_version = -1
+        # (player_id, x, y, version, turn) of the latest moves, oldest first, consecutive versions
+        self.history = deque(maxlen=HISTORY_MOVES)
+        # set by the retire command once the game has left Server.games for the archive
+        self.retired = False
+
+    def deltas_since(self, version):
+        """Frames taking a client from ``version`` to the current one, or None if a full state is needed."""
+        # before the first move, joins change the state without bumping the version
+        if version < 1 or not self.history:
+            return None
+        first = self.history[0][3]
+        last = self.history[-1][3]
+        # the game-over move and forfeits are not deltas, so the history can fall short of the game
+        if last != self.gs.version or version < first - 1:
+            return None
+        # built only here: most games are never resumed, so the history keeps no envelopes
+        return [SharedFrame(self.delta_envelope(*move)) for move in list(self.history)[version - first + 1:]]
+
+    def delta_envelope(self, pid, x, y, version, turn):
+        # every delta is a move that left the game in progress, so the other seat plays next
+        order = self.gs.order
+        payload = {
+            "last_move": {"player_id": pid, "x": x, "y": y, "symbol": self.gs.players[pid].symbol},
+            "version": version,
+            "turn": turn,
+            "next_player_id": order[1] if pid == order[0] else order[0],
+            "status": "IN_PROGRESS",
+        }
+        return envelope("GAME_DELTA", self.game_id, payload)
+
+    def cached_frame(self, kind, build):
+        if self.frames_version != self.gs.version:
+            self.frames = {}
+            self.frames_version = self.gs.version
+        frame = self.frames.get(kind)
+        if frame is None:
+            frame = self.frames[kind] = SharedFrame(build())
+        return frame
+
+    def invalidate_frames(self):
+        # for state changes that don't bump the version (joins)
+        self.frames = {}
+
+
+class Server:
+    def __init__(self, host=HOST, port=PORT, journal_dir=None, metrics_port=None, clock=time.time):
+        self.host, self.port = host, port
+        # game_id -> Game; created on first PLAYER_JOINED
+        self.games = {}
+        self.games_lock = threading.Lock()  # protect the registry only, never held while playing
+        # connection -> (game_id, player_id) for quick lookup
+        self.conn_to_pid = {}
+        # connection -> Outbox; handlers only ever enqueue, writers do the I/O
+        self.outboxes = {}
+        # connection -> Codec (JSON until the client negotiates binary on join)
+        self.codecs = {}
+        # (game_id, player_id, msg_id) -> outcome envelope, expiring after DEDUPE_WINDOW_MINUTES
+        self.dedupe = DedupeStore()
+        # heartbeat expiry, forfeits, slow consumers and sweeps; every liveness timestamp reads its clock
+        self.timers = DeadlineScheduler(clock)
+        # set once the engine can accept adopted connections
+        self.ready = threading.Event()
+        # optional durable move journal; games are recovered from it on start
+        self.journal = Journal(journal_dir) if journal_dir else None
+        # QUEUE'd players waiting to be paired into new games
+        self.lobby = Lobby()
+        # set by shard workers: a minted game_id must route back to this process
+        self.owns_game_id = None
+        # spectator connection -> game_id; spectators get states via the feed, off the players' path
+        self.spectating = {}
+        # game_id -> GameState.to_record() of retired games, least recently used first; guarded by games_lock
+        self.archive = OrderedDict()
+        self.feed = SpectatorFeed(self._deliver_to_spectators)
+        # per-thread sends held by _batched()
+        self._local = threading.local()
+        # runs the rest of a long mailbox drain; None: a worker thread (the asyncio engine uses its loop)
+        self.mailbox_handoff = None
+        # counters/histograms for STATS and the optional plaintext endpoint on metrics_port
+        self.metrics = Registry()
+        self.metrics_port = metrics_port
+        self._memory = None  # (taken_at, memory_report()) read by the memory_* gauges
+        self._init_metrics()
+
+    def _init_metrics(self):
+        m = self.metrics
+        self.m_mailbox_wait = m.histogram("game_command_wait_seconds", "time a game command waited in its mailbox")
+        self.m_deferred = m.counter("game_commands_deferred_total", "commands queued behind another thread's drain")
+        self.m_broadcast = m.histogram("broadcast_seconds", "time to enqueue one frame to a game's peers")
+        self.m_fanout = m.histogram("broadcast_recipients", "peers per broadcast", bounds=SIZE_BUCKETS)
+        self.m_connections = m.counter("connections_total", "connections accepted")
+        self._m_by_type = {}  # message type -> (counter, latency histogram)
+        self.m_queue_wait = m.histogram("queue_wait_seconds", "time from QUEUE to MATCHED",
+                                        bounds=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300))
+        self.m_matches = m.counter("matches_total", "games created by matchmaking")
+        self.m_retired = m.counter("games_retired_total", "finished or abandoned games moved to the archive")
+        self.m_archive_evictions = m.counter("archive_evictions_total", "archived games dropped to stay in bounds")
+        self.m_resume_deltas = m.counter("resumes_total", "RESUMEs by reply", reply="deltas")
+        self.m_resume_full = m.counter("resumes_total", "RESUMEs by reply", reply="full")
+        m.gauge("lobby_waiting", lambda: len(self.lobby), "players waiting in QUEUE")
+        m.gauge("lobby_cancelled", lambda: self.lobby.cancelled, "QUEUE tickets dropped on disconnect")
+        m.gauge("spectators", lambda: len(self.spectating), "open SPECTATE connections")
+        m.gauge("spectator_frames_published", lambda: self.feed.published)
+        m.gauge("spectator_frames_delivered", lambda: self.feed.delivered, "after coalescing per game")
+        for mtype in ("PLAYER_JOINED", "QUEUE", "SPECTATE", "RESUME", "MOVE", "PING", "STATS", "OTHER"):
+            self._m_by_type[mtype] = (m.counter("messages_total", "inbound messages", type=mtype),
+                                      m.histogram("dispatch_seconds", "handler latency", type=mtype))
+        m.gauge("connections", lambda: len(self.outboxes), "open connections")
+        m.gauge("games", lambda: len(self.games), "games in the registry")
+        m.gauge("games_archived", lambda: len(self.archive), "retired games still answering RESUME")
+        for key in ("game_bytes", "archived_game_bytes", "connection_bytes"):
+            m.gauge(f"memory_{key}", lambda k=key: self._memory_gauge(k), "sampled average")
+        m.gauge("memory_interner_bytes", lambda: self._memory_gauge("interner_bytes"), "ids shared by all codecs")
+        m.gauge("timers_pending", lambda: len(self.timers), "armed liveness timers")
+        for key in ("entries", "bytes", "hits", "misses", "expired", "evictions"):
+            m.gauge(f"dedupe_{key}", lambda k=key: self.dedupe.stats()[k])
+        m.gauge("dedupe_hit_ratio", lambda: self.dedupe.hits / ((self.dedupe.hits + self.dedupe.misses) or 1))
+        for key in ("depth", "sent", "coalesced", "dropped"):
+            m.gauge(f"outbox_{key}", lambda k=key: self.send_queue_stats()[k])
+        if self.journal:
+            m.gauge("journal_records", lambda: self.journal.records)
+            m.gauge("journal_commits", lambda: self.journal.commits)
+            m.gauge("journal_snapshots", lambda: self.journal.snapshots)
 
     def start(self):
+        self.start_background()
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((HOST, PORT))
+            s.bind((self.host, self.port))
             s.listen(5)
-            print(f"Server listening on {HOST}:{PORT}")
+            print(f"Server listening on {self.host}:{self.port}")
             while True:
                 conn, addr = s.accept()
-                threading.Thread(target=self.handle_client, args=(conn, addr), daemon=True).start()
+                self.adopt(conn, addr)
+
+    def start_background(self):
+        if self.journal:
+            self.recover()
+        if self.metrics_port:
+            serve_text(self.metrics, self.host, self.metrics_port)
+        self._start_sweeps()
+        threading.Thread(target=self.timers.run_forever, daemon=True).start()
+        threading.Thread(target=self.feed.run_forever, daemon=True).start()
+        self.ready.set()
+
+    def adopt(self, conn, addr, initial=b""):
+        """Serves an accepted connection; ``initial`` holds bytes already read from it (see shard.py)."""
+        threading.Thread(target=self.handle_client, args=(conn, addr, initial), daemon=True).start()
+
+    # --- registry ---
+    def get_game(self, game_id, create=False, size=BOARD_SIZE, win_length=WIN_LENGTH):
+        """Looks up a game; with ``create`` a missing one is made with the given board (ignored if it exists)."""
+        game = self.games.get(game_id)
+        if game is None and create:
+            with self.games_lock:
+                game = self.games.get(game_id)
+                if game is None:
+                    game = self.games[game_id] = Game(game_id, size, win_length,
+                                                      Mailbox(self.m_mailbox_wait, self.m_deferred, self.mailbox_handoff))
+        return game
+
+    def _submit(self, game, fn, *args):
+        """Runs ``fn(*args)`` as a command of ``game``; its sends reach each peer in one write."""
+        game.mailbox.submit(self._command, fn, args)
 
-    def handle_client(self, conn, addr):
-        player_id = None
+    def _command(self, fn, args):
+        with self._batched():
+            fn(*args)
+
+    def _retire(self, game):
+        """Command: moves a finished or abandoned game from the registry to the archive."""
+        if game.retired or game.gs.status == "IN_PROGRESS" or game.gs.status == "WAITING" and game.peers:
+            return  # someone joined or came back while the timer was pending
+        game.retired = True
+        with self.games_lock:
+            if self.games.get(game.game_id) is game:
+                del self.games[game.game_id]
+        self._journal(game, {"op": "retire", "game": game.game_id})
+        rec = game.gs.to_record()
+        conns = list(game.peers.values()) + list(game.spectators)
+        for attr in ("peers", "last_seen", "watched", "spectators", "last_ack", "frames", "history"):
+            getattr(game, attr).clear()
+        self._archive(game.game_id, rec)
+        self.dedupe.discard_game(game.game_id)
+        # a player still in another game just gets a fresh ref there
+        for s in (game.game_id, *game.gs.players):
+            DEFAULT_INTERNER.discard(s)
+        for conn in conns:
+            session = self.conn_to_pid.get(conn)
+            if session and session[0] == game.game_id:
+                self.conn_to_pid.pop(conn, None)
+            if self.spectating.get(conn) == game.game_id:
+                self.spectating.pop(conn, None)
+        self.m_retired.value += 1
+
+    def _archive(self, game_id, rec):
+        with self.games_lock:
+            self.archive[game_id] = rec
+            self.archive.move_to_end(game_id)
+            while len(self.archive) > ARCHIVE_GAMES:
+                self.archive.popitem(last=False)
+                self.m_archive_evictions.value += 1
+
+    def _send_archived(self, conn, game_id, pid=None):
+        """Answers a RESUME (``pid`` given) or SPECTATE for a game no longer live, from its archived record."""
+        with self.games_lock:
+            rec = self.archive.get(game_id)
+            if rec is not None:
+                self.archive.move_to_end(game_id)
+        if rec is None:
+            self._send_error(conn, ("UNKNOWN_GAME", f"No such game {game_id}"), game_id)
+        elif pid is not None and (pid == rec.get("bot") or all(p[0] != pid for p in rec["players"])):
+            self._send_error(conn, ("UNKNOWN_PLAYER", f"No such player {pid}"), game_id)
+        else:
+            self._send(conn, envelope("GAME_STATE", game_id, GameState.from_record(rec).serialize()))
+
+    def handle_client(self, conn, addr, initial=b""):
+        self.m_connections.value += 1
+        codec = self.codecs[conn] = Codec()
+        # frames are batched into one write, so Nagle would only add latency
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        outbox = self.outboxes[conn] = ThreadOutbox(lambda envs: send_frames(conn, envs, codec),
+                                                    on_error=lambda: self._close(conn))
+        outbox.clock = self.timers.clock
+        outbox.on_backlog = lambda: self._watch_outbox(conn, outbox)
         try:
-            while True:
-                msg = recv_obj(conn)
-                if msg is None:
-                    break
-                mtype, payload = msg.get("type"), msg.get("payload", {})
-                # HEARTBEAT handling
-                if mtype == "PING":
-                    # On heartbeat, update last_seen for this player if known
-                    pid = self.conn_to_pid.get(conn)
-                    if pid:
-                        self.last_seen[pid] = time.time()
-                    send_obj(conn, envelope("PONG", GAME_ID, {}))
-                    continue
-                if mtype == "PLAYER_JOINED":
-                    pid = payload["player_id"]
-                    with self.lock:
-                        ok, err = self.gs.try_join(pid)
-                        if not ok:
-                            self._send_error(conn, err)
-                            continue
-                        self.gs.players[pid]["conn"] = conn
-                        self.peers[pid] = conn
-                        # also map connection back to pid for heartbeat updates
-                        self.conn_to_pid[conn] = pid
-                        player_id = pid
-                        self.last_seen[pid] = time.time()
-                        # Send current state to the joiner
-                        self._send_state(to_conn=conn)
-                        # If game started (second player), broadcast to all
-                        if self.gs.status == "IN_PROGRESS":
-                            self._broadcast_state()
-                elif mtype == "RESUME":
-                    # Client is requesting to resume a previous session.
-                    pid = payload.get("player_id")
-                    known_version = payload.get("known_version")
-                    if pid not in self.gs.players:
-                        # Unknown player
-                        self._send_error(conn, ("UNKNOWN_PLAYER", f"No such player {pid}"))
-                        continue
-                    with self.lock:
-                        # Attach the new connection to this player
-                        self.peers[pid] = conn
-                        self.conn_to_pid[conn] = pid
-                        self.gs.players[pid]["conn"] = conn
-                        self.last_seen[pid] = time.time()
-                        # If client believes it has a certain version, we ensure they are not ahead
-                        if known_version is not None and known_version > self.gs.version:
-                            self._send_error(conn, ("VERSION_AHEAD", "Client version ahead of server"))
-                            continue
-                        # Send current authoritative state
-                        self._send_state(to_conn=conn)
-                        # If both players connected, broadcast full state to others
-                        if self.gs.status == "IN_PROGRESS":
-                            self._broadcast_state()
-                    continue
-                elif mtype == "MOVE":
-                    pid, x, y = payload["player_id"], int(payload["x"]), int(payload["y"])
-                    client_turn = payload.get("turn")
-                    msg_id = payload.get("msg_id")
-                    # dedupe check
-                    if msg_id:
-                        cache = self.dedupe[pid]
-                        if msg_id in cache:
-                            # replay stored outcome
-                            send_obj(conn, cache[msg_id][1])
-                            continue
-                    self.last_seen[pid] = time.time()
-                    with self.lock:
-                        ok, err = self.gs.validate_move(pid, x, y, client_turn)
-                        if not ok:
-                            env = envelope("ERROR", GAME_ID, {"code": err[0], "message": err[1]})
-                            send_obj(self.peers.get(pid, conn), env)
-                            # store error in dedupe cache
-                            if msg_id:
-                                self._cache_dedupe(pid, msg_id, env)
-                            continue
-                        outcome = self.gs.apply_move(pid, x, y)
-                        # bump version
-                        self.gs.version = getattr(self.gs, "version", 0) + 1
-                        # send confirmation to actor
-                        ack_env = envelope("MOVE_OK", GAME_ID, {"version": self.gs.version, "board": self.gs.serialize()["board"]})
-                        send_obj(self.peers.get(pid, conn), ack_env)
-                        if msg_id:
-                            self._cache_dedupe(pid, msg_id, ack_env)
-                        if self.gs.status == "GAME_OVER":
-                            self._broadcast_game_over(outcome)
-                        else:
-                            self._broadcast_state()
-                else:
-                    self._send_error(conn, ("BAD_TYPE", f"Unsupported type {mtype}"))
+            for msg in FrameReader(conn, codec, initial=initial):
+                self.dispatch(conn, msg)
+        except (OSError, ValueError):
+            pass
         finally:
-            # Clean up reverse mapping on disconnect
-            try:
-                pid = self.conn_to_pid.pop(conn, None)
-                if pid:
-                    # Do not remove gs.player; just mark connection as gone
-                    self.peers.pop(pid, None)
-                    self.gs.players[pid]["conn"] = None
-            except Exception:
-                pass
+            self._on_disconnect(conn)
             conn.close()
 
+    def dispatch(self, conn, msg):
+        """Handles one inbound envelope; shared by the threaded and asyncio engines."""
+        count, latency = self._m_by_type.get(msg.get("type")) or self._m_by_type["OTHER"]
+        count.value += 1
+        t0 = time.perf_counter()
+        try:
+            self._handle(conn, msg)
+        except (KeyError, TypeError, ValueError) as e:
+            # policy 5: a request with missing or mistyped fields gets an ERROR and the connection stays open
+            self._send_error(conn, ("BAD_REQUEST", f"Malformed {msg.get('type')}: {e!r}"),
+                             msg.get("game_id") or GAME_ID)
+        finally:
+            latency.observe(time.perf_counter() - t0)
+
+    def _handle(self, conn, msg):
+        mtype, payload = msg.get("type"), msg.get("payload", {})
+        game_id = msg.get("game_id") or GAME_ID
+        if mtype in GAME_TYPES and self.owns_game_id is not None and not self.owns_game_id(game_id):
+            # this connection was routed by an earlier frame (see shard.py); the game lives in another worker
+            self._send_error(conn, ("WRONG_SHARD", f"Game {game_id} is served elsewhere; reconnect"), game_id)
+            return
+        # HEARTBEAT handling
+        if mtype == "PING":
+            # On heartbeat, update last_seen for this player if known
+            session = self.conn_to_pid.get(conn)
+            if session:
+                game = self.get_game(session[0])
+                if game:
+                    self._submit(game, self._touch, game, session[1])
+            self._send(conn, envelope("PONG", game_id, {}))
+        elif mtype == "PLAYER_JOINED":
+            self._negotiate(conn, msg)
+            pid = sys.intern(payload["player_id"])
+            # board options only take effect for the player that creates the game
+            size, win_length = payload.get("board_size", BOARD_SIZE), payload.get("win_length", WIN_LENGTH)
+            ok, err = check_board(size, win_length)
+            if not ok:
+                self._send_error(conn, err, game_id)
+                return
+            game = self.get_game(game_id, create=True, size=size, win_length=win_length)
+            self._submit(game, self._join, game, conn, pid, size, win_length, bool(payload.get("vs_bot")))
+        elif mtype == "QUEUE":
+            self._negotiate(conn, msg)
+            pid = sys.intern(payload["player_id"])
+            size, win_length = payload.get("board_size", BOARD_SIZE), payload.get("win_length", WIN_LENGTH)
+            ok, err = check_board(size, win_length)
+            if not ok:
+                self._send_error(conn, err, game_id)
+                return
+            key = bucket_key(size, win_length, payload.get("rating"))
+            pair = self.lobby.enqueue(pid, conn, key)
+            if pair is None:
+                self._send(conn, envelope("QUEUED", game_id, {"player_id": pid}))
+            else:
+                self._start_match(*pair)
+        elif mtype == "SPECTATE":
+            self._negotiate(conn, msg)
+            game = self.get_game(game_id)
+            if game is None:
+                self._send_archived(conn, game_id)
+                return
+            self._submit(game, self._spectate, game, conn)
+        elif mtype == "RESUME":
+            # Client is requesting to resume a previous session.
+            self._negotiate(conn, msg)
+            pid = sys.intern(payload["player_id"])
+            known_version = payload.get("known_version")
+            if known_version is not None:
+                known_version = int(known_version)
+            game = self.get_game(game_id)
+            if game is None:
+                self._send_archived(conn, game_id, pid)
+                return
+            self._submit(game, self._resume, game, conn, pid, known_version)
+        elif mtype == "MOVE":
+            pid, x, y = sys.intern(payload["player_id"]), int(payload["x"]), int(payload["y"])
+            msg_id = payload.get("msg_id")
+            if msg_id is not None and not isinstance(msg_id, str):
+                raise TypeError("msg_id must be a string")
+            game = self.get_game(game_id)
+            if game is None:
+                self._send_error(conn, ("UNKNOWN_GAME", f"No such game {game_id}"), game_id)
+                return
+            self._submit(game, self._move, game, conn, pid, x, y, payload.get("turn"), msg_id)
+        elif mtype == "STATS":
+            if self._peer_host(conn) not in STATS_ALLOWED_HOSTS:
+                self._send_error(conn, ("FORBIDDEN", "STATS is only served to local peers"), game_id)
+                return
+            self._send(conn, envelope("STATS", game_id, self.metrics.snapshot()))
+        else:
+            self._send_error(conn, ("BAD_TYPE", f"Unsupported type {mtype}"), game_id)
+
+    # --- game commands (run one at a time per game by its mailbox) ---
+    def _touch(self, game, pid):
+        game.last_seen[pid] = self.timers.clock()
+
+    def _join(self, game, conn, pid, size, win_length, vs_bot):
+        game_id = game.game_id
+        if game.retired:
+            # retired while this was queued: the next lookup creates a fresh game
+            game = self.get_game(game_id, create=True, size=size, win_length=win_length)
+            self._submit(game, self._join, game, conn, pid, size, win_length, vs_bot)
+            return
+        rejoin = pid in game.gs.players
+        ok, err = game.gs.try_join(pid)
+        if not ok:
+            self._send_error(conn, err, game_id)
+            return
+        if not rejoin:
+            record = {"op": "join", "game": game_id, "pid": pid}
+            if len(game.gs.players) == 1:
+                record.update(size=game.gs.size, win_length=game.gs.win_length)
+            self._journal(game, record)
+            if vs_bot and len(game.gs.players) == 1:
+                bot = BOT_PREFIX + game_id
+                ok, err = game.gs.add_bot(bot)
+                if ok:
+                    self._journal(game, {"op": "join", "game": game_id, "pid": bot, "bot": True})
+                else:
+                    self._send_error(conn, err, game_id)
+        game.invalidate_frames()
+        self._attach(game, conn, pid)
+        # Send current state to the joiner
+        self._send_state(game, to_conn=conn)
+        # If game started (second player), broadcast to all
+        if game.gs.status == "IN_PROGRESS":
+            self._broadcast_state(game)
+
+    def _attach(self, game, conn, pid, now=None):
+        game.peers[pid] = conn
+        # also map connection back to pid for heartbeat updates
+        self.conn_to_pid[conn] = (game.game_id, pid)
+        game.last_seen[pid] = now or self.timers.clock()
+        self._watch_player(game, pid)
+        if conn not in self.outboxes:
+            # disconnected while the command was queued; _on_disconnect may have missed the mapping
+            self.conn_to_pid.pop(conn, None)
+            if game.peers.get(pid) is conn:
+                del game.peers[pid]
+
+    def _spectate(self, game, conn):
+        if game.retired:
+            self._send_archived(conn, game.game_id)
+            return
+        if len(game.spectators) >= MAX_SPECTATORS:
+            self._send_error(conn, ("SPECTATORS_FULL", "Too many spectators."), game.game_id)
+            return
+        game.spectators.add(conn)
+        self.spectating[conn] = game.game_id
+        self._send_state(game, to_conn=conn)
+
+    def _resume(self, game, conn, pid, known_version):
+        game_id = game.game_id
+        if game.retired:
+            self._send_archived(conn, game_id, pid)
+            return
+        if pid not in game.gs.players or pid == game.gs.bot:
+            # Unknown player
+            self._send_error(conn, ("UNKNOWN_PLAYER", f"No such player {pid}"), game_id)
+            return
+        # Attach the new connection to this player
+        self._attach(game, conn, pid)
+        # A client ahead of the server (moves acked, then lost in a crash before the journal
+        # synced) must drop what it has: the error is followed by the authoritative state
+        if known_version is not None and known_version > game.gs.version:
+            self._send_error(conn, ("VERSION_AHEAD", "Client version ahead of server"), game_id)
+            known_version = None
+        # Only what this client missed; the other peers are current and get nothing
+        deltas = game.deltas_since(known_version) if known_version is not None else None
+        if deltas is not None and len(deltas) + 1 > self._room(conn):
+            deltas = None  # would overflow the outbox; one GAME_STATE replaces whatever is queued
+        if deltas is None:
+            self._send_state(game, to_conn=conn)
+            self.m_resume_full.value += 1
+        else:
+            for frame in deltas:
+                self._send(conn, frame)
+            self._send(conn, envelope("RESUMED", game_id, {"version": game.gs.version}))
+            self.m_resume_deltas.value += 1
+
+    def _resync(self, game, conn):
+        # conn's full outbox shed this game's deltas; one current state replaces them (policy 8)
+        if conn in game.peers.values():
+            self._send(conn, self._state_frame(game))
+
+    def _move(self, game, conn, pid, x, y, client_turn, msg_id):
+        game_id = game.game_id
+        # dedupe check
+        if msg_id:
+            stored = self.dedupe.get((game_id, pid, msg_id))
+            if stored is not None:
+                # replay stored outcome
+                self._send(conn, stored)
+                return
+        game.last_seen[pid] = self.timers.clock()
+        ok, err = game.gs.validate_move(pid, x, y, client_turn)
+        if not ok:
+            env = envelope("ERROR", game_id, {"code": err[0], "message": err[1]})
+            self._send(game.peers.get(pid, conn), env)
+            # store error in dedupe cache
+            if msg_id:
+                self.dedupe.put((game_id, pid, msg_id), env)
+            return
+        outcome = game.gs.apply_move(pid, x, y)
+        # bump version
+        game.gs.version += 1
+        self._journal(game, {"op": "move", "game": game_id, "pid": pid, "x": x, "y": y, "msg_id": msg_id})
+        # send confirmation to actor
+        ack_env = envelope("MOVE_OK", game_id, {"version": game.gs.version})
+        self._send(game.peers.get(pid, conn), ack_env)
+        if msg_id:
+            self.dedupe.put((game_id, pid, msg_id), ack_env)
+            game.last_ack[pid] = [msg_id, game.gs.version]
+        if game.gs.status == "GAME_OVER":
+            self._broadcast_game_over(game, outcome)
+        else:
+            self._broadcast_delta(game, pid, x, y)
+            self._play_bot(game)
+
+    def _start_match(self, first, second):
+        """Seats a matched pair in a fresh game; the longer waiter gets seat 0 (X)."""
+        size, win_length, _ = first.key
+        while True:
+            game_id = f"M-{uuid.uuid4().hex[:12]}"
+            if self.owns_game_id is None or self.owns_game_id(game_id):
+                break
+        game = self.get_game(game_id, create=True, size=size, win_length=win_length)
+        self._submit(game, self._seat_match, game, first, second)
+        self.m_matches.value += 1
+
+    def _seat_match(self, game, first, second):
+        game_id = game.game_id
+        size, win_length, _ = first.key
+        now = self.timers.clock()
+        for ticket in (first, second):
+            pid, conn = ticket.player_id, ticket.conn
+            game.gs.try_join(pid)
+            record = {"op": "join", "game": game_id, "pid": pid}
+            if ticket is first:
+                record.update(size=size, win_length=win_length)
+            self._journal(game, record)
+            self._attach(game, conn, pid, now)
+            self.m_queue_wait.observe(now - ticket.enqueued_at)
+        for ticket, other in ((first, second), (second, first)):
+            player = game.gs.players[ticket.player_id]
+            self._send(ticket.conn, envelope("MATCHED", game_id, {
+                "game_id": game_id,
+                "player_id": ticket.player_id,
+                "symbol": player.symbol,
+                "seat": player.seat,
+                "opponent": other.player_id,
+            }))
+        self._broadcast_state(game)
+
+    def _play_bot(self, game):
+        # runs inside the move command; the reply is a table lookup, so it is played inline
+        move = game.gs.bot_move()
+        if move is None:
+            return
+        x, y = move
+        pid = game.gs.bot
+        outcome = game.gs.apply_move(pid, x, y)
+        game.gs.version += 1
+        self._journal(game, {"op": "move", "game": game.game_id, "pid": pid, "x": x, "y": y, "msg_id": None})
+        if game.gs.status == "GAME_OVER":
+            self._broadcast_game_over(game, outcome)
+        else:
+            self._broadcast_delta(game, pid, x, y)
+
+    def _negotiate(self, conn, msg):
+        # Pick the wire codec from the envelope version the client advertises on join
+        codec = self.codecs.get(conn)
+        if codec:
+            codec.negotiate(msg.get("version"))
+
+    def _on_disconnect(self, conn):
+        self.lobby.cancel_conn(conn)
+        watching = self.spectating.pop(conn, None)
+        game = self.get_game(watching) if watching else None
+        if game:
+            self._submit(game, game.spectators.discard, conn)
+        self.codecs.pop(conn, None)
+        outbox = self.outboxes.pop(conn, None)
+        if outbox:
+            outbox.close()
+        # Clean up reverse mapping on disconnect
+        try:
+            session = self.conn_to_pid.pop(conn, None)
+            game = self.get_game(session[0]) if session else None
+            if game:
+                self._submit(game, self._detach, game, session[1], conn)
+        except Exception:
+            pass
+
+    def _detach(self, game, pid, conn):
+        # Do not remove gs.player; just mark connection as gone
+        if game.peers.get(pid) is conn:
+            game.peers.pop(pid, None)
+
+    # --- transport hooks (overridden by the asyncio engine) ---
+    def _send(self, conn, env):
+        held = getattr(self._local, "sends", None)
+        if held is not None:
+            held.setdefault(conn, []).append(env)
+        else:
+            self._enqueue(conn, (env,))
+
+    def _room(self, conn):
+        # frames conn's outbox can still take, counting those this thread holds for it
+        outbox = self.outboxes.get(conn)
+        held = getattr(self._local, "sends", None) or {}
+        return outbox.room - len(held.get(conn, ())) if outbox else 0
+
+    def _enqueue(self, conn, envs):
+        outbox = self.outboxes.get(conn)
+        if outbox is None:
+            return
+        if not outbox.put_many(envs):
+            self._slow_consumer(conn, "send queue overflow")
+            return
+        for game_id in outbox.take_collapsed():
+            game = self.get_game(game_id)
+            if game is not None:
+                self._submit(game, self._resync, game, conn)
+
+    @contextlib.contextmanager
+    def _batched(self):
+        """Holds this thread's sends and queues them per connection on exit.
+
+        A move's MOVE_OK and state update then reach each peer in one write.
+        Every game command runs inside one (see ``_submit``), so its frames
+        are queued before the game's next command runs and versions stay in
+        order.
+        """
+        if getattr(self._local, "sends", None) is not None:
+            yield  # nested: the outer block flushes
+            return
+        self._local.sends = {}
+        try:
+            yield
+        finally:
+            held, self._local.sends = self._local.sends, None
+            for conn, envs in held.items():
+                self._enqueue(conn, envs)
+
+    def _peer_host(self, conn):
+        try:
+            return conn.getpeername()[0]
+        except OSError:
+            return None
+
+    def _close(self, conn):
+        # shutdown (not close) so the reader thread blocked in recv wakes up and cleans up
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _slow_consumer(self, conn, reason):
+        # Disconnect only; the player keeps its seat and may RESUME within GRACE_PERIOD
+        print(f"Slow consumer {self.conn_to_pid.get(conn)}: {reason}; disconnecting")
+        outbox = self.outboxes.get(conn)
+        if outbox:
+            outbox.close()
+        self._close(conn)
+
+    def memory_report(self, sample=100):
+        """Approximate bytes per live game, archived game and connection, averaged over up to ``sample`` each.
+
+        Structures shared between games (win masks, seats, the id interner) are
+        left out, and so are the sockets a game points at: they are counted per
+        connection, together with its codec, outbox and registry entries.  The
+        interner is reported on its own as a total.  OS resources outside the
+        Python heap (kernel socket buffers, the threaded engine's thread
+        stacks) are not included.
+        """
+        shared = {id(seat) for seat in SEATS} | {id(self.m_mailbox_wait), id(self.m_deferred),
+                                                   id(self.mailbox_handoff), id(DEFAULT_INTERNER)}
+        conns = list(self.outboxes)[:sample]
+        games = list(self.games.values())[:sample]
+        with self.games_lock:
+            archived = [rec for _, rec in zip(range(sample), reversed(self.archive.values()))]
+        # cached frames point at the interner of the connection that encoded them first
+        in_games = shared | {id(codec.interner) for codec in list(self.codecs.values())}
+        for game in games:
+            in_games.add(id(game.gs.masks))
+            in_games.update(id(c) for c in game.peers.values())
+            in_games.update(id(c) for c in game.spectators)
+
+        def average(items, size):
+            return round(sum(size(item) for item in items) / len(items)) if items else 0
+
+        def connection(conn):
+            # the dict slots holding its entries are amortized into each map's own size, so only values count
+            parts = (conn, self.codecs.get(conn), self.outboxes.get(conn), self.conn_to_pid.get(conn))
+            return deep_sizeof(parts, set(shared)) - deep_sizeof((None, None, None, None))
+        return {
+            "games": len(self.games),
+            "game_bytes": average(games, lambda g: deep_sizeof(g, set(in_games))),
+            "archived_games": len(self.archive),
+            "archived_game_bytes": average(archived, lambda r: deep_sizeof(r, set(shared))),
+            "connections": len(self.outboxes),
+            "connection_bytes": average(conns, connection),
+            "interned_ids": len(DEFAULT_INTERNER),
+            "interner_bytes": deep_sizeof(DEFAULT_INTERNER),
+        }
+
+    def _memory_gauge(self, key):
+        # the report walks up to a few hundred object graphs; one serves a whole snapshot and the scrapes after it
+        now = time.monotonic()
+        if self._memory is None or now - self._memory[0] >= MEMORY_REPORT_TTL:
+            self._memory = (now, self.memory_report())
+        return self._memory[1][key]
+
+    def send_queue_stats(self):
+        """Aggregated outbound queue depth and drop counters across connections."""
+        totals = {"connections": 0, "depth": 0, "high_water": 0, "sent": 0, "coalesced": 0, "dropped": 0}
+        for outbox in list(self.outboxes.values()):
+            st = outbox.stats()
+            totals["connections"] += 1
+            totals["high_water"] = max(totals["high_water"], st.pop("high_water"))
+            for k, v in st.items():
+                totals[k] += v
+        return totals
+
     # --- send helpers ---
-    def _send_state(self, to_conn=None):
-        env = envelope("GAME_STATE", GAME_ID, self.gs.serialize())
+    def _state_frame(self, game):
+        return game.cached_frame("GAME_STATE", lambda: envelope("GAME_STATE", game.game_id, game.gs.serialize()))
+
+    def _send_state(self, game, to_conn=None):
+        env = self._state_frame(game)
         if to_conn:
-            send_obj(to_conn, env)
+            self._send(to_conn, env)
         else:
-            self._broadcast(env)
+            self._broadcast(game, env)
+            self._publish(game, env)
 
-    def _broadcast_state(self):
-        self._send_state(to_conn=None)
+    def _broadcast_state(self, game):
+        self._send_state(game, to_conn=None)
 
-    def _broadcast_game_over(self, outcome):
+    def _broadcast_delta(self, game, pid, x, y):
+        # Clients apply this on top of their cached state; on a version gap they RESUME
+        move = (pid, x, y, game.gs.version, game.gs.turn)
+        game.history.append(move)
+        self._broadcast(game, SharedFrame(game.delta_envelope(*move)))
+        if game.spectators:
+            # spectators get full states: any one of them can be skipped when they fall behind
+            self._publish(game, self._state_frame(game))
+
+    def _broadcast_game_over(self, game, outcome):
         payload = {
             "result": outcome["result"],
             "winning_line": outcome["winning_line"],
-            "final_state": self.gs.serialize(),
+            "final_state": game.gs.serialize(),
         }
-        env = envelope("GAME_OVER", GAME_ID, payload)
-        self._broadcast(env)
+        if outcome.get("reason"):
+            payload["reason"] = outcome["reason"]
+        env = game.cached_frame("GAME_OVER", lambda: envelope("GAME_OVER", game.game_id, payload))
+        self._broadcast(game, env)
+        self._publish(game, env)
+        game.history.clear()  # a finished game is always resumed from its full state
+        self.timers.call_later(FINISHED_LINGER, self._submit, game, self._retire, game)
+
+    def _publish(self, game, env):
+        # runs inside a game command; the feed delivers to spectators later, outside it
+        if game.spectators:
+            self.feed.publish(game, env)
 
-    def _send_error(self, to_conn, err_tuple):
+    def _deliver_to_spectators(self, game, env):
+        for conn in list(game.spectators):
+            self._send(conn, env)
+
+    def _send_error(self, to_conn, err_tuple, game_id=GAME_ID):
         code, message = err_tuple
-        env = envelope("ERROR", GAME_ID, {"code": code, "message": message})
-        send_obj(to_conn, env)
-
-    def _broadcast(self, env):
-        # Snapshot peers to avoid holding lock while sending
-        conns = list(self.peers.values())
-        for c in conns:
-            try:
-                send_obj(c, env)
-            except Exception:
-                pass
-
-    def _cache_dedupe(self, pid, msg_id, env):
-        cache = self.dedupe[pid]
-        cache[msg_id] = (time.time(), env)
-        # purge old
-        cutoff = time.time() - (DEDUPE_WINDOW_MINUTES * 60)
-        keys = list(cache.keys())
-        for k in keys:
-            if cache[k][0] < cutoff:
-                del cache[k]
-
-    def _monitor_heartbeats(self):
-        while True:
-            now = time.time()
-            to_forfeit = []
-            for pid, last in list(self.last_seen.items()):
-                if now - last > GRACE_PERIOD:
-                    to_forfeit.append(pid)
-            for pid in to_forfeit:
-                print(f"Player {pid} exceeded grace period; marking disconnected")
-                # remove peer and mark disconnected
-                conn = self.peers.pop(pid, None)
-                self.last_seen.pop(pid, None)
-                try:
-                    if conn:
-                        conn.close()
-                except Exception:
-                    pass
-            time.sleep(HEARTBEAT_INTERVAL)
+        env = envelope("ERROR", game_id, {"code": code, "message": message})
+        self._send(to_conn, env)
+
+    def _broadcast(self, game, env):
+        # Enqueue only: no socket I/O happens inside a game command
+        t0 = time.perf_counter()
+        peers = list(game.peers.values())
+        for c in peers:
+            self._send(c, env)
+        self.m_broadcast.observe(time.perf_counter() - t0)
+        self.m_fanout.observe(len(peers))
+
+    # --- liveness (run by self.timers, as game commands) ---
+    def _watch_player(self, game, pid):
+        # one pending timer per player, re-armed lazily
+        if pid not in game.watched:
+            game.watched.add(pid)
+            self._check_player_at(game.last_seen[pid] + HEARTBEAT_TIMEOUT, game, pid)
+
+    def _check_player_at(self, due, game, pid):
+        self.timers.call_at(due, self._submit, game, self._check_player, game, pid)
+
+    def _check_player(self, game, pid):
+        now = self.timers.clock()
+        last = game.last_seen.get(pid)
+        if last is None:
+            game.watched.discard(pid)
+            return
+        if pid in game.peers:
+            due = last + HEARTBEAT_TIMEOUT
+            if now >= due:
+                print(f"Player {pid} in {game.game_id} missed heartbeats; marking disconnected")
+                self._close(game.peers.pop(pid))
+                due = last + GRACE_PERIOD
+        else:
+            due = last + GRACE_PERIOD
+            if now >= due:
+                print(f"Player {pid} in {game.game_id} exceeded grace period; forfeiting")
+                game.last_seen.pop(pid, None)
+                game.watched.discard(pid)
+                if game.gs.status == "IN_PROGRESS":
+                    outcome = game.gs.forfeit(pid)
+                    game.gs.version += 1
+                    self._journal(game, {"op": "forfeit", "game": game.game_id, "pid": pid})
+                    self._broadcast_game_over(game, outcome)
+                elif game.gs.status == "WAITING" and not game.peers:
+                    # nobody left to play it
+                    self._retire(game)
+                due = None
+        if due is not None:
+            self._check_player_at(due, game, pid)
+
+    def _watch_outbox(self, conn, outbox):
+        # called by the outbox when a backlog starts; one pending timer per connection
+        if not outbox.watched:
+            outbox.watched = True
+            self.timers.call_at(outbox.pending_since + SLOW_CONSUMER_GRACE, self._check_outbox, conn, outbox)
+
+    def _check_outbox(self, conn, outbox):
+        pending = outbox.pending_since
+        if outbox.closed or pending is None:
+            outbox.watched = False
+        elif self.timers.clock() - pending >= SLOW_CONSUMER_GRACE:
+            outbox.watched = False
+            self._slow_consumer(conn, f"no progress for {SLOW_CONSUMER_GRACE}s")
+        else:
+            self.timers.call_at(pending + SLOW_CONSUMER_GRACE, self._check_outbox, conn, outbox)
+
+    def _start_sweeps(self):
+        def sweep():
+            self.dedupe.purge()
+            self.timers.call_later(HEARTBEAT_INTERVAL, sweep)
+        self.timers.call_later(HEARTBEAT_INTERVAL, sweep)
+        if self.journal:
+            self.timers.call_later(SNAPSHOT_INTERVAL, self._snapshot)
+
+    # --- durability ---
+    def _journal(self, game, record):
+        # runs inside a game command, so records of one game are journaled in order
+        if self.journal:
+            game.journal_seq = self.journal.append(record)
+
+    def _snapshot(self):
+        keep_from = self.journal.begin_snapshot()
+        with self.games_lock:
+            games = list(self.games.values())
+        captured = {}
+        remaining = [len(games) + 1]  # captures still to run, plus this loop
+        done = threading.Lock()
+
+        def finish():
+            with done:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            # file I/O off the timer thread/loop
+            threading.Thread(target=self.journal.write_snapshot, args=(captured, keep_from), daemon=True).start()
+
+        def capture(game):
+            # a capture queued behind a busy game's commands finishes the snapshot later, when it runs
+            if not game.retired:  # its retire record is in the kept journal tail or older than the snapshot
+                rec = game.gs.to_record()
+                rec["seq"] = game.journal_seq
+                rec["acks"] = dict(game.last_ack)
+                captured[game.game_id] = rec
+            finish()
+
+        for game in games:
+            game.mailbox.submit(capture, game)
+        finish()
+        self.timers.call_later(SNAPSHOT_INTERVAL, self._snapshot)
+
+    def recover(self):
+        """Rebuilds games from snapshot + journal tail so clients can RESUME after a restart."""
+        snapshot, records = self.journal.load()
+        for game_id, rec in snapshot.items():
+            game = self.get_game(game_id, create=True)
+            game.gs = GameState.from_record(rec)
+            game.journal_seq = rec["seq"]
+            game.last_ack = rec.get("acks", {})
+        replayed = 0
+        for rec in records:
+            if rec["op"] == "retire":
+                game = self.games.get(rec["game"])
+                if game is not None and rec["seq"] > game.journal_seq:
+                    del self.games[rec["game"]]
+                    self._archive(rec["game"], game.gs.to_record())
+                    replayed += 1
+                continue
+            game = self.get_game(rec["game"], create=True, size=rec.get("size", BOARD_SIZE),
+                                 win_length=rec.get("win_length", WIN_LENGTH))
+            if rec["seq"] <= game.journal_seq:
+                continue  # already in the snapshot
+            gs = game.gs
+            if rec["op"] == "join":
+                if rec.get("bot"):
+                    gs.add_bot(rec["pid"])
+                else:
+                    gs.try_join(rec["pid"])
+            elif rec["op"] == "move":
+                gs.apply_move(rec["pid"], rec["x"], rec["y"])
+                gs.version += 1
+                if rec.get("msg_id"):
+                    game.last_ack[rec["pid"]] = [rec["msg_id"], gs.version]
+            elif rec["op"] == "forfeit":
+                gs.forfeit(rec["pid"])
+                gs.version += 1
+            game.journal_seq = rec["seq"]
+            replayed += 1
+        # Everyone starts disconnected: the normal grace period applies to unfinished games
+        now = self.timers.clock()
+        for game in self.games.values():
+            # a retry of the last move acked before the crash still gets its MOVE_OK
+            for pid, (msg_id, version) in game.last_ack.items():
+                self.dedupe.put((game.game_id, pid, msg_id), envelope("MOVE_OK", game.game_id, {"version": version}))
+            if game.gs.status == "GAME_OVER":
+                self.timers.call_later(FINISHED_LINGER, self._submit, game, self._retire, game)
+            else:
+                for pid in game.gs.players:
+                    if pid == game.gs.bot:
+                        continue
+                    game.last_seen[pid] = now
+                    self._watch_player(game, pid)
+        self.journal.start()
+        print(f"Recovered {len(self.games)} games ({len(snapshot)} from snapshot, {replayed} journal records)")
 
 
 if __name__ == "__main__":
-    Server().start()
+    # Usage:
+    #   python server.py                  # thread per connection
+    #   python server.py async            # single asyncio event loop
+    #   python server.py shards 4 [async] # 4 worker processes, games pinned by game_id
+    #   add "journal DIR" to any of the above to persist games and recover them on restart
+    #   add "metrics PORT" to serve plaintext metrics at http://HOST:PORT/metrics
+    args = sys.argv[1:]
+    options = {"journal": None, "metrics": None}
+    for name in options:
+        if name in args:
+            i = args.index(name)
+            options[name] = args[i + 1]
+            del args[i:i + 2]
+    journal_dir = options["journal"]
+    metrics_port = int(options["metrics"]) if options["metrics"] else None
+    args = [a.lower() for a in args]
+    if args and args[0].startswith("shard"):
+        from shard import Supervisor
+        workers = int(args[1]) if len(args) > 1 and args[1].isdigit() else None
+        Supervisor(workers=workers, engine="async" if "async" in args else "thread", journal_dir=journal_dir,
+                   metrics_port=metrics_port).start()
+    elif args and args[0].startswith("async"):
+        from aio_server import AsyncServer
+        AsyncServer(journal_dir=journal_dir, metrics_port=metrics_port).start()
+    else:
+        Server(journal_dir=journal_dir, metrics_port=metrics_port).start()
@@ -0,0 +1,257 @@
+# shard.py
+"""
+Multi-process server: one supervisor, N forked worker processes.
+
+CPython runs one game loop per process no matter how many threads
+``Server.start`` spawns, so to use every core the supervisor owns the
+listening socket and hands each accepted connection to a worker.  Routing
+is by ``game_id``: the supervisor reads the connection's first frame
+(PLAYER_JOINED, RESUME, ...), hashes its ``game_id`` and passes the file
+descriptor, plus the bytes already read, to the owning worker over a Unix
+socket (SCM_RIGHTS).  Every connection of a game therefore lands in the
+same process and the per-game state never has to be shared; a frame for
+another game on an already routed connection is answered with a
+WRONG_SHARD ERROR, and the client reconnects.
+
+QUEUE connections are not routed by ``game_id`` (most carry the default
+room).  The supervisor holds them in its own lobby, buffering other frames
+they send meanwhile, and hands each matched pair to the next worker in
+turn; that worker's lobby seats the two in a game_id that hashes back to
+it, so RESUMEs route correctly and matchmade games spread over all
+workers.  A waiting player gets QUEUED together with MATCHED; its PINGs
+are dropped meanwhile, since there is no game to keep alive yet.
+
+SO_REUSEPORT alone would spread connections by address, not by game, so it
+isn't used.  Unix only (fork + fd passing).  Journals are per worker, so
+keep the worker count fixed across restarts or recovered games will be
+looked up in the wrong process.
+
+    python server.py shards 4          # threaded workers
+    python server.py shards 4 async    # asyncio workers
+"""
+
+import os, selectors, signal, socket, struct, sys, threading, time, zlib
+from collections import deque
+
+from matchmaking import Lobby, bucket_key
+from server import Server, HOST, PORT, GAME_ID, BOARD_SIZE, WIN_LENGTH, check_board
+from wire import decode_payload, Codec, BIN_MAGIC, MSG_TYPES
+
+# First frames are small joins/resumes; anything larger is not a client we route
+ROUTE_MAX_FRAME = 64 * 1024
+# Connections that don't send a first frame in time are dropped by the supervisor
+ROUTE_TIMEOUT = 10
+# a binary PING that defines no refs: magic, zero definitions, type code (flagged 0x80 in its fixed layout)
+BARE_BINARY_PINGS = tuple(BIN_MAGIC + bytes((0, flag | MSG_TYPES.index("PING") + 1)) for flag in (0, 0x80))
+
+
+def shard_for(game_id, workers):
+    # stable across processes and runs, unlike hash()
+    return zlib.crc32(game_id.encode("utf-8")) % workers
+
+
+class Supervisor:
+    def __init__(self, workers=None, host=HOST, port=PORT, engine="thread", journal_dir=None, metrics_port=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.host, self.port = host, port
+        self.engine = engine
+        # each worker journals its own games under journal_dir/worker-N
+        self.journal_dir = journal_dir
+        # worker N serves its metrics on metrics_port + N
+        self.metrics_port = metrics_port
+        self.channels = []  # per-worker Unix socket used to pass connections
+        self.pids = []
+        self.routed = [0] * self.workers
+        self.selector = None
+        self.pending = {}  # conn -> bytearray read so far
+        # QUEUE connections wait here until paired, then both go to the next worker in turn
+        self.lobby = Lobby()
+        self.queued = {}  # conn -> its pending buffer, while its ticket is in self.lobby
+        self.next_worker = 0
+
+    def start(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as listener:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((self.host, self.port))
+            listener.listen(128)
+            self._spawn_workers(listener)
+            print(f"Supervisor listening on {self.host}:{self.port} with {self.workers} {self.engine} workers")
+            # turn SIGTERM into SystemExit so the workers are taken down with us
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+            try:
+                self._route_forever(listener)
+            finally:
+                for pid in self.pids:
+                    try:
+                        os.kill(pid, signal.SIGTERM)
+                    except OSError:
+                        pass
+
+    def _spawn_workers(self, listener):
+        # fork before any threads exist in the supervisor
+        for i in range(self.workers):
+            parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            pid = os.fork()
+            if pid == 0:
+                listener.close()
+                parent.close()
+                for ch in self.channels:
+                    ch.close()
+                try:
+                    journal = os.path.join(self.journal_dir, f"worker-{i}") if self.journal_dir else None
+                    run_worker(child, self.engine, journal, self.metrics_port + i if self.metrics_port else None,
+                               i, self.workers)
+                finally:
+                    os._exit(0)
+            child.close()
+            self.channels.append(parent)
+            self.pids.append(pid)
+
+    def _route_forever(self, listener):
+        sel = self.selector = selectors.DefaultSelector()
+        listener.setblocking(False)
+        sel.register(listener, selectors.EVENT_READ)
+        pending = self.pending
+        arrivals = deque()  # (accepted_at, conn), oldest first
+        while True:
+            for key, _ in sel.select(timeout=1):
+                if key.fileobj is listener:
+                    while True:
+                        try:
+                            conn, _ = listener.accept()
+                        except BlockingIOError:
+                            break
+                        conn.setblocking(False)
+                        pending[conn] = bytearray()
+                        arrivals.append((time.time(), conn))
+                        sel.register(conn, selectors.EVENT_READ)
+                    continue
+                conn = key.fileobj
+                buf = pending[conn]
+                try:
+                    # never buffer more than one maximal first frame
+                    chunk = conn.recv(4 + ROUTE_MAX_FRAME - len(buf))
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    chunk = b""
+                buf += chunk
+                if chunk and conn in self.queued:
+                    # only buffers until paired; heartbeats are dropped so a long wait never fills it
+                    self._drop_pings(buf)
+                elif not chunk or self._try_route(conn, buf):
+                    self._release(conn)
+            # drop connections that never identified their game
+            cutoff = time.time() - ROUTE_TIMEOUT
+            while arrivals and arrivals[0][0] < cutoff:
+                _, conn = arrivals.popleft()
+                if conn in pending and conn not in self.queued:
+                    self._release(conn)
+
+    def _release(self, conn):
+        # a routed connection lives on in its worker; the supervisor only closes its own descriptor
+        if conn in self.queued:
+            del self.queued[conn]
+            self.lobby.cancel_conn(conn)
+        if conn in self.pending:
+            self.selector.unregister(conn)
+            del self.pending[conn]
+        conn.close()
+
+    def _try_route(self, conn, buf):
+        """Hands conn to its worker once the first frame is complete; True when done with it."""
+        if len(buf) < 4:
+            return False
+        (length,) = struct.unpack_from("!I", buf)
+        if length > ROUTE_MAX_FRAME:
+            return True
+        if len(buf) < 4 + length:
+            return False
+        try:
+            msg = decode_payload(bytes(buf[4:4 + length]), Codec())
+            game_id = msg.get("game_id") or GAME_ID
+            game_id.encode("utf-8")
+        except Exception:
+            # whatever a client sends must only cost that client its connection, never the router
+            return True
+        if msg.get("type") == "QUEUE":
+            key = self._bucket(msg.get("payload"))
+            if key is not None:
+                return self._queue(conn, buf, msg["payload"]["player_id"], key)
+        self._send_to(shard_for(game_id, self.workers), conn, buf)
+        return True
+
+    def _bucket(self, payload):
+        # a QUEUE the worker would refuse is routed like any other frame, so the worker answers the error
+        try:
+            size, win_length = payload.get("board_size", BOARD_SIZE), payload.get("win_length", WIN_LENGTH)
+            if not isinstance(payload["player_id"], str) or not check_board(size, win_length)[0]:
+                return None
+            return bucket_key(size, win_length, payload.get("rating"))
+        except Exception:
+            return None
+
+    def _queue(self, conn, buf, player_id, key):
+        pair = self.lobby.enqueue(player_id, conn, key)
+        if pair is None:
+            self.queued[conn] = buf
+            return False
+        # both QUEUEs reach one worker, whose lobby pairs them into a game it owns
+        idx = self.next_worker
+        self.next_worker = (idx + 1) % self.workers
+        waiter, _ = pair
+        self._send_to(idx, waiter.conn, self.queued.pop(waiter.conn))
+        self._send_to(idx, conn, buf)
+        self._release(waiter.conn)
+        return True
+
+    def _drop_pings(self, buf):
+        """Removes the complete PING frames buffered after a held QUEUE; other frames go to the worker."""
+        pos = 4 + struct.unpack_from("!I", buf)[0]
+        while len(buf) - pos >= 4:
+            end = pos + 4 + struct.unpack_from("!I", buf, pos)[0]
+            if end > len(buf):
+                return
+            body = bytes(buf[pos + 4:end])
+            if body.startswith(BARE_BINARY_PINGS) or (body[:1] != BIN_MAGIC and _is_ping(body)):
+                del buf[pos:end]
+            else:
+                pos = end
+
+    def _send_to(self, idx, conn, buf):
+        socket.send_fds(self.channels[idx], [bytes(buf)], [conn.fileno()])
+        self.routed[idx] += 1
+
+
+def _is_ping(body):
+    try:
+        return decode_payload(body)["type"] == "PING"
+    except Exception:
+        return False
+
+
+def run_worker(channel, engine, journal_dir=None, metrics_port=None, index=0, workers=1):
+    """Worker process body: serves connections passed in over ``channel``."""
+    if engine == "async":
+        import asyncio
+        from aio_server import AsyncServer
+        srv = AsyncServer(journal_dir=journal_dir, metrics_port=metrics_port)
+        srv.owns_game_id = lambda game_id: shard_for(game_id, workers) == index
+        threading.Thread(target=_receive_connections, args=(channel, srv), daemon=True).start()
+        asyncio.run(srv.serve(listen=False))
+    else:
+        srv = Server(journal_dir=journal_dir, metrics_port=metrics_port)
+        srv.owns_game_id = lambda game_id: shard_for(game_id, workers) == index
+        srv.start_background()
+        _receive_connections(channel, srv)
+
+
+def _receive_connections(channel, srv):
+    srv.ready.wait()
+    while True:
+        data, fds, _, _ = socket.recv_fds(channel, 4 + ROUTE_MAX_FRAME, 1)
+        if not fds:
+            os._exit(0)  # supervisor went away; nothing will be routed here again
+        conn = socket.socket(fileno=fds[0])
+        conn.setblocking(True)  # the supervisor left the shared file description non-blocking
+        srv.adopt(conn, conn.getpeername(), initial=data)
@@ -0,0 +1,126 @@
+# solver.py
+"""
+Perfect-play tic-tac-toe solver backing the server's bot player.
+
+The whole game tree is searched once, at first use, over positions reduced
+by the 8 board symmetries (765 distinct positions instead of 5478).  Each
+canonical position gets one slot in two flat arrays: the negamax score for
+the side to move and the best cell.  A lookup maps the bitboards to their
+canonical base-3 key with a few table reads, finds the slot and maps the
+stored move back through the inverse symmetry: constant work, no search.
+
+Scores favour quick wins and slow losses: a position the mover wins with
+the n-th piece scores 10 - n, a loss scores n - 10, a draw 0.
+"""
+
+import threading
+from array import array
+
+# Cells are bits y*3+x, as in server.GameState
+_LINES = (0b000000111, 0b000111000, 0b111000000,  # rows
+          0b001001001, 0b010010010, 0b100100100,  # cols
+          0b100010001, 0b001010100)  # diags
+
+NO_MOVE = 255
+_NO_SLOT = 0xFFFF
+
+
+def _symmetries():
+    # each symmetry as a cell permutation: cell i moves to perm[i]
+    perms = []
+    for rot in range(4):
+        for flip in (False, True):
+            perm = []
+            for i in range(9):
+                x, y = i % 3, i // 3
+                if flip:
+                    x = 2 - x
+                for _ in range(rot):
+                    x, y = 2 - y, x
+                perm.append(y * 3 + x)
+            perms.append(tuple(perm))
+    return perms
+
+
+PERMS = _symmetries()
+INVERSE = [tuple(p.index(i) for i in range(9)) for p in PERMS]
+# PERM_BITS[s][mask]: a 9-bit occupancy mask moved through symmetry s
+PERM_BITS = [array("H", (sum(1 << p[i] for i in range(9) if m >> i & 1) for m in range(512))) for p in PERMS]
+# TERNARY[mask]: sum of 3**i over set bits, so a position's key is TERNARY[x] + 2 * TERNARY[o]
+TERNARY = array("H", (sum(3 ** i for i in range(9) if m >> i & 1) for m in range(512)))
+
+
+def winner_bits(bits):
+    return any(bits & line == line for line in _LINES)
+
+
+class Solver:
+    def __init__(self):
+        self._slot = array("H", [_NO_SLOT]) * 3 ** 9  # canonical key -> slot
+        self._score = array("b")  # per slot, for the side to move
+        self._move = bytearray()  # per slot, best cell in the canonical frame
+        self._solve(0, 0)
+
+    def __len__(self):
+        return len(self._score)
+
+    def canonical(self, x_bits, o_bits):
+        """Returns (key, symmetry) of the smallest base-3 key among the 8 images."""
+        return min((TERNARY[pb[x_bits]] + 2 * TERNARY[pb[o_bits]], s) for s, pb in enumerate(PERM_BITS))
+
+    def score(self, x_bits, o_bits):
+        key, _ = self.canonical(x_bits, o_bits)
+        return self._score[self._slot[key]]
+
+    def best_move(self, x_bits, o_bits):
+        """Best (x, y) for the side to move, or None if the game is over."""
+        key, s = self.canonical(x_bits, o_bits)
+        cell = self._move[self._slot[key]]
+        if cell == NO_MOVE:
+            return None
+        cell = INVERSE[s][cell]
+        return cell % 3, cell // 3
+
+    def _solve(self, x_bits, o_bits):
+        key, s = self.canonical(x_bits, o_bits)
+        slot = self._slot[key]
+        if slot != _NO_SLOT:
+            return self._score[slot]
+        # search in the canonical frame so the stored move needs no translation
+        x_bits, o_bits = PERM_BITS[s][x_bits], PERM_BITS[s][o_bits]
+        filled = x_bits | o_bits
+        n = bin(filled).count("1")
+        x_to_move = n % 2 == 0
+        best, move = None, NO_MOVE
+        if winner_bits(o_bits if x_to_move else x_bits):
+            best = n - 10
+        elif n == 9:
+            best = 0
+        else:
+            for cell in range(9):
+                if filled >> cell & 1:
+                    continue
+                if x_to_move:
+                    value = -self._solve(x_bits | 1 << cell, o_bits)
+                else:
+                    value = -self._solve(x_bits, o_bits | 1 << cell)
+                if best is None or value > best:
+                    best, move = value, cell
+        self._slot[key] = len(self._score)
+        self._score.append(best)
+        self._move.append(move)
+        return best
+
+
+_solver = None
+_solver_lock = threading.Lock()
+
+
+def get_solver():
+    """Process-wide solver, built on first use (a few tens of milliseconds)."""
+    global _solver
+    if _solver is None:
+        with _solver_lock:
+            if _solver is None:
+                _solver = Solver()
+    return _solver
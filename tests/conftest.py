@@ -0,0 +1,66 @@
+# tests/conftest.py
+"""
+Shared fixtures.  Servers are driven in-process through ``dispatch`` with
+``FakeConn``s standing in for sockets, so no test binds a port.
+"""
+
+import os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from outbox import Outbox
+from server import Server
+from wire import envelope
+
+
+class FakeConn:
+    """A client connection whose outbound frames stay queued in a plain ``Outbox`` until ``received``."""
+
+    def __init__(self, srv):
+        self.srv = srv
+        self.outbox = srv.outboxes[self] = Outbox()
+        self.outbox.clock = srv.timers.clock
+        self.outbox.on_backlog = lambda: srv._watch_outbox(self, self.outbox)
+        self.closed = False
+
+    def send(self, msg_type, game_id, payload):
+        self.srv.dispatch(self, envelope(msg_type, game_id, payload))
+        return self.received()
+
+    def received(self):
+        with self.outbox._cond:
+            frames = self.outbox._take_all()
+        self.outbox._delivered(len(frames))
+        return frames
+
+    def disconnect(self):
+        self.srv._on_disconnect(self)
+
+    def shutdown(self, how):
+        self.closed = True
+
+    def getpeername(self):
+        return ("127.0.0.1", 0)
+
+
+@pytest.fixture
+def srv():
+    return Server()
+
+
+@pytest.fixture
+def connect(srv):
+    return lambda: FakeConn(srv)
+
+
+@pytest.fixture
+def wait_until():
+    def wait(predicate, timeout=5.0):
+        deadline = time.time() + timeout
+        while not predicate():
+            if time.time() > deadline:
+                raise AssertionError("timed out waiting for condition")
+            time.sleep(0.01)
+    return wait
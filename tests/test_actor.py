@@ -0,0 +1,64 @@
+# tests/test_actor.py
+import threading
+
+from actor import Mailbox, MAX_DRAIN
+from wire import envelope
+
+
+def test_commands_run_in_submission_order():
+    box, ran = Mailbox(), []
+
+    def command(i):
+        ran.append(i)
+        if i < 3:
+            box.submit(command, i + 10)  # queued behind whatever is already waiting
+    for i in range(3):
+        box.submit(command, i)
+    assert ran == [0, 10, 1, 11, 2, 12]
+
+
+def test_a_long_queue_is_handed_off_after_max_drain():
+    handed, ran = [], []
+    box = Mailbox(handoff=handed.append)
+
+    def flood():
+        for i in range(MAX_DRAIN + 10):
+            box.submit(ran.append, i)
+    box.submit(flood)
+    assert ran == list(range(MAX_DRAIN - 1)) and len(handed) == 1
+    box.submit(ran.append, "late")  # still busy: queued behind the rest, not run by this submit
+    assert len(ran) == MAX_DRAIN - 1
+    handed.pop()()
+    assert ran == list(range(MAX_DRAIN + 10)) + ["late"] and not handed
+
+
+def test_a_nested_submit_runs_after_the_outer_command():
+    outer, inner, events = Mailbox(), Mailbox(), []
+
+    def other_thread():
+        inner.submit(events.append, "inner 2")
+
+    def command():
+        events.append("outer start")
+        inner.submit(events.append, "inner 1")
+        # the inner mailbox stays busy until its first command ran, so this only queues
+        t = threading.Thread(target=other_thread)
+        t.start()
+        t.join()
+        events.append("outer end")
+    outer.submit(command)
+    assert events == ["outer start", "outer end", "inner 1", "inner 2"]
+
+
+def test_held_sends_of_a_nested_command_are_not_overtaken(srv, connect):
+    c = connect()
+    first = srv.get_game("A", create=True)
+    second = srv.get_game("B", create=True)
+
+    def command():
+        srv._submit(second, srv._send, c, envelope("MOVE_OK", "B", {"version": 1}))
+        t = threading.Thread(target=srv._submit, args=(second, srv._send, c, envelope("MOVE_OK", "B", {"version": 2})))
+        t.start()
+        t.join()
+    srv._submit(first, command)
+    assert [f["payload"]["version"] for f in c.received()] == [1, 2]
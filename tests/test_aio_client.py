@@ -0,0 +1,68 @@
+# tests/test_aio_client.py
+import asyncio
+
+from aio_client import Session
+from wire import apply_delta
+
+
+def state(version):
+    return {"board": [[None] * 3 for _ in range(3)], "version": version, "turn": version, "players": {},
+            "next_player_id": "a", "status": "IN_PROGRESS"}
+
+
+def delta(version):
+    return {"version": version, "turn": version, "next_player_id": "a", "status": "IN_PROGRESS",
+            "last_move": {"x": version % 3, "y": version // 3, "symbol": "X", "player_id": "a"}}
+
+
+def pending_resume(session):
+    fut = asyncio.get_running_loop().create_future()
+    session._pending.append(("state", fut))
+    return fut
+
+
+def test_resume_resolves_on_resumed_after_the_replayed_deltas():
+    async def main():
+        session = Session("a")
+        session.state = state(2)
+        fut = pending_resume(session)
+        session._on_message("GAME_DELTA", delta(3))
+        session._on_message("GAME_DELTA", delta(4))
+        assert not fut.done()
+        session._on_message("RESUMED", {"version": 4})
+        assert fut.result()["version"] == 4 and not session._pending
+    asyncio.run(main())
+
+
+def test_resume_resolves_on_a_full_state():
+    async def main():
+        session = Session("a")
+        session.state = state(2)
+        fut = pending_resume(session)
+        session._on_message("GAME_STATE", state(9))
+        assert fut.result()["version"] == 9
+    asyncio.run(main())
+
+
+def test_resume_ahead_of_the_server_takes_its_older_state():
+    async def main():
+        session = Session("a")
+        session.state = state(7)
+        fut = pending_resume(session)
+        session._on_message("ERROR", {"code": "VERSION_AHEAD", "message": ""})
+        assert not fut.done()
+        session._on_message("GAME_STATE", state(5))
+        assert fut.result()["version"] == 5 and session.state["version"] == 5
+    asyncio.run(main())
+
+
+def test_game_over_does_not_answer_a_pending_request():
+    async def main():
+        session = Session("a")
+        session.state = state(2)
+        fut = pending_resume(session)
+        final = apply_delta(state(2), delta(3))
+        final["status"] = "GAME_OVER"
+        session._on_message("GAME_OVER", {"result": "X_WIN", "winning_line": [], "final_state": final})
+        assert not fut.done() and session.result["result"] == "X_WIN"
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+# tests/test_dedupe.py
+from dedupe import DedupeStore, ENTRY_OVERHEAD
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def ack(version):
+    return {"type": "MOVE_OK", "payload": {"version": version}}
+
+
+def test_entries_expire_after_the_window():
+    clock = Clock()
+    store = DedupeStore(window=60, clock=clock)
+    store.put(("G", "a", "m1"), ack(1))
+    clock.now += 30
+    store.put(("G", "a", "m2"), ack(2))
+    assert store.get(("G", "a", "m1")) == ack(1)
+    clock.now += 31
+    assert store.get(("G", "a", "m1")) is None and store.get(("G", "a", "m2")) == ack(2)
+    assert store.purge() == 1 and len(store) == 1
+    assert store.stats()["expired"] == 1 and store.hits == 2 and store.misses == 1
+
+
+def test_entry_cap_evicts_the_oldest():
+    store = DedupeStore(max_entries=3, clock=Clock())
+    for i in range(5):
+        store.put(("G", "a", f"m{i}"), ack(i))
+    assert len(store) == 3 and store.evictions == 2
+    assert store.get(("G", "a", "m1")) is None and store.get(("G", "a", "m2")) == ack(2)
+
+
+def test_byte_cap_bounds_memory():
+    store = DedupeStore(max_bytes=10 * ENTRY_OVERHEAD, clock=Clock())
+    for i in range(100):
+        store.put(("G", "a", f"m{i}"), ack(i))
+    assert store.bytes <= 10 * ENTRY_OVERHEAD and 0 < len(store) < 10
+    assert store.get(("G", "a", "m99")) == ack(99)
+
+
+def test_discard_game_drops_only_that_game():
+    store = DedupeStore(clock=Clock())
+    store.put(("G", "a", "m1"), ack(1))
+    store.put(("G", "b", "m1"), ack(1))
+    store.put(("H", "a", "m1"), ack(1))
+    before = store.bytes
+    assert store.discard_game("G") == 2
+    assert len(store) == 1 and store.get(("H", "a", "m1")) == ack(1)
+    assert 0 < store.bytes < before and store.discard_game("G") == 0
@@ -0,0 +1,87 @@
+# tests/test_game.py
+import pytest
+
+from server import GameState, check_board, win_masks, MAX_BOARD_SIZE
+
+
+def play(size, win_length, x_cells, o_cells):
+    """Alternates X and O through the given cells; returns (state, outcome of the last move)."""
+    gs = GameState(size, win_length)
+    gs.try_join("x")
+    gs.try_join("o")
+    outcome = None
+    for i in range(len(x_cells) + len(o_cells)):
+        cells, pid = (x_cells, "x") if i % 2 == 0 else (o_cells, "o")
+        assert gs.status == "IN_PROGRESS", "the game ended early"
+        outcome = gs.apply_move(pid, *cells[i // 2])
+    return gs, outcome
+
+
+# 7x7, four in a row; O's cells never line up
+O_FILLER = [(0, 0), (2, 2), (4, 0)]
+
+
+@pytest.mark.parametrize("line", [
+    [(3, 6), (4, 6), (5, 6), (6, 6)],  # row against the bottom-right corner
+    [(6, 1), (6, 2), (6, 3), (6, 4)],  # right column
+    [(3, 3), (4, 4), (5, 5), (6, 6)],  # diagonal into the corner
+    [(3, 0), (2, 1), (1, 2), (0, 3)],  # anti-diagonal from the top edge to the left edge
+    [(6, 3), (5, 4), (4, 5), (3, 6)],  # anti-diagonal from the right edge to the bottom edge
+])
+def test_k_in_a_row_near_the_edges(line):
+    for order in (line, line[::-1], line[1:] + line[:1]):  # the completing cell may be anywhere in the run
+        gs, outcome = play(7, 4, order, O_FILLER)
+        assert outcome["result"] == "X_WIN" and set(map(tuple, outcome["winning_line"])) == set(line)
+        assert gs.status == "GAME_OVER"
+
+
+@pytest.mark.parametrize("cells", [
+    [(5, 0), (6, 0), (0, 1), (1, 1)],  # consecutive bits wrapping from one row into the next
+    [(6, 0), (0, 1), (1, 2), (2, 3)],  # a diagonal that would wrap around the right edge
+    [(4, 3), (5, 4), (6, 5), (0, 6)],
+])
+def test_runs_that_wrap_around_the_board_do_not_win(cells):
+    gs, outcome = play(7, 4, cells, O_FILLER)
+    assert outcome is None and gs.status == "IN_PROGRESS" and gs.turn == 7
+
+
+def test_win_masks_only_hold_runs_through_the_cell():
+    for size, k in ((3, 3), (7, 4), (15, 5), (MAX_BOARD_SIZE, 3)):
+        masks = win_masks(size, k)
+        assert len(masks) == size * size
+        for cell, runs in enumerate(masks):
+            assert len(runs) <= 4 * k
+            for mask, line in runs:
+                assert mask >> cell & 1 and len(line) == k == bin(mask).count("1")
+    # every run of a 3x3 board: 3 rows, 3 columns, 2 diagonals
+    assert len({mask for runs in win_masks(3, 3) for mask, _ in runs}) == 8
+
+
+@pytest.mark.parametrize("size, x_cells, o_cells", [
+    (3, [(0, 0), (2, 0), (0, 1), (1, 2), (2, 2)], [(1, 0), (1, 1), (2, 1), (0, 2)]),
+    (4, [(0, 0), (1, 0), (2, 1), (3, 1), (0, 2), (1, 2), (2, 3), (3, 3)],
+        [(2, 0), (3, 0), (0, 1), (1, 1), (2, 2), (3, 2), (0, 3), (1, 3)]),
+])
+def test_a_full_board_without_a_line_is_a_draw(size, x_cells, o_cells):
+    gs, outcome = play(size, size, x_cells, o_cells)
+    assert outcome == {"result": "DRAW", "winning_line": None}
+    assert gs.turn == size * size and gs.status == "GAME_OVER"
+
+
+@pytest.mark.parametrize("size, win_length", [
+    (2, 2), (MAX_BOARD_SIZE + 1, 5), (5, 6), (5, 2), ("5", 3), (5.0, 3), (5, None), (None, 3),
+])
+def test_bad_boards_are_rejected(size, win_length):
+    ok, err = check_board(size, win_length)
+    assert not ok and err[0] == "BAD_BOARD"
+
+
+@pytest.mark.parametrize("size, win_length", [(3, 3), (7, 4), (MAX_BOARD_SIZE, MAX_BOARD_SIZE)])
+def test_good_boards_are_accepted(size, win_length):
+    assert check_board(size, win_length) == (True, None)
+
+
+def test_a_join_with_a_bad_board_creates_no_game(srv, connect):
+    reply = connect().send("PLAYER_JOINED", "G", {"player_id": "a", "board_size": 25, "win_length": 5})
+    assert [f["type"] for f in reply] == ["ERROR"] and reply[0]["payload"]["code"] == "BAD_BOARD"
+    assert "G" not in srv.games
@@ -0,0 +1,67 @@
+# tests/test_journal.py
+import os
+
+from journal import Journal, SNAPSHOT_FILE
+from server import Server
+from conftest import FakeConn
+
+
+def committed(directory):
+    return Journal(directory).load()
+
+
+def test_snapshot_drops_covered_segments(tmp_path, wait_until):
+    j = Journal(str(tmp_path))
+    j.load()
+    j.start()
+    for i in range(3):
+        j.append({"op": "move", "game": "G", "i": i})
+    wait_until(lambda: len(committed(str(tmp_path))[1]) == 3)
+    keep_from = j.begin_snapshot()
+    j.append({"op": "move", "game": "G", "i": 3})
+    j.write_snapshot({"G": {"seq": 3}}, keep_from)
+    wait_until(lambda: len(committed(str(tmp_path))[1]) == 1)
+
+    games, records = committed(str(tmp_path))
+    assert games == {"G": {"seq": 3}}
+    assert [(r["seq"], r["i"]) for r in records] == [(4, 3)]
+    assert os.path.exists(tmp_path / SNAPSHOT_FILE)
+
+
+def test_torn_tail_is_ignored(tmp_path):
+    (tmp_path / "journal-00000001.log").write_text('{"op":"move","seq":1}\n{"op":"mo')
+    games, records = Journal(str(tmp_path)).load()
+    assert games == {} and [r["seq"] for r in records] == [1]
+
+
+def play(conn, game_id, pid, x, y, msg_id):
+    return conn.send("MOVE", game_id, {"player_id": pid, "x": x, "y": y, "msg_id": msg_id})
+
+
+def test_recover_from_snapshot_and_tail(tmp_path, wait_until):
+    srv = Server(journal_dir=str(tmp_path))
+    srv.recover()
+    a, b = FakeConn(srv), FakeConn(srv)
+    a.send("PLAYER_JOINED", "G", {"player_id": "a"})
+    b.send("PLAYER_JOINED", "G", {"player_id": "b"})
+    play(a, "G", "a", 0, 0, "m1")
+    play(b, "G", "b", 1, 1, "m2")
+    srv._snapshot()
+    wait_until(lambda: srv.journal.snapshots == 1)
+    play(a, "G", "a", 2, 0, "m3")
+    # two joins and three moves, the first four covered by the snapshot
+    wait_until(lambda: len(committed(str(tmp_path))[1]) == 1)
+    before = srv.games["G"].gs.serialize()
+
+    srv2 = Server(journal_dir=str(tmp_path))
+    srv2.recover()
+    after = srv2.games["G"].gs.serialize()
+    assert after["board"] == before["board"] and after["version"] == before["version"] == 3
+    assert after["next_player_id"] == "b"
+
+    # a retry of the last acknowledged move is answered, not reapplied
+    c = FakeConn(srv2)
+    c.send("RESUME", "G", {"player_id": "a", "known_version": 3})
+    reply = play(c, "G", "a", 2, 0, "m3")
+    assert [(f["type"], f["payload"].get("version")) for f in reply] == [("MOVE_OK", 3)]
+    assert srv2.games["G"].gs.version == 3
@@ -0,0 +1,145 @@
+# tests/test_server.py
+import pytest
+
+from server import HISTORY_MOVES
+from wire import DEFAULT_INTERNER, apply_delta
+
+
+def types(frames):
+    return [f["type"] for f in frames]
+
+
+def start_game(connect, game_id="G", size=None):
+    a, b = connect(), connect()
+    options = {"board_size": size, "win_length": 3} if size else {}
+    a.send("PLAYER_JOINED", game_id, dict(player_id="a", **options))
+    b.send("PLAYER_JOINED", game_id, {"player_id": "b"})
+    a.received()
+    return a, b
+
+
+@pytest.mark.parametrize("payload", [
+    {"x": 0, "y": 0},
+    {"player_id": "a", "x": "left", "y": 0},
+    {"player_id": ["a"], "x": 0, "y": 0},
+    {"player_id": "a", "x": 0, "y": 0, "msg_id": ["m"]},
+])
+def test_malformed_move_is_answered_and_connection_stays_usable(connect, payload):
+    a, b = start_game(connect)
+    reply = a.send("MOVE", "G", payload)
+    assert types(reply) == ["ERROR"] and reply[0]["payload"]["code"] == "BAD_REQUEST"
+    assert types(a.send("MOVE", "G", {"player_id": "a", "x": 0, "y": 0})) == ["MOVE_OK", "GAME_DELTA"]
+
+
+def play_moves(a, b, n, size=15):
+    """Fills cells row-major, alternating players; on an odd board with win_length == size nobody wins."""
+    for i in range(n):
+        conn, pid = (a, "a") if i % 2 == 0 else (b, "b")
+        assert "MOVE_OK" in types(conn.send("MOVE", "G", {"player_id": pid, "x": i % size, "y": i // size}))
+    a.received(), b.received()
+
+
+@pytest.fixture
+def long_game(srv, connect):
+    a, b = connect(), connect()
+    a.send("PLAYER_JOINED", "G", {"player_id": "a", "board_size": 15, "win_length": 15})
+    b.send("PLAYER_JOINED", "G", {"player_id": "b"})
+    play_moves(a, b, 70)
+    return a, b
+
+
+def test_resume_at_the_window_edge_gets_every_missed_move(long_game, connect):
+    c = connect()
+    reply = c.send("RESUME", "G", {"player_id": "a", "known_version": 70 - HISTORY_MOVES})
+    assert types(reply) == ["GAME_DELTA"] * HISTORY_MOVES + ["RESUMED"]
+    assert [f["payload"]["version"] for f in reply[:-1]] == list(range(71 - HISTORY_MOVES, 71))
+    assert c.outbox.dropped == 0 and not c.closed
+
+
+def test_resumed_deltas_match_the_ones_broadcast_live(connect):
+    a, b = start_game(connect)
+    seen = a.send("MOVE", "G", {"player_id": "a", "x": 0, "y": 0})
+    b.send("MOVE", "G", {"player_id": "b", "x": 1, "y": 0})
+    seen += a.send("MOVE", "G", {"player_id": "a", "x": 2, "y": 0})
+    live = [f for f in seen if f["type"] == "GAME_DELTA" and f["payload"]["version"] > 1]
+    reply = connect().send("RESUME", "G", {"player_id": "b", "known_version": 1})
+    assert types(reply) == ["GAME_DELTA"] * 2 + ["RESUMED"]
+    assert [f["payload"] for f in reply[:-1]] == [f["payload"] for f in live]
+
+
+def test_resume_ahead_of_the_server_gets_the_full_state(connect):
+    a, b = start_game(connect)
+    a.send("MOVE", "G", {"player_id": "a", "x": 0, "y": 0})
+    reply = connect().send("RESUME", "G", {"player_id": "b", "known_version": 5})
+    assert types(reply) == ["ERROR", "GAME_STATE"] and reply[0]["payload"]["code"] == "VERSION_AHEAD"
+    assert reply[1]["payload"]["version"] == 1
+
+
+def test_resume_past_the_window_gets_a_full_state(long_game, connect):
+    c = connect()
+    reply = c.send("RESUME", "G", {"player_id": "a", "known_version": 69 - HISTORY_MOVES})
+    assert types(reply) == ["GAME_STATE"] and reply[0]["payload"]["version"] == 70
+
+
+def test_resume_falls_back_to_a_full_state_when_deltas_would_not_fit(srv, long_game, connect):
+    c = connect()
+    for _ in range(c.outbox.limit - 8):
+        c.outbox.put({"type": "STATS", "game_id": "G", "payload": {}})
+    srv.dispatch(c, {"type": "RESUME", "game_id": "G", "payload": {"player_id": "a", "known_version": 60}})
+    queued = types(c.received())
+    assert queued[-1] == "GAME_STATE" and "GAME_DELTA" not in queued
+    assert c.outbox.dropped == 0 and not c.closed
+
+
+def test_a_full_outbox_collapses_deltas_into_one_state(srv, connect):
+    a, b = connect(), connect()
+    a.send("PLAYER_JOINED", "G", {"player_id": "a", "board_size": 15, "win_length": 15})
+    b.send("PLAYER_JOINED", "G", {"player_id": "b"})
+    for i in range(0, 70, 2):
+        # a never reads: its own MOVE_OKs and every delta pile up in its outbox
+        srv.dispatch(a, {"type": "MOVE", "game_id": "G", "payload": {"player_id": "a", "x": i % 15, "y": i // 15}})
+        b.send("MOVE", "G", {"player_id": "b", "x": (i + 1) % 15, "y": (i + 1) // 15})
+    assert not a.closed and a.outbox.coalesced
+    state = None
+    for f in a.received():
+        if f["type"] == "GAME_STATE":
+            state = f["payload"]
+        elif f["type"] == "GAME_DELTA":
+            state = apply_delta(state, f["payload"])
+            assert state is not None, "a delta arrived without the state it builds on"
+    assert state["version"] == 70
+
+
+def test_retiring_a_finished_game_releases_its_interned_ids(srv, connect):
+    a, b = start_game(connect)
+    for i, (conn, pid) in enumerate([(a, "a"), (b, "b")] * 2 + [(a, "a")]):
+        conn.send("MOVE", "G", {"player_id": pid, "x": i // 2, "y": i % 2})
+    game = srv.games["G"]
+    assert game.gs.status == "GAME_OVER"
+    for s in ("G", "a", "b"):
+        DEFAULT_INTERNER.ref(s)
+    interned = len(DEFAULT_INTERNER)
+    srv._submit(game, srv._retire, game)
+    assert "G" not in srv.games and "G" in srv.archive
+    report = srv.memory_report()
+    assert report["interned_ids"] == interned - 3 and report["interner_bytes"] > 0
+
+
+def test_memory_gauges_share_one_report(srv, connect, monkeypatch):
+    start_game(connect)
+    calls = []
+    report = srv.memory_report
+    monkeypatch.setattr(srv, "memory_report", lambda: calls.append(1) or report())
+    first = srv.metrics.snapshot()
+    srv.metrics.snapshot(), srv.metrics.render_text()
+    assert len(calls) == 1 and first["memory_game_bytes"] > 0
+
+
+def test_a_worker_refuses_games_it_does_not_own(srv, connect):
+    srv.owns_game_id = lambda game_id: game_id == "G"
+    a, b = start_game(connect)
+    for mtype, payload in (("PLAYER_JOINED", {"player_id": "a"}), ("RESUME", {"player_id": "a"}),
+                           ("SPECTATE", {}), ("MOVE", {"player_id": "a", "x": 0, "y": 0})):
+        reply = a.send(mtype, "H", payload)
+        assert types(reply) == ["ERROR"] and reply[0]["payload"]["code"] == "WRONG_SHARD"
+    assert "H" not in srv.games and not a.closed
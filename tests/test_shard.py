@@ -0,0 +1,99 @@
+# tests/test_shard.py
+import socket, struct
+
+import pytest
+
+from shard import Supervisor, shard_for
+from wire import envelope, encode_frame, Codec
+
+
+@pytest.fixture
+def supervisor():
+    """A Supervisor without worker processes; ``worker_ends[i]`` reads what was routed to worker i."""
+    sup = Supervisor(workers=2)
+    sup.worker_ends = []
+    for _ in range(sup.workers):
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        sup.channels.append(parent)
+        sup.worker_ends.append(child)
+    yield sup
+    for s in sup.channels + sup.worker_ends:
+        s.close()
+
+
+@pytest.mark.parametrize("frame", [
+    b"\x00\x00\x00\x05\xb1\x00\x03\x00\x05",  # binary body cut short
+    b"\x00\x00\x00\x02\xb1\xff",  # unterminated varint
+    b"\x00\x00\x00\x03[1]",  # JSON that is not an envelope
+    b"\x00\x00\x00\x02{}",  # no game_id: default room
+    b"\x00\x00\x00\x0f{\"game_id\": 12}",  # game_id of the wrong type
+])
+def test_malformed_first_frame_only_drops_that_connection(supervisor, frame):
+    a, b = socket.socketpair()
+    with a, b:
+        assert supervisor._try_route(a, bytearray(frame)) is True
+
+
+def test_routes_by_game_id(supervisor):
+    a, b = socket.socketpair()
+    with a, b:
+        frame = encode_frame(envelope("PLAYER_JOINED", "G-7", {"player_id": "p"}), Codec(binary=True))
+        assert supervisor._try_route(a, bytearray(frame)) is True
+        worker = supervisor.worker_ends[shard_for("G-7", 2)]
+        data, fds, _, _ = socket.recv_fds(worker, 4096, 1)
+        assert data == frame and len(fds) == 1
+        socket.socket(fileno=fds[0]).close()
+
+
+def test_incomplete_frame_waits_for_more(supervisor):
+    a, b = socket.socketpair()
+    with a, b:
+        assert supervisor._try_route(a, bytearray(struct.pack("!I", 10) + b"{")) is False
+
+
+def queue_frame(player_id, **options):
+    return bytearray(encode_frame(envelope("QUEUE", None, dict(player_id=player_id, **options)), Codec()))
+
+
+def test_queued_pairs_go_to_the_workers_in_turn(supervisor):
+    socks = [socket.socketpair() for _ in range(4)]
+    try:
+        for n, worker in enumerate((0, 1)):
+            first, second = socks[2 * n][0], socks[2 * n + 1][0]
+            assert supervisor._try_route(first, queue_frame(f"p{2 * n}")) is False
+            assert supervisor._try_route(second, queue_frame(f"p{2 * n + 1}")) is True
+            assert first.fileno() == -1 and not supervisor.queued  # the waiter was handed over too
+            for _ in range(2):
+                data, fds, _, _ = socket.recv_fds(supervisor.worker_ends[worker], 4096, 1)
+                assert b"QUEUE" in data and len(fds) == 1
+                socket.socket(fileno=fds[0]).close()
+    finally:
+        for a, b in socks:
+            a.close(), b.close()
+
+
+def test_queue_buckets_and_hang_ups(supervisor):
+    a, b, c = socket.socketpair(), socket.socketpair(), socket.socketpair()
+    with a[0], a[1], b[0], b[1], c[0], c[1]:
+        assert supervisor._try_route(a[0], queue_frame("a", board_size=5, win_length=4)) is False
+        assert supervisor._try_route(b[0], queue_frame("b")) is False  # another bucket
+        supervisor._release(a[0])
+        assert supervisor._try_route(c[0], queue_frame("c", board_size=5, win_length=4)) is False
+        assert len(supervisor.lobby) == 2 and supervisor.lobby.cancelled == 1
+
+
+def test_a_queued_connection_drops_its_pings(supervisor):
+    a, b = socket.socketpair()
+    with a, b:
+        queue = bytes(queue_frame("a"))
+        assert supervisor._try_route(a, bytearray(queue)) is False
+        buf = supervisor.queued[a]
+        binary = Codec(binary=True)
+        binary.encode(envelope("PING", None, {}))  # later PINGs need no definitions
+        move = encode_frame(envelope("MOVE", None, {"player_id": "a", "x": 0, "y": 0}))
+        for _ in range(1000):
+            buf += encode_frame(envelope("PING", None, {})) + binary.encode(envelope("PING", None, {}))
+            supervisor._drop_pings(buf)
+        buf += move + encode_frame(envelope("PING", None, {}))[:5]  # a PING still arriving stays
+        supervisor._drop_pings(buf)
+        assert bytes(buf) == queue + move + encode_frame(envelope("PING", None, {}))[:5]
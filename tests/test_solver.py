@@ -0,0 +1,82 @@
+# tests/test_solver.py
+import pytest
+
+from server import GameState
+from solver import PERMS, INVERSE, PERM_BITS, get_solver
+
+
+def new_game(bot_first):
+    gs = GameState(3, 3)
+    if bot_first:
+        assert gs.add_bot("BOT-1") == (True, None)
+        gs.try_join("human")
+    else:
+        gs.try_join("human")
+        assert gs.add_bot("BOT-1") == (True, None)
+    return gs
+
+
+def replay(bot_first, moves):
+    gs = new_game(bot_first)
+    outcome = None
+    for x, y in moves:
+        outcome = gs.apply_move(gs.next_player_id, x, y)
+    return gs, outcome
+
+
+def outcomes(bot_first, moves=()):
+    """Every result the human can reach against the bot, trying each legal reply in turn."""
+    gs, outcome = replay(bot_first, moves)
+    if gs.status == "GAME_OVER":
+        return {outcome["result"]}
+    move = gs.bot_move()
+    if move is not None:
+        return outcomes(bot_first, moves + (move,))
+    results = set()
+    for cell in range(9):
+        if not (gs.x_bits | gs.o_bits) >> cell & 1:
+            results |= outcomes(bot_first, moves + ((cell % 3, cell // 3),))
+    return results
+
+
+@pytest.mark.parametrize("bot_first, human_win", [(True, "O_WIN"), (False, "X_WIN")])
+def test_the_bot_never_loses(bot_first, human_win):
+    results = outcomes(bot_first)
+    assert human_win not in results and "DRAW" in results
+
+
+@pytest.mark.parametrize("x_bits, o_bits", [
+    (0b000000111, 0b000011000),  # X completed the top row
+    (0b000001011, 0b100100100),  # O completed the right column
+    (0b110001101, 0b001110010),  # full board, no line
+])
+def test_best_move_is_none_on_finished_positions(x_bits, o_bits):
+    assert get_solver().best_move(x_bits, o_bits) is None
+
+
+def test_bot_waits_for_its_turn_and_sits_only_in_3x3_games():
+    gs = new_game(bot_first=False)
+    assert gs.bot_move() is None  # the human (X) moves first
+    gs.apply_move("human", 1, 1)
+    assert gs.bot_move() is not None
+    big = GameState(5, 4)
+    assert big.add_bot("BOT-1")[1][0] == "BOT_UNAVAILABLE"
+
+
+def test_symmetries_round_trip():
+    identity = tuple(range(9))
+    assert len(set(PERMS)) == 8 and identity in PERMS
+    for perm, inverse, bits in zip(PERMS, INVERSE, PERM_BITS):
+        assert tuple(inverse[perm[i]] for i in range(9)) == identity
+        back = PERM_BITS[PERMS.index(inverse)]
+        assert all(back[bits[mask]] == mask for mask in range(512))
+
+
+def test_symmetric_positions_share_a_canonical_key():
+    solver = get_solver()
+    x_bits, o_bits = 0b000000011, 0b000010000
+    keys = {solver.canonical(bits[x_bits], bits[o_bits])[0] for bits in PERM_BITS}
+    assert len(keys) == 1
+    for bits in PERM_BITS:
+        x, y = solver.best_move(bits[x_bits], bits[o_bits])
+        assert not (bits[x_bits] | bits[o_bits]) >> (y * 3 + x) & 1  # the mapped move is a free cell
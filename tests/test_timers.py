@@ -0,0 +1,129 @@
+# tests/test_timers.py
+import pytest
+
+from server import Server, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, GRACE_PERIOD, SLOW_CONSUMER_GRACE
+from timers import DeadlineScheduler
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def srv(clock):
+    return Server(clock=clock)
+
+
+def advance(srv, clock, seconds, pinging=()):
+    """Moves the clock in heartbeat-sized steps, running due timers; ``pinging`` conns PING at each step."""
+    end = clock.now + seconds
+    while clock.now < end:
+        clock.now = min(end, clock.now + HEARTBEAT_INTERVAL)
+        for conn in pinging:
+            conn.send("PING", None, {})
+        srv.timers.run_due()
+
+
+def start_game(connect):
+    a, b = connect(), connect()
+    a.send("PLAYER_JOINED", "G", {"player_id": "a"})
+    b.send("PLAYER_JOINED", "G", {"player_id": "b"})
+    a.received()
+    return a, b
+
+
+def test_scheduler_runs_due_timers_in_deadline_order(clock):
+    timers, fired = DeadlineScheduler(clock), []
+    timers.call_later(5, fired.append, "late")
+    timers.call_at(clock.now + 1, fired.append, "first")
+    timers.call_at(clock.now + 1, fired.append, "second")  # ties fire in arming order
+    assert timers.run_due() == 1 and fired == []
+    clock.now += 1
+    assert timers.run_due() == 4 and fired == ["first", "second"]
+    clock.now += 10
+    assert timers.run_due() is None and fired == ["first", "second", "late"] and timers.fired == 3
+
+
+def test_scheduler_survives_a_failing_timer(clock, capsys):
+    timers, fired = DeadlineScheduler(clock), []
+    timers.call_at(clock.now, lambda: 1 / 0)
+    timers.call_at(clock.now, fired.append, "after")
+    timers.run_due()
+    assert fired == ["after"] and "ZeroDivisionError" in capsys.readouterr().err
+
+
+def test_a_silent_player_is_disconnected_after_the_heartbeat_timeout(srv, clock, connect):
+    a, b = start_game(connect)
+    advance(srv, clock, HEARTBEAT_TIMEOUT - 1, pinging=[a])
+    assert not b.closed
+    advance(srv, clock, 1, pinging=[a])
+    game = srv.games["G"]
+    assert b.closed and "b" not in game.peers and "b" in game.last_seen
+    assert not a.closed and game.gs.status == "IN_PROGRESS"
+
+
+def test_pings_keep_a_player_connected(srv, clock, connect):
+    a, b = start_game(connect)
+    advance(srv, clock, 3 * HEARTBEAT_TIMEOUT, pinging=[a, b])
+    assert not a.closed and not b.closed and len(srv.timers) >= 2
+
+
+def test_a_player_gone_past_the_grace_period_forfeits(srv, clock, connect):
+    a, b = start_game(connect)
+    b.disconnect()
+    advance(srv, clock, GRACE_PERIOD - HEARTBEAT_INTERVAL, pinging=[a])
+    assert srv.games["G"].gs.status == "IN_PROGRESS"
+    advance(srv, clock, HEARTBEAT_INTERVAL, pinging=[a])
+    over = [f for f in a.received() if f["type"] == "GAME_OVER"]
+    assert len(over) == 1 and over[0]["payload"]["result"] == "X_WIN" and over[0]["payload"]["reason"] == "FORFEIT"
+    assert "b" not in srv.games["G"].last_seen
+
+
+def test_a_resume_within_the_grace_period_keeps_the_seat(srv, clock, connect):
+    a, b = start_game(connect)
+    b.disconnect()
+    advance(srv, clock, GRACE_PERIOD - HEARTBEAT_INTERVAL, pinging=[a])
+    c = connect()
+    assert [f["type"] for f in c.send("RESUME", "G", {"player_id": "b"})] == ["GAME_STATE"]
+    advance(srv, clock, GRACE_PERIOD, pinging=[a, c])
+    game = srv.games["G"]
+    assert game.gs.status == "IN_PROGRESS" and game.peers["b"] is c and not c.closed
+
+
+def test_an_abandoned_waiting_game_is_retired(srv, clock, connect):
+    a = connect()
+    a.send("PLAYER_JOINED", "G", {"player_id": "a"})
+    a.disconnect()
+    advance(srv, clock, GRACE_PERIOD - HEARTBEAT_INTERVAL)
+    assert "G" in srv.games
+    advance(srv, clock, HEARTBEAT_INTERVAL)
+    assert "G" not in srv.games and "G" in srv.archive
+
+
+def test_a_consumer_without_progress_is_disconnected(srv, clock, connect):
+    a, b = start_game(connect)
+    b.send("MOVE", "G", {"player_id": "b", "x": 0, "y": 0})  # not b's turn: only queues to b
+    a.send("MOVE", "G", {"player_id": "a", "x": 0, "y": 0})  # queues a delta to b, which never reads it
+    assert b.outbox.pending_since == clock.now
+    advance(srv, clock, SLOW_CONSUMER_GRACE - 1, pinging=[a])
+    assert not b.closed
+    advance(srv, clock, 1, pinging=[a])
+    assert b.closed and b.outbox.closed and not a.closed
+
+
+def test_a_reading_consumer_is_kept(srv, clock, connect):
+    a, b = start_game(connect)
+    for _ in range(3):
+        a.send("PING", None, {})
+        b.send("PING", None, {})  # reading the PONG is progress
+        advance(srv, clock, SLOW_CONSUMER_GRACE - 1)
+    assert not a.closed and not b.closed
@@ -0,0 +1,198 @@
+# tests/test_wire.py
+import random, struct
+
+import pytest
+
+from wire import (envelope, encode_frame, decode_payload, Codec, SharedFrame, Interner, FrameReader,
+                  FrameTooLarge, pack_body, BINARY_VERSION, DEFINED_LIMIT, _put_varint, _put_str)
+
+STATE = {"board": [["X", None, None], [None, "O", None], [None, None, "X"]], "version": 3, "turn": 3,
+         "players": {"alice": {"symbol": "X", "seat": 0}, "bob": {"symbol": "O", "seat": 1}},
+         "next_player_id": "bob", "status": "IN_PROGRESS"}
+ENVELOPES = [
+    envelope("MOVE", "G-1", {"player_id": "alice", "x": 2, "y": 0, "turn": 4, "msg_id": envelope("", "", {})["id"]}),
+    envelope("GAME_STATE", "G-1", STATE),
+    envelope("GAME_OVER", "G-1", {"result": "X_WIN", "winning_line": [[0, 0], [1, 1], [2, 2]], "final_state": STATE}),
+    envelope("ERROR", "G-1", {"code": "NOT_YOUR_TURN", "message": "Expected bob."}),
+    envelope("PING", "G-1", {}),
+    envelope("MOVE_OK", "G-1", {"version": 5}),
+    envelope("GAME_DELTA", "G-1", {"last_move": {"player_id": "bob", "x": 1, "y": 2, "symbol": "O"}, "version": 6,
+                                   "turn": 6, "next_player_id": "alice", "status": "IN_PROGRESS"}),
+    envelope("CUSTOM", "other", {"unknown_key": [1.5, -7, True, False, None, "é"]}),
+]
+
+
+def body(frame):
+    (length,) = struct.unpack_from("!I", frame)
+    assert len(frame) == 4 + length
+    return frame[4:]
+
+
+@pytest.mark.parametrize("env", ENVELOPES, ids=lambda env: env["type"])
+@pytest.mark.parametrize("binary", [False, True])
+def test_round_trip(env, binary):
+    out, into = Codec(binary=binary), Codec()
+    for _ in range(2):  # the second frame relies on refs defined by the first
+        got = decode_payload(body(encode_frame(env, out)), into)
+        assert got == (dict(env, version=BINARY_VERSION) if binary else env)
+
+
+@pytest.mark.parametrize("env, fast", [
+    (ENVELOPES[0], True),
+    (envelope("MOVE", None, {"player_id": "a", "x": 0, "y": 1, "msg_id": "m-1"}), True),  # no turn
+    (envelope("PONG", "G-1", {}), True),
+    (dict(ENVELOPES[6], payload=dict(ENVELOPES[6]["payload"], next_player_id=None)), True),
+    (envelope("MOVE", "G-1", {"player_id": "a", "x": True, "y": 1, "msg_id": "m-1"}), False),
+    (envelope("MOVE", "G-1", {"player_id": "a", "x": 1 << 20, "y": 1, "msg_id": "m-1"}), False),
+    (envelope("MOVE", "G-1", {"player_id": "a", "x": 0, "y": 1, "msg_id": "m-1", "turn": None}), False),
+    (envelope("MOVE_OK", "G-1", {"version": 5, "msg_id": "m-1"}), False),
+    (envelope("PING", "G-1", {}, msg_id="not-a-uuid"), False),
+    (envelope("PING", "G-1", {}, msg_id=ENVELOPES[0]["id"].upper()), False),
+])
+def test_per_move_messages_use_fixed_layouts(env, fast):
+    data = body(encode_frame(env, Codec(binary=True)))
+    got = Codec().decode(data)
+    assert got == dict(env, version=BINARY_VERSION, game_id=env["game_id"] or "")
+    assert bool(pack_body(env, Interner())[0][0] & 0x80) is fast
+
+
+def test_json_is_the_default_and_binary_is_opt_in():
+    codec = Codec()
+    assert not codec.negotiate(envelope("PLAYER_JOINED", "G-1", {})["version"])
+    assert codec.negotiate(BINARY_VERSION)
+    # a peer already talking binary stays on it when its frames are negotiated again
+    msg = Codec().decode(body(encode_frame(envelope("RESUME", "G-1", {}), Codec(binary=True))))
+    assert codec.negotiate(msg["version"])
+
+
+def test_refs_are_defined_once_per_peer():
+    env = SharedFrame(envelope("GAME_STATE", "G-1", STATE))
+    a, b = Codec(binary=True), Codec(binary=True)
+    first, again, other = a.encode(env), a.encode(env), b.encode(env)
+    assert len(again) < len(first) and other == first
+    into, expected = Codec(), dict(env, version=BINARY_VERSION)
+    assert decode_payload(body(first), into) == expected and decode_payload(body(again), into) == expected
+    with pytest.raises(ValueError):  # a peer that never saw the definitions
+        decode_payload(body(again), Codec())
+
+
+def test_interned_ids_and_peer_definitions_stay_bounded():
+    interner = Interner(generation=100)
+    out, into = Codec(binary=True, interner=interner), Codec()
+    for i in range(10_000):
+        env = envelope("ERROR", f"G-{i}", {"code": "UNKNOWN_GAME", "message": ""})
+        assert decode_payload(body(out.encode(env)), into)["game_id"] == f"G-{i}"
+        # an id still in use keeps working across generations and definition resets
+        assert decode_payload(body(out.encode(envelope("PING", "G-live", {}))), into)["game_id"] == "G-live"
+    assert len(interner) <= 200 and len(out._defined) <= DEFINED_LIMIT
+    assert len(into._table) <= DEFINED_LIMIT
+
+
+def definitions_frame(first, n):
+    """A PING whose prefix defines ``n`` refs: the PING's own room ref 0, then long strings from ``first``."""
+    out = Codec(binary=True, interner=Interner())
+    out.encode(envelope("PING", None, {}))
+    ping = body(out.encode(envelope("PING", None, {})))[2:]  # no definitions: ref 0 is already defined
+    frame = bytearray(b"\xb1")
+    _put_varint(frame, n)
+    _put_varint(frame, 0)
+    _put_str(frame, "")
+    for r in range(first + 1, first + n):
+        _put_varint(frame, r)
+        _put_str(frame, "p" * 900)
+    return bytes(frame) + ping
+
+
+def test_a_peer_cannot_grow_the_definition_table():
+    into = Codec()
+    with pytest.raises(ValueError):
+        into.decode(definitions_frame(0, DEFINED_LIMIT + 1))
+    for i in range(50):
+        assert into.decode(definitions_frame(i * DEFINED_LIMIT, DEFINED_LIMIT))["type"] == "PING"
+        assert len(into._table) <= DEFINED_LIMIT
+
+
+def test_discarded_ids_get_a_new_ref():
+    interner = Interner()
+    first = interner.ref("G-1")
+    interner.discard("G-1")
+    assert len(interner) == 0 and interner.ref("G-1") != first
+
+
+def test_binary_frame_needs_a_codec():
+    with pytest.raises(ValueError):
+        decode_payload(body(encode_frame(ENVELOPES[0], Codec(binary=True))))
+
+
+@pytest.mark.parametrize("env", ENVELOPES, ids=lambda env: env["type"])
+def test_truncated_binary_frames_raise_value_error(env):
+    data = body(encode_frame(env, Codec(binary=True)))
+    for n in range(1, len(data)):
+        with pytest.raises(ValueError):
+            Codec().decode(data[:n])
+
+
+def test_garbage_raises_value_error():
+    rng = random.Random(7)
+    for _ in range(2000):
+        data = b"\xb1" + bytes(rng.randrange(256) for _ in range(rng.randrange(1, 40)))
+        try:
+            Codec().decode(data)
+        except ValueError:
+            pass
+
+
+@pytest.mark.parametrize("data", [
+    b"\xb1\x00\x03\x00\x05",  # body cut short
+    b"\xb1\x00\x03\x00\x05\x00\x00",  # game_id ref 5 never defined
+    b"\xb1\x00\x7f\x00\x00\x00\x00",  # message type code past the table
+    b"\xb1\x00\x01" + b"\xff" * 12,  # endless varint
+    b"\xb1\x00\x01\x00\x00\x00" + b"\x05\x01" * 5000,  # nested lists deeper than the stack
+    b"\xb1\x00\x01\x00\x00\x00\x00\x00",  # trailing byte
+    b"\xb1\x00\x01\x00\x00\x00\x00\x03",  # payload that is not a dict
+])
+def test_malformed_binary_frames(data):
+    with pytest.raises(ValueError):
+        Codec().decode(data)
+
+
+@pytest.mark.parametrize("text", [b"[1]", b'"x"', b'{"type": 1}', b'{"type": "MOVE", "payload": []}',
+                                  b'{"type": "MOVE", "game_id": ["G"]}', b"{", b"\xff"])
+def test_malformed_json_frames(text):
+    with pytest.raises(ValueError):
+        decode_payload(text)
+
+
+class ChunkedSocket:
+    """Hands out ``data`` ``chunk`` bytes per recv_into, then EOF."""
+
+    def __init__(self, data, chunk):
+        self.data, self.chunk = data, chunk
+
+    def recv_into(self, view):
+        n = min(len(view), self.chunk, len(self.data))
+        view[:n], self.data = self.data[:n], self.data[n:]
+        return n
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 4096])
+def test_frame_reader_reassembles_split_and_coalesced_frames(chunk):
+    envs = ENVELOPES * 3
+    data = b"".join(encode_frame(env) for env in envs)
+    got = list(FrameReader(ChunkedSocket(data, chunk), bufsize=16))
+    assert [m["type"] for m in got] == [e["type"] for e in envs]
+
+
+def test_frame_reader_grows_for_a_frame_larger_than_its_buffer():
+    big = envelope("STATS", "G", {"blob": "x" * 200_000})
+    data = encode_frame(big) + encode_frame(ENVELOPES[0])
+    reader = FrameReader(ChunkedSocket(data, 65536), bufsize=1024, initial=data[:10])
+    reader.sock.data = data[10:]
+    got = list(reader)
+    assert got[0]["payload"] == big["payload"] and got[1]["type"] == ENVELOPES[0]["type"]
+
+
+def test_frame_reader_refuses_frames_over_its_limit():
+    data = struct.pack("!I", 2048) + b"{" * 2048
+    with pytest.raises(FrameTooLarge):
+        list(FrameReader(ChunkedSocket(data, 4096), max_frame=1024))
@@ -0,0 +1,66 @@
+# timers.py
+"""
+Deadline scheduler for liveness checks (heartbeat expiry, the disconnect
+grace period, slow consumers, periodic sweeps).
+
+Timers live in a min-heap, so each tick pops only what is due: O(expired
+log n) work instead of scanning every session.  Timers are never cancelled
+eagerly; activity such as a PING only updates a timestamp, and the callback
+re-checks the real deadline when it fires and re-arms itself if it moved.
+"""
+
+import heapq, itertools, threading, time, traceback
+
+
+class DeadlineScheduler:
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._heap = []  # (deadline, seq, fn, args)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        # called when a new earliest deadline is armed (the asyncio engine hooks its wakeup here)
+        self.on_wake = None
+        self.fired = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def call_at(self, when, fn, *args):
+        with self._cond:
+            entry = (when, next(self._seq), fn, args)
+            heapq.heappush(self._heap, entry)
+            earliest = self._heap[0] is entry
+            if earliest:
+                self._cond.notify()
+        if earliest and self.on_wake:
+            self.on_wake()
+
+    def call_later(self, delay, fn, *args):
+        self.call_at(self.clock() + delay, fn, *args)
+
+    def run_due(self):
+        """Runs every timer whose deadline has passed; returns seconds until the next one (or None)."""
+        now = self.clock()
+        due = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+        for _, _, fn, args in due:
+            try:
+                fn(*args)
+            except Exception:
+                traceback.print_exc()
+        self.fired += len(due)
+        with self._cond:
+            return max(0.0, self._heap[0][0] - self.clock()) if self._heap else None
+
+    def run_forever(self):
+        while True:
+            self.run_due()
+            with self._cond:
+                if not self._heap:
+                    self._cond.wait()
+                else:
+                    delay = self._heap[0][0] - self.clock()
+                    if delay > 0:
+                        self._cond.wait(delay)
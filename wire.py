@@ -1,6 +1,24 @@
-import json, struct, time, uuid
+import asyncio, json, struct, threading, time, uuid
 
-PROTOCOL_VERSION = '1.0'
+# JSON ('1.0') is the default.  A peer opts into the compact binary codec by sending '2.0' on
+# join: its frames are smaller, and the messages of every move (PING, MOVE, MOVE_OK, GAME_DELTA)
+# are single struct calls that also beat the C json module on CPU.  Full states still go through
+# the pure-Python tagged encoding and cost more than JSON (see bench.py); they are rarer, and a
+# SharedFrame packs each one once for all its recipients.
+JSON_VERSION = '1.0'
+BINARY_VERSION = '2.0'
+PROTOCOL_VERSION = JSON_VERSION
+BINARY_VERSIONS = (BINARY_VERSION,)
+# Largest frame body we accept; a bogus length header must not make us allocate gigabytes
+MAX_FRAME_SIZE = 1 << 20
+
+
+# buffers per sendmsg call; Linux and macOS cap an iovec at 1024 entries
+IOV_MAX = 1024
+
+
+class FrameTooLarge(ValueError):
+    pass
 
 def now_ms():
     return int(time.time() * 1000)
@@ -8,31 +26,212 @@ def now_ms():
 def new_id():
     return str(uuid.uuid4())
 
-def send_obj(sock, obj: dict):
+def encode_frame(obj: dict, codec=None):
+    if codec is not None:
+        return codec.encode(obj)
+    if isinstance(obj, SharedFrame):
+        return obj.json_frame()
     data = json.dumps(obj).encode('utf-8')
     hdr = struct.pack("!I", len(data))
-    sock.sendall(hdr + data)
+    return hdr + data
+
+def decode_payload(payload, codec=None):
+    """Decodes one frame body; anything that is not a well-formed envelope raises ValueError."""
+    if payload[:1] == BIN_MAGIC:
+        if codec is None:
+            raise ValueError("binary frame on a JSON-only connection")
+        return codec.decode(payload)
+    msg = json.loads(str(payload, "utf-8"))
+    if not (isinstance(msg, dict) and isinstance(msg.get("type"), str)
+            and isinstance(msg.get("game_id") or "", str) and isinstance(msg.get("payload", {}), dict)):
+        raise ValueError("frame is not an envelope")
+    return msg
 
-def recv_obj(sock):
-    # Read 4 bytes length
+def frame_parts(obj: dict, codec=None):
+    """Like ``encode_frame`` but as buffers to be written back to back, never concatenated."""
+    if codec is not None:
+        return codec.encode_parts(obj)
+    if isinstance(obj, SharedFrame):
+        return [obj.json_frame()]
+    data = json.dumps(obj).encode('utf-8')
+    return [struct.pack("!I", len(data)), data]
+
+def send_obj(sock, obj: dict, codec=None):
+    send_buffers(sock, frame_parts(obj, codec))
+
+def send_frames(sock, objs, codec=None):
+    """Writes several frames with one scatter-gather write (more only on partial sends)."""
+    parts = []
+    for obj in objs:
+        parts += frame_parts(obj, codec)
+    send_buffers(sock, parts)
+
+def send_buffers(sock, parts):
+    if not hasattr(sock, "sendmsg"):  # Windows
+        sock.sendall(b"".join(parts))
+        return
+    views = [memoryview(p) for p in parts]
+    i = 0
+    while i < len(views):
+        sent = sock.sendmsg(views[i:i + IOV_MAX])
+        # skip what went out; a partially sent buffer is resumed from its tail
+        while i < len(views) and sent >= len(views[i]):
+            sent -= len(views[i])
+            i += 1
+        if sent:
+            views[i] = views[i][sent:]
+
+def recv_obj(sock, codec=None):
+    # Unbuffered single-frame read; long-lived connections should use FrameReader
     hdr = _recvall(sock, 4)
     if not hdr:
         return None
     (length,) = struct.unpack("!I", hdr)
+    _check_length(length)
     payload = _recvall(sock, length)
-    if not payload:
+    if payload is None:
         return None
-    return json.loads(payload.decode("utf-8"))
+    return decode_payload(payload, codec)
 
 def _recvall(sock, n):
-    buf = b""
-    while len(buf) < n:
-        chunk = sock.recv(n - len(buf))
-        if not chunk:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
             return None
-        buf += chunk
+        got += k
     return buf
 
+def _check_length(length, limit=MAX_FRAME_SIZE):
+    if length > limit:
+        raise FrameTooLarge(f"frame of {length} bytes exceeds limit {limit}")
+
+
+class FrameReader:
+    """
+    Buffered per-connection frame reader.
+
+    Each ``recv_into`` fills a reusable bytearray, and every complete frame
+    already in it is decoded straight from a memoryview slice, so several
+    frames arriving in one TCP segment cost one syscall.  Iterating yields
+    decoded messages until the peer closes the connection.
+    """
+
+    def __init__(self, sock, codec=None, bufsize=64 * 1024, max_frame=MAX_FRAME_SIZE, initial=b""):
+        self.sock = sock
+        self.codec = codec
+        self.max_frame = max_frame
+        self._buf = bytearray(max(bufsize, len(initial)))
+        self._view = memoryview(self._buf)
+        self._start = 0  # first unconsumed byte
+        self._end = len(initial)  # end of received data
+        self._buf[:self._end] = initial
+
+    def __iter__(self):
+        while True:
+            for payload in self.frames():
+                yield decode_payload(payload, self.codec)
+            if not self._fill():
+                return
+
+    def frames(self):
+        """Yields the body of every complete frame currently buffered (valid until the next fill)."""
+        while self._end - self._start >= 4:
+            (length,) = struct.unpack_from("!I", self._buf, self._start)
+            _check_length(length, self.max_frame)
+            begin = self._start + 4
+            if self._end - begin < length:
+                break
+            self._start = begin + length
+            yield self._view[begin:self._start]
+        if self._start == self._end:
+            self._start = self._end = 0
+
+    def _fill(self):
+        need = 4
+        if self._end - self._start >= 4:
+            (length,) = struct.unpack_from("!I", self._buf, self._start)
+            need = 4 + length
+        self._reserve(need - (self._end - self._start))
+        n = self.sock.recv_into(self._view[self._end:])
+        self._end += n
+        return n > 0
+
+    def _reserve(self, extra):
+        """Makes room for ``extra`` more bytes after the buffered data."""
+        if len(self._buf) - self._end >= max(extra, 1):
+            return
+        pending = self._end - self._start
+        size = len(self._buf)
+        while size - pending < extra:
+            size *= 2
+        if size != len(self._buf):
+            buf = bytearray(size)
+            buf[:pending] = self._view[self._start:self._end]
+            self._buf, self._view = buf, memoryview(buf)
+        else:
+            self._buf[:pending] = self._buf[self._start:self._end]
+        self._start, self._end = 0, pending
+
+# --- asyncio stream variants ---
+async def async_recv_obj(reader, codec=None):
+    try:
+        hdr = await reader.readexactly(4)
+        (length,) = struct.unpack("!I", hdr)
+        _check_length(length)
+        payload = await reader.readexactly(length)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        return None
+    return decode_payload(payload, codec)
+
+def apply_delta(state, delta):
+    """
+    Applies a GAME_DELTA payload on top of a cached GAME_STATE payload.
+    Returns the new state, ``state`` itself for a stale delta, or None when
+    a version gap means the caller must RESUME for a full state.
+    """
+    if state is None:
+        return None
+    have = state.get("version", 0)
+    if delta["version"] <= have:
+        return state
+    if delta["version"] != have + 1:
+        return None
+    mv = delta["last_move"]
+    board = [row[:] for row in state["board"]]
+    board[mv["y"]][mv["x"]] = mv["symbol"]
+    new = dict(state)
+    new.update(board=board, version=delta["version"], turn=delta["turn"],
+               next_player_id=delta["next_player_id"], status=delta["status"])
+    return new
+
+class SharedFrame(dict):
+    """
+    An envelope sent unchanged to many recipients.  Each codec encodes it at
+    most once and every connection reuses the bytes; treat it as read-only.
+    """
+
+    __slots__ = ("_json", "_bin")
+
+    def __init__(self, env):
+        super().__init__(env)
+        self._json = None
+        self._bin = None  # (interner, body, refs)
+
+    def json_frame(self):
+        if self._json is None:
+            data = json.dumps(self).encode('utf-8')
+            self._json = struct.pack("!I", len(data)) + data
+        return self._json
+
+    def binary_body(self, interner):
+        cached = self._bin
+        if cached is None or cached[0] is not interner:
+            cached = self._bin = (interner,) + pack_body(self, interner)
+        return cached[1], cached[2]
+
 def envelope(msg_type, game_id, payload, msg_id=None):
     return {
         "type": msg_type,
@@ -41,4 +240,482 @@ def envelope(msg_type, game_id, payload, msg_id=None):
         "game_id": game_id,
         "version": PROTOCOL_VERSION,
         "payload": payload,
-    }
\ No newline at end of file
+    }
+
+
+# --- compact binary codec (BINARY_VERSION 2.0, opt-in) ---
+#
+# frame   := MAGIC ndefs (ref len utf8)*ndefs body
+# body    := type ts game_ref id payload
+#          | type|FAST struct   (PING, PONG, MOVE, MOVE_OK, GAME_DELTA in their usual shape)
+# Envelope and payload keys, message types and common string values are sent
+# as small table indexes; game and player ids are interned per process and
+# defined to each peer once, inline, the first time a frame references them.
+# A ref always names the same string (refs are never reused), so forgetting
+# one on either side only costs a new definition, never a misread frame.
+# JSON frames always start with '{', so each frame is self-describing.
+
+BIN_MAGIC = b"\xb1"
+# Append only: codes are table positions
+MSG_TYPES = ("PLAYER_JOINED", "RESUME", "MOVE", "PING", "PONG", "MOVE_OK", "GAME_STATE", "GAME_OVER", "ERROR",
+             "GAME_DELTA", "STATS", "QUEUE", "QUEUED", "MATCHED", "SPECTATE",
+             "RESUMED")
+KEYS = ("player_id", "x", "y", "turn", "msg_id", "board", "players", "next_player_id", "status", "version",
+        "symbol", "seat", "result", "winning_line", "final_state", "code", "message", "known_version", "nickname",
+        "last_move", "board_size", "win_length", "game_id", "opponent", "rating")
+CONSTS = ("X", "O", "WAITING", "IN_PROGRESS", "GAME_OVER", "X_WIN", "O_WIN", "DRAW")
+ID_KEYS = ("player_id", "next_player_id", "opponent", "game_id")
+CELLS = (None, "X", "O")
+INTERN_GENERATION = 16_384  # ids per Interner generation; see Interner
+DEFINED_LIMIT = 1024  # refs a Codec remembers defining to (or learning from) its peer before starting over
+
+# fixed layouts for the per-move messages: one struct call instead of a walk over tagged values
+_FAST = 0x80  # flag on the type code
+_HEAD = struct.Struct("!BQI16s")  # type|_FAST, ts, game_id ref, envelope id (a UUID)
+_MOVE = struct.Struct("!IhhBq")  # player ref, x, y, has turn, turn; msg_id follows as a string
+_MOVE_OK = struct.Struct("!q")  # version
+_DELTA = struct.Struct("!qqIhhBIB")  # version, turn, mover ref, x, y, symbol, next player ref, status
+_NO_REF = 0xFFFFFFFF
+_NO_DEFINITIONS = BIN_MAGIC + b"\x00"
+_FAST_TYPES = ("PING", "PONG", "MOVE", "MOVE_OK", "GAME_DELTA")
+_MOVE_KEYS = ({"player_id", "x", "y", "msg_id"}, {"player_id", "x", "y", "msg_id", "turn"})
+_DELTA_KEYS = {"last_move", "version", "turn", "next_player_id", "status"}
+_LAST_MOVE_KEYS = {"player_id", "x", "y", "symbol"}
+
+_T_NONE, _T_FALSE, _T_TRUE, _T_INT, _T_STR, _T_LIST, _T_DICT, _T_REF, _T_BOARD, _T_FLOAT, _T_CONST, _T_UUID = range(12)
+_TYPE_CODE = {t: i + 1 for i, t in enumerate(MSG_TYPES)}
+_KEY_CODE = {k: i + 1 for i, k in enumerate(KEYS)}
+_CONST_CODE = {c: i for i, c in enumerate(CONSTS)}
+_CELL_CODE = {c: i for i, c in enumerate(CELLS)}
+
+
+class Interner:
+    """
+    Process-wide id string -> small int table used by binary encoders.
+
+    Bounded by keeping two generations: once the young one holds
+    ``generation`` ids it becomes the old one and the previous old one is
+    dropped, so an id not encoded for a whole generation is forgotten and
+    gets a new ref if it comes back.  Ids are also dropped explicitly when
+    their game is retired (``discard``).
+    """
+
+    def __init__(self, generation=INTERN_GENERATION):
+        self.generation = generation
+        self._young = {}
+        self._old = {}
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._young) + len(self._old)
+
+    def ref(self, s):
+        r = self._young.get(s)
+        if r is None:
+            with self._lock:
+                r = self._young.get(s)
+                if r is None:
+                    r = self._old.pop(s, None)
+                    if r is None:
+                        r = self._next
+                        self._next += 1
+                    if len(self._young) >= self.generation:
+                        self._old, self._young = self._young, {}
+                    self._young[s] = r
+        return r
+
+    def discard(self, s):
+        with self._lock:
+            self._young.pop(s, None)
+            self._old.pop(s, None)
+
+
+DEFAULT_INTERNER = Interner()
+
+
+class Codec:
+    """
+    Per-connection wire codec.  Starts as JSON; set ``binary`` once the peer
+    negotiated it (or automatically after the peer sends a binary frame).
+    Outbound and inbound state are independent, so one writer and one
+    reader thread may use the same instance.
+    """
+
+    def __init__(self, binary=False, interner=None):
+        self.binary = binary
+        self.interner = DEFAULT_INTERNER if interner is None else interner
+        self._defined = set()  # refs the peer already knows
+        self._table = {}  # peer's refs -> strings
+
+    def negotiate(self, version):
+        self.binary = version in BINARY_VERSIONS
+        return self.binary
+
+    def encode(self, obj):
+        return b"".join(self.encode_parts(obj))
+
+    def encode_parts(self, obj):
+        """Frame as [header, ...] buffers; a shared frame's body is reused, not copied."""
+        if not self.binary:
+            return frame_parts(obj)
+        if isinstance(obj, SharedFrame):
+            body, refs = obj.binary_body(self.interner)
+        else:
+            body, refs = pack_body(obj, self.interner)
+        defs = self.definitions(refs)
+        return [struct.pack("!I", len(defs) + len(body)), defs, body]
+
+    def definitions(self, refs):
+        """Frame prefix defining any of ``refs`` (ref -> string) this peer hasn't seen yet."""
+        new = refs.keys() - self._defined
+        if not new:
+            return _NO_DEFINITIONS
+        out = bytearray(BIN_MAGIC)
+        _put_varint(out, len(new))
+        for r in sorted(new):
+            _put_varint(out, r)
+            _put_str(out, refs[r])
+        if len(self._defined) + len(new) > DEFINED_LIMIT:
+            self._defined.clear()  # the peer is simply sent these again when next used
+        self._defined |= new
+        return bytes(out)
+
+    def decode(self, payload):
+        self.binary = True
+        view = memoryview(payload)
+        try:
+            ndefs, pos = _get_varint(view, 1)
+            table = self._table
+            if ndefs:
+                if ndefs > DEFINED_LIMIT:
+                    raise ValueError(f"malformed binary frame: {ndefs} definitions")
+                defs = {}
+                for _ in range(ndefs):
+                    r, pos = _get_varint(view, pos)
+                    defs[r], pos = _get_str(view, pos)
+                if len(table) + ndefs > DEFINED_LIMIT:
+                    # mirrors definitions(): past the limit the peer only remembers this frame's definitions
+                    self._table = dict(defs)
+                table.update(defs)
+            msg, pos = unpack_body(view, pos, table)
+        except (IndexError, KeyError, RecursionError, struct.error) as e:
+            # truncated input, an unknown table code or an undefined ref
+            raise ValueError(f"malformed binary frame: {e!r}") from None
+        if pos != len(view) or not isinstance(msg["payload"], dict):
+            raise ValueError("malformed binary frame")
+        return msg
+
+
+def pack_body(obj, interner):
+    """Encodes an envelope body; returns (bytes, {ref: string} of the interned ids used)."""
+    fast = _pack_fast(obj, interner)
+    if fast is not None:
+        return fast
+    out = bytearray()
+    refs = {}
+    mtype = obj.get("type")
+    code = _TYPE_CODE.get(mtype)
+    if code is None:
+        out.append(0)
+        _put_str(out, mtype)
+    else:
+        out.append(code)
+    _put_varint(out, obj.get("ts") or 0)
+    game_id = obj.get("game_id") or ""
+    r = interner.ref(game_id)
+    refs[r] = game_id
+    _put_varint(out, r)
+    _pack_value(out, obj.get("id"), None, interner, refs)
+    _pack_value(out, obj.get("payload", {}), None, interner, refs)
+    return bytes(out), refs
+
+
+def unpack_body(view, pos, table):
+    code = view[pos]
+    if code & _FAST:
+        return _unpack_fast(view, pos, table)
+    pos += 1
+    if code:
+        mtype = MSG_TYPES[code - 1]
+    else:
+        mtype, pos = _get_str(view, pos)
+    ts, pos = _get_varint(view, pos)
+    r, pos = _get_varint(view, pos)
+    msg_id, pos = _unpack_value(view, pos, table)
+    payload, pos = _unpack_value(view, pos, table)
+    return {"type": mtype, "id": msg_id, "ts": ts, "game_id": table[r],
+            "version": BINARY_VERSION, "payload": payload}, pos
+
+
+def _pack_fast(obj, interner):
+    """Fixed-layout body for the messages of every move, or None when ``obj`` doesn't fit one."""
+    mtype, p = obj.get("type"), obj.get("payload")
+    if mtype not in _FAST_TYPES or type(p) is not dict:
+        return None
+    msg_id = _uuid_bytes(obj.get("id"))
+    if msg_id is None:
+        return None
+    refs = {}
+    try:
+        if mtype == "MOVE_OK":
+            if p.keys() != {"version"} or type(p["version"]) is not int:
+                return None
+            tail = _MOVE_OK.pack(p["version"])
+        elif mtype == "MOVE":
+            if p.keys() not in _MOVE_KEYS:
+                return None
+            pid, x, y, turn, mid = p["player_id"], p["x"], p["y"], p.get("turn", 0), p["msg_id"]
+            if not (type(pid) is str and type(x) is int and type(y) is int and type(turn) is int
+                    and type(mid) is str):
+                return None
+            r = interner.ref(pid)
+            refs[r] = pid
+            tail = bytearray(_MOVE.pack(r, x, y, "turn" in p, turn))
+            _put_str(tail, mid)
+        elif mtype == "GAME_DELTA":
+            lm, nxt = p.get("last_move"), p.get("next_player_id")
+            if p.keys() != _DELTA_KEYS or type(lm) is not dict or lm.keys() != _LAST_MOVE_KEYS:
+                return None
+            pid, x, y = lm["player_id"], lm["x"], lm["y"]
+            symbol, status = _CONST_CODE.get(lm["symbol"]), _CONST_CODE.get(p["status"])
+            if not (type(pid) is str and type(x) is int and type(y) is int and type(p["version"]) is int
+                    and type(p["turn"]) is int and (nxt is None or type(nxt) is str)
+                    and symbol is not None and status is not None):
+                return None
+            r = interner.ref(pid)
+            refs[r] = pid
+            n = _NO_REF
+            if nxt is not None:
+                n = interner.ref(nxt)
+                refs[n] = nxt
+            tail = _DELTA.pack(p["version"], p["turn"], r, x, y, symbol, n, status)
+        elif p:  # PING, PONG
+            return None
+        else:
+            tail = b""
+        game_id = obj.get("game_id") or ""
+        g = interner.ref(game_id)
+        refs[g] = game_id
+        head = _HEAD.pack(_TYPE_CODE[mtype] | _FAST, obj.get("ts") or 0, g, msg_id)
+    except struct.error:
+        return None  # a value out of the layout's range
+    return head + tail, refs
+
+
+def _unpack_fast(view, pos, table):
+    code, ts, r, msg_id = _HEAD.unpack_from(view, pos)
+    pos += _HEAD.size
+    mtype = MSG_TYPES[(code & ~_FAST) - 1]
+    if mtype in ("PING", "PONG"):
+        payload = {}
+    elif mtype == "MOVE_OK":
+        payload = {"version": _MOVE_OK.unpack_from(view, pos)[0]}
+        pos += _MOVE_OK.size
+    elif mtype == "MOVE":
+        pid, x, y, has_turn, turn = _MOVE.unpack_from(view, pos)
+        mid, pos = _get_str(view, pos + _MOVE.size)
+        payload = {"player_id": table[pid], "x": x, "y": y, "msg_id": mid}
+        if has_turn:
+            payload["turn"] = turn
+    elif mtype == "GAME_DELTA":
+        version, turn, pid, x, y, symbol, nxt, status = _DELTA.unpack_from(view, pos)
+        pos += _DELTA.size
+        payload = {"last_move": {"player_id": table[pid], "x": x, "y": y, "symbol": CONSTS[symbol]},
+                   "version": version, "turn": turn, "next_player_id": None if nxt == _NO_REF else table[nxt],
+                   "status": CONSTS[status]}
+    else:
+        raise ValueError(f"no fixed layout for {mtype}")
+    return {"type": mtype, "id": _uuid_str(msg_id), "ts": ts, "game_id": table[r],
+            "version": BINARY_VERSION, "payload": payload}, pos
+
+
+def _pack_value(out, v, key, interner, refs):
+    if v is None:
+        out.append(_T_NONE)
+    elif v is True or v is False:
+        out.append(_T_TRUE if v else _T_FALSE)
+    elif isinstance(v, int):
+        out.append(_T_INT)
+        _put_varint(out, v << 1 if v >= 0 else (~v << 1) | 1)  # zigzag
+    elif isinstance(v, float):
+        out.append(_T_FLOAT)
+        out += struct.pack("!d", v)
+    elif isinstance(v, str):
+        if key in ID_KEYS:
+            r = interner.ref(v)
+            refs[r] = v
+            out.append(_T_REF)
+            _put_varint(out, r)
+        elif v in _CONST_CODE:
+            out.append(_T_CONST)
+            out.append(_CONST_CODE[v])
+        else:
+            raw = _uuid_bytes(v)
+            if raw is None:
+                out.append(_T_STR)
+                _put_str(out, v)
+            else:
+                out.append(_T_UUID)
+                out += raw
+    elif isinstance(v, dict):
+        out.append(_T_DICT)
+        _put_varint(out, len(v))
+        for k, item in v.items():
+            code = _KEY_CODE.get(k)
+            if code is None:
+                out.append(0)
+                _put_str(out, k)
+            else:
+                _put_varint(out, code)
+            _pack_value(out, item, k, interner, refs)
+    elif isinstance(v, (list, tuple)):
+        if key == "board" and _is_board(v):
+            _pack_board(out, v)
+            return
+        out.append(_T_LIST)
+        _put_varint(out, len(v))
+        for item in v:
+            _pack_value(out, item, key, interner, refs)
+    else:
+        raise TypeError(f"cannot encode {type(v).__name__}")
+
+
+def _unpack_value(view, pos, table):
+    tag = view[pos]
+    pos += 1
+    if tag == _T_NONE:
+        return None, pos
+    if tag == _T_FALSE:
+        return False, pos
+    if tag == _T_TRUE:
+        return True, pos
+    if tag == _T_INT:
+        z, pos = _get_varint(view, pos)
+        return (z >> 1) ^ -(z & 1), pos
+    if tag == _T_FLOAT:
+        return struct.unpack_from("!d", view, pos)[0], pos + 8
+    if tag == _T_STR:
+        return _get_str(view, pos)
+    if tag == _T_REF:
+        r, pos = _get_varint(view, pos)
+        return table[r], pos
+    if tag == _T_CONST:
+        return CONSTS[view[pos]], pos + 1
+    if tag == _T_UUID:
+        if pos + 16 > len(view):
+            raise IndexError("uuid runs past the end of the frame")
+        return _uuid_str(view[pos:pos + 16]), pos + 16
+    if tag == _T_LIST:
+        n, pos = _get_varint(view, pos)
+        items = []
+        for _ in range(n):
+            item, pos = _unpack_value(view, pos, table)
+            items.append(item)
+        return items, pos
+    if tag == _T_DICT:
+        n, pos = _get_varint(view, pos)
+        d = {}
+        for _ in range(n):
+            code, pos = _get_varint(view, pos)
+            if code:
+                k = KEYS[code - 1]
+            else:
+                k, pos = _get_str(view, pos)
+            d[k], pos = _unpack_value(view, pos, table)
+        return d, pos
+    if tag == _T_BOARD:
+        return _unpack_board(view, pos)
+    raise ValueError(f"bad binary tag {tag}")
+
+
+def _is_board(v):
+    return all(isinstance(row, list) and all(c in _CELL_CODE for c in row) for row in v) and \
+        len({len(row) for row in v}) <= 1
+
+
+def _pack_board(out, rows):
+    # 2 bits per cell, row-major: a 3x3 board is 5 bytes including its dimensions
+    out.append(_T_BOARD)
+    _put_varint(out, len(rows))
+    _put_varint(out, len(rows[0]) if rows else 0)
+    acc = nbits = 0
+    for row in rows:
+        for c in row:
+            acc |= _CELL_CODE[c] << nbits
+            nbits += 2
+            if nbits == 8:
+                out.append(acc)
+                acc = nbits = 0
+    if nbits:
+        out.append(acc)
+
+
+def _unpack_board(view, pos):
+    h, pos = _get_varint(view, pos)
+    w, pos = _get_varint(view, pos)
+    nbytes = (h * w * 2 + 7) // 8
+    if pos + nbytes > len(view) or h > len(view):
+        raise IndexError("board runs past the end of the frame")
+    packed = view[pos:pos + nbytes]
+    rows = []
+    i = 0
+    for _ in range(h):
+        row = []
+        for _ in range(w):
+            row.append(CELLS[(packed[i >> 2] >> ((i & 3) * 2)) & 3])
+            i += 1
+        rows.append(row)
+    return rows, pos + nbytes
+
+
+def _uuid_bytes(s):
+    # only the canonical lowercase form, so that _uuid_str gives back the same string
+    if type(s) is not str or len(s) != 36 or s[8] != "-" or s[13] != "-" or s[18] != "-" or s[23] != "-":
+        return None
+    compact = s.replace("-", "")
+    if len(compact) != 32 or compact != compact.lower():
+        return None
+    try:
+        raw = bytes.fromhex(compact)
+    except ValueError:
+        return None
+    return raw if len(raw) == 16 else None
+
+
+def _uuid_str(raw):
+    h = bytes(raw).hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def _put_varint(out, n):
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _get_varint(view, pos):
+    n = shift = 0
+    while True:
+        b = view[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+        if shift > 63:
+            raise ValueError("varint longer than 64 bits")
+
+
+def _put_str(out, s):
+    data = s.encode("utf-8")
+    _put_varint(out, len(data))
+    out += data
+
+
+def _get_str(view, pos):
+    n, pos = _get_varint(view, pos)
+    if pos + n > len(view):
+        raise IndexError("string runs past the end of the frame")
+    return str(view[pos:pos + n], "utf-8"), pos + n